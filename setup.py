@@ -311,6 +311,8 @@ setup(
             # 'coverage',
         ],
         "webapp": ["Flask", "gevent"],
+        "fast": ["marisa-trie", "numpy"],
+        "arrow": ["pyarrow"],
     },
     entry_points={
         "console_scripts": [
@@ -15,6 +15,7 @@ from thai_segmenter.tasks import line_tokenizer
 from thai_segmenter.tasks import sentence_segment
 from thai_segmenter.tasks import tokenize
 from thai_segmenter.tasks import tokenize_and_postag
+from thai_segmenter.tasks import tokenize_spans
 
 __all__ = [
     "contains_thai",
@@ -22,6 +23,7 @@ __all__ = [
     "get_segmenter",
     "sentence_segment",
     "tokenize",
+    "tokenize_spans",
     "tokenize_and_postag",
     "line_cleaner",
     "line_sentence_segmenter",
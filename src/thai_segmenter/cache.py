@@ -0,0 +1,136 @@
+"""Size-aware (byte bounded) LRU cache for segmentation results."""
+import sys
+import threading
+from collections import OrderedDict
+
+# ----------------------------------------------------------------------------
+
+
+def approx_sizeof(obj, _seen=None):
+    """Approximate memory size (in bytes) of an object and its contents.
+
+    Follows tuples, lists, sets, dicts and objects with ``__slots__``
+    or ``__dict__``. Shared objects are only counted once.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool)) or obj is None:
+        return size
+
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += approx_sizeof(key, _seen) + approx_sizeof(value, _seen)
+    elif isinstance(obj, (tuple, list, set, frozenset)):
+        for item in obj:
+            size += approx_sizeof(item, _seen)
+    else:
+        for name in getattr(type(obj), "__slots__", ()):
+            if hasattr(obj, name):
+                size += approx_sizeof(getattr(obj, name), _seen)
+        if hasattr(obj, "__dict__"):
+            size += approx_sizeof(vars(obj), _seen)
+
+    return size
+
+
+class SizedLRUCache(object):
+    """Thread-safe LRU cache bounded by the approximate size of its
+    entries in bytes (not by the number of entries).
+
+    Values should be immutable since they are shared between all callers.
+    Entries larger than ``max_entry_bytes`` (default: 1/8 of the cache size)
+    are not cached at all, so one huge input cannot evict everything else.
+
+    Usage:
+    >>> cache = SizedLRUCache(max_bytes=1024 * 1024)
+    >>> cache.get_or_compute(("key", False), lambda: ("value",))
+    ('value',)
+    >>> cache.stats()["misses"]
+    1
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entry_bytes=None, sizeof=None):
+        if max_entry_bytes is None:
+            max_entry_bytes = max_bytes // 8
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.sizeof = sizeof if callable(sizeof) else approx_sizeof
+
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+
+        self.hits = self.misses = self.evictions = self.rejected = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(key) + self.sizeof(value)
+        with self._lock:
+            if size > self.max_entry_bytes:
+                self.rejected += 1
+                return False
+
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._data[key] = (value, size)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes and self._data:
+                _, (_, old_size) = self._data.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+            return True
+
+    def get_or_compute(self, key, fun):
+        """Return the cached value for key or compute (without holding the lock),
+        cache and return it."""
+        marker = self  # unique default, values may be None
+        value = self.get(key, marker)
+        if value is marker:
+            value = fun()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Return counters and the hit rate as dict."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "rejected": self.rejected,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -15,29 +15,118 @@ Why does this file exist, and why not put this in __main__?
   Also see (1) from http://click.pocoo.org/5/setuptools/#setuptools-integration
 """
 import argparse
+import functools
 import sys
 
+from thai_segmenter import formats
+from thai_segmenter.cache import SizedLRUCache
+from thai_segmenter.evaluation import compare_boundaries
+from thai_segmenter.formats import BINARY_FORMATS
+from thai_segmenter.formats import RECORD_FORMATS
+from thai_segmenter.formats import write_binary_records
+from thai_segmenter.formats import write_text_records
+from thai_segmenter.longlexto import ENGINES
+from thai_segmenter.model_builder import build_model
+from thai_segmenter.sentence_segmenter import SENTENCE_BREAKS
+from thai_segmenter.shared_model import write_model_image
+from thai_segmenter.tasks import INPUT_FORMATS
+from thai_segmenter.tasks import get_deduplicator
+from thai_segmenter.tasks import get_segmenter
 from thai_segmenter.tasks import line_cleaner
+from thai_segmenter.tasks import line_deduplicator
 from thai_segmenter.tasks import line_sentence_segmenter
+from thai_segmenter.tasks import line_sentence_segmenter_column
 from thai_segmenter.tasks import line_tokenize_and_tagger
 from thai_segmenter.tasks import line_tokenizer
+from thai_segmenter.tasks import tokenize
 
 # ----------------------------------------------------------------------------
 
 
+def task_segmenter(args):
+    """The segmenter of the task, shared with ``--dedup near``."""
+    return get_segmenter(
+        engine=args.engine,
+        smoothing=getattr(args, "smoothing", None),
+        model_file=getattr(args, "model_file", None),
+        split_decoding=getattr(args, "split_decoding", False),
+    )
+
+
+def dedup_lines(args, lines, summary=None, segmenter=None):
+    """Drop duplicate input lines if requested (``--dedup exact/near``),
+    near-duplicates by the tokens of the ``segmenter`` of the task."""
+    if args.dedup not in ("exact", "near"):
+        for line in lines:
+            yield line
+        return
+
+    tokenize_fun = None
+    if segmenter is not None:
+        tokenize_fun = functools.partial(tokenize, segmenter=segmenter)
+    deduplicator = get_deduplicator(
+        near_duplicates=args.dedup == "near",
+        engine=getattr(args, "engine", "longlexto"),
+        capacity=args.dedup_capacity,
+        filename=args.dedup_file,
+        tokenize_fun=tokenize_fun,
+    )
+    try:
+        for line in line_deduplicator(
+            lines,
+            deduplicator,
+            has_headers=getattr(args, "has_source_headers", False),
+            summary=summary,
+        ):
+            yield line
+    finally:
+        deduplicator.close()
+
+
+def dedup_cache(args):
+    """Cache to reuse results of repeated lines (``--dedup reuse``)."""
+    return SizedLRUCache() if args.dedup == "reuse" else None
+
+
+# ------------------------------------
+
+
+def write_records(args, records, label_field):
+    """Write token records in the structured ``--format`` (jsonl, conllu,
+    arrow, parquet)."""
+    if args.output_format in BINARY_FORMATS:
+        args.output.flush()
+        outfile = args.output.buffer
+        write_binary_records(
+            records,
+            outfile,
+            args.output_format,
+            label_field=label_field,
+            rows_per_batch=args.rows_per_batch,
+        )
+        outfile.flush()
+    else:
+        write_text_records(records, args.output, args.output_format)
+
+
+# ------------------------------------
+
+
 def run_clean(args):
     infile, outfile = args.input, args.output
 
     summary = dict() if args.collect_stats else None
 
-    for line in line_cleaner(
+    lines = line_cleaner(
         infile,
         skip_headers=args.has_source_headers,
         filter_blank=args.filter_blank,
         filter_non_thai=args.filter_non_thai,
         norm_whitespaces=args.normalize_whitespaces,
         summary=summary,
-    ):
+    )
+
+    for line in dedup_lines(args, lines, summary=summary):
         outfile.write(line + "\n")
 
     if args.collect_stats:
@@ -48,8 +137,42 @@ def run_sentence_segmentation(args):
     infile, outfile = args.input, args.output
 
     summary = dict() if args.collect_stats else None
-
-    for line in line_sentence_segmenter(infile, summary=summary):
+    segmenter = task_segmenter(args)
+
+    if args.column is not None or args.input_format != "tsv":
+        lines = line_sentence_segmenter_column(
+            dedup_lines(args, infile, summary=summary, segmenter=segmenter),
+            column=args.column,
+            input_format=args.input_format,
+            summary=summary,
+            engine=args.engine,
+            smoothing=args.smoothing,
+            model_file=args.model_file,
+            cache=dedup_cache(args),
+            boundary_only=args.boundary_only,
+            breaks=args.breaks,
+            split_decoding=args.split_decoding,
+            batch_size=args.batch_size,
+            batch_chars=args.batch_chars,
+            segmenter=segmenter,
+        )
+    else:
+        lines = line_sentence_segmenter(
+            dedup_lines(args, infile, summary=summary, segmenter=segmenter),
+            summary=summary,
+            engine=args.engine,
+            smoothing=args.smoothing,
+            model_file=args.model_file,
+            cache=dedup_cache(args),
+            boundary_only=args.boundary_only,
+            breaks=args.breaks,
+            split_decoding=args.split_decoding,
+            batch_size=args.batch_size,
+            batch_chars=args.batch_chars,
+            segmenter=segmenter,
+        )
+
+    for line in lines:
         outfile.write(line + "\n")
 
     if args.collect_stats:
@@ -60,15 +183,27 @@ def run_tokenize(args):
     infile, outfile = args.input, args.output
 
     summary = dict() if args.collect_stats else None
+    segmenter = task_segmenter(args)
 
-    for line in line_tokenizer(
-        infile,
+    use_records = args.output_format in RECORD_FORMATS
+    lines = line_tokenizer(
+        dedup_lines(args, infile, summary=summary, segmenter=segmenter),
         escape_special=args.escape_special,
         tokenize_subwords=args.subwords,
         column=args.column,
+        input_format=args.input_format,
         summary=summary,
-    ):
-        outfile.write(line + "\n")
+        output_format="records" if use_records else args.output_format,
+        engine=args.engine,
+        cache=dedup_cache(args),
+        segmenter=segmenter,
+    )
+
+    if use_records:
+        write_records(args, lines, "types")
+    else:
+        for line in lines:
+            outfile.write(line + "\n")
 
     if args.collect_stats:
         print(summary, file=sys.stderr)
@@ -78,17 +213,149 @@ def run_tokenize_postag(args):
     infile, outfile = args.input, args.output
 
     summary = dict() if args.collect_stats else None
+    segmenter = task_segmenter(args)
 
-    for line in line_tokenize_and_tagger(infile, column=args.column, summary=summary):
-        outfile.write(line + "\n")
+    use_records = args.output_format in RECORD_FORMATS
+    lines = line_tokenize_and_tagger(
+        dedup_lines(args, infile, summary=summary, segmenter=segmenter),
+        column=args.column,
+        input_format=args.input_format,
+        summary=summary,
+        engine=args.engine,
+        smoothing=args.smoothing,
+        model_file=args.model_file,
+        cache=dedup_cache(args),
+        output_format="records" if use_records else "text",
+        split_decoding=args.split_decoding,
+        batch_size=args.batch_size,
+        batch_chars=args.batch_chars,
+        segmenter=segmenter,
+    )
+
+    if use_records:
+        write_records(args, lines, "tags")
+    else:
+        for line in lines:
+            outfile.write(line + "\n")
+
+    if args.collect_stats:
+        print(summary, file=sys.stderr)
+
+
+def run_build_model(args):
+    summary = dict() if args.collect_stats else None
+
+    build_model(
+        args.corpus,
+        args.model_file,
+        workers=args.workers,
+        chunk_size=args.chunk_mb * 1024 * 1024,
+        summary=summary,
+    )
 
     if args.collect_stats:
         print(summary, file=sys.stderr)
 
 
+def run_compile_model(args):
+    segmenter = get_segmenter(
+        engine=args.engine, smoothing=args.smoothing, model_file=args.model_file
+    )
+    write_model_image(segmenter, args.image_file)
+
+
+def run_eval_sentseg(args):
+    segmenter = get_segmenter(
+        engine=args.engine, smoothing=args.smoothing, model_file=args.model_file
+    )
+    result = compare_boundaries(args.corpus, segmenter)
+
+    print(
+        "{} paragraphs, {} sentence breaks".format(
+            result["paragraphs"], result["breaks"]
+        )
+    )
+    for name in ("full", "boundary", "spaces"):
+        print(
+            "{:<8}  precision {:.4f}  recall {:.4f}  F1 {:.4f}  same as full {:.2%}".format(
+                name,
+                result[name]["precision"],
+                result[name]["recall"],
+                result[name]["f1"],
+                result[name]["same"],
+            )
+        )
+
+
 # ----------------------------------------------------------------------------
 
 
+def parse_column(value, input_format="tsv"):
+    """Parse a column argument (``"2"``, ``"1,3"`` or field names) into a
+    0-based column index, a list of them or field names (csv/jsonl)."""
+    columns = list()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if part.isdigit() and input_format != "jsonl":
+            if int(part) < 1:
+                raise ValueError(
+                    "Column must be at least 1 or larger. (Counting starts at 1): value = {}".format(
+                        part
+                    )
+                )
+            columns.append(int(part) - 1)
+        elif input_format in ("csv", "jsonl"):
+            columns.append(part)
+        else:
+            raise ValueError(
+                "Column must be a number for tsv input: value = {}".format(part)
+            )
+
+    if not columns:
+        raise ValueError("No column given: value = {}".format(value))
+    return columns[0] if len(columns) == 1 else columns
+
+
+def add_split_decoding_argument(group):
+    group.add_argument(
+        "--split-decoding",
+        action="store_true",
+        dest="split_decoding",
+        help="Decode bigrams piece by piece between words with a single possible tag "
+        "and memoize the pieces, faster for mixed Thai/English text. Paths with the "
+        "same probability may be chosen differently than by the full decoding.",
+    )
+
+
+def add_batch_arguments(group):
+    group.add_argument(
+        "--batch-size",
+        type=int,
+        default=None,
+        help="POS tag the lines in batches of this size (e. g. 1000), decoded together "
+        "with numpy (much faster for many short lines). Default: line by line.",
+    )
+    group.add_argument(
+        "--batch-chars",
+        type=int,
+        default=None,
+        help="Maximum size of a batch (in characters of text, e. g. 1000000), limits the "
+        "memory for the lines read ahead (with or without --batch-size). Default: no limit.",
+    )
+
+
+def add_record_batch_argument(group):
+    group.add_argument(
+        "--rows-per-batch",
+        type=int,
+        default=10000,
+        metavar="N",
+        help="Rows per record batch (row group) for arrow/parquet output. Default: 10000.",
+    )
+
+
 def build_parser():
     # - shared arguments
     shared_inout_parser = argparse.ArgumentParser(add_help=False)
@@ -124,10 +391,66 @@ def build_parser():
         "-f",
         "--column",
         "--field",
-        type=int,
         dest="column",
         default=None,
-        help="If supplied, then only do task on nth column of tab separated file. (1 == first column)",
+        help="If supplied, then only do task on nth column of tab separated file. (1 == first column) "
+        "Multiple columns separated by comma (e. g. 1,3), field names for csv/jsonl input.",
+    )
+    group.add_argument(
+        "--input-format",
+        choices=INPUT_FORMATS,
+        default="tsv",
+        help="Input format: tab separated (tsv, default), csv with header row or json lines (jsonl).",
+    )
+
+    shared_dedup_parser = argparse.ArgumentParser(add_help=False)
+    group = shared_dedup_parser.add_argument_group("Deduplication")
+    group.add_argument(
+        "--dedup",
+        choices=("exact", "near", "reuse"),
+        default=None,
+        help="Drop repeated lines (exact) or also nearly repeated lines (near, "
+        "MinHash over the tokens), or keep them but reuse the previous output (reuse).",
+    )
+    group.add_argument(
+        "--dedup-file",
+        default=None,
+        help="Keep the duplicate filter in this file (for very large inputs), "
+        "it is reused by later runs with the same capacity.",
+    )
+    group.add_argument(
+        "--dedup-capacity",
+        type=int,
+        default=1000000,
+        metavar="N",
+        help="Expected number of distinct lines for the duplicate filter (default: 1000000).",
+    )
+
+    shared_engine_parser = argparse.ArgumentParser(add_help=False)
+    group = shared_engine_parser.add_argument_group("Segmentation")
+    group.add_argument(
+        "--engine",
+        choices=sorted(ENGINES),
+        default="longlexto",
+        help="Word segmentation engine: longest matching (longlexto, default) "
+        "or maximal matching with the fewest words (maxmatch).",
+    )
+
+    shared_tagging_parser = argparse.ArgumentParser(add_help=False)
+    group = shared_tagging_parser.add_argument_group("POS tagging")
+    group.add_argument(
+        "--smoothing",
+        type=float,
+        default=None,
+        metavar="ALPHA",
+        help="Tag with a smoothed log-space model, ALPHA is the pseudo count "
+        "for unseen transitions (e. g. 0.1). Default: unsmoothed model.",
+    )
+    group.add_argument(
+        "--model",
+        dest="model_file",
+        default=None,
+        help="Model file (see build-model) to use instead of the ORCHID corpus.",
     )
 
     # ------------------------------------
@@ -139,22 +462,58 @@ def build_parser():
     parser_clean = subparsers.add_parser(
         "clean",
         help="Clean input from non-thai and blank lines.",
-        parents=[shared_inout_parser, shared_stats_parser],
+        parents=[shared_inout_parser, shared_stats_parser, shared_dedup_parser],
     )
     parser_sentseg = subparsers.add_parser(
         "sentseg",
         help="Sentence segmentize input lines.",
-        parents=[shared_inout_parser, shared_stats_parser],
+        parents=[
+            shared_inout_parser,
+            shared_stats_parser,
+            shared_dedup_parser,
+            shared_colselect_parser,
+            shared_engine_parser,
+            shared_tagging_parser,
+        ],
     )
     parser_tokenize = subparsers.add_parser(
         "tokenize",
         help="Tokenize input lines.",
-        parents=[shared_inout_parser, shared_stats_parser, shared_colselect_parser],
+        parents=[
+            shared_inout_parser,
+            shared_stats_parser,
+            shared_dedup_parser,
+            shared_colselect_parser,
+            shared_engine_parser,
+        ],
     )
     parser_tokpos = subparsers.add_parser(
         "tokpos",
         help="Tokenize and POS-tag input lines.",
-        parents=[shared_inout_parser, shared_stats_parser, shared_colselect_parser],
+        parents=[
+            shared_inout_parser,
+            shared_stats_parser,
+            shared_dedup_parser,
+            shared_colselect_parser,
+            shared_engine_parser,
+            shared_tagging_parser,
+        ],
+    )
+
+    parser_build_model = subparsers.add_parser(
+        "build-model",
+        help="Build a model file from ORCHID formatted corpus files.",
+        parents=[shared_stats_parser],
+    )
+    parser_compile_model = subparsers.add_parser(
+        "compile-model",
+        help="Compile a model image that worker processes can share (see --model).",
+        parents=[shared_engine_parser, shared_tagging_parser],
+    )
+    parser_eval_sentseg = subparsers.add_parser(
+        "eval-sentseg",
+        help="Compare sentseg, --boundary-only and --breaks spaces on ORCHID formatted corpus files.",
+        parents=[shared_engine_parser, shared_tagging_parser],
     )
 
     # ------------------------------------
@@ -189,6 +548,26 @@ def build_parser():
     # ------------------------------------
 
     parser_sentseg.add_argument("--foo", help="WIP")
+    group = parser_sentseg.add_argument_group("Performance")
+    group.add_argument(
+        "--boundary-only",
+        action="store_true",
+        dest="boundary_only",
+        help="Tag with a model of only the tag classes needed for sentence breaks "
+        "(SBS, NSBS, conjunctions, other), faster. Needs a corpus or model file, "
+        "not a compiled model image.",
+    )
+    add_split_decoding_argument(group)
+    group.add_argument(
+        "--breaks",
+        choices=SENTENCE_BREAKS,
+        default="viterbi",
+        help="How sentence breaks are found: 'viterbi' tags all words, 'spaces' only "
+        "classifies the spaces by the most frequent tags of the words around them, "
+        "much faster, but the output tags are not decoded. Needs a corpus or model "
+        "file, not a compiled model image.",
+    )
+    add_batch_arguments(group)
 
     # ------------------------------------
 
@@ -205,10 +584,77 @@ def build_parser():
         dest="subwords",
         help="Tokenize entities(?) (names etc.) into subwords.",
     )
+    group = parser_tokenize.add_argument_group("Output")
+    group.add_argument(
+        "--format",
+        choices=("text", "offsets") + RECORD_FORMATS,
+        default="text",
+        dest="output_format",
+        help="Output tokens as text (blank separated) or as character offsets 'start:end:type' "
+        "(type: 0 = unknown, 1 = known, 2 = ambiguous, 3 = English/digits, 4 = special), "
+        "or as records with tokens, offsets and types (jsonl, conllu, arrow, parquet).",
+    )
+    add_record_batch_argument(group)
 
     # ------------------------------------
 
     parser_tokpos.add_argument("--foo", help="WIP")
+    group = parser_tokpos.add_argument_group("Performance")
+    add_batch_arguments(group)
+    add_split_decoding_argument(group)
+    group = parser_tokpos.add_argument_group("Output")
+    group.add_argument(
+        "--format",
+        choices=("text",) + RECORD_FORMATS,
+        default="text",
+        dest="output_format",
+        help="Output 'word|POS' separated by blanks (text) or records with tokens, "
+        "offsets and tags (jsonl, conllu, arrow, parquet; arrow and parquet need pyarrow).",
+    )
+    add_record_batch_argument(group)
+
+    # ------------------------------------
+
+    parser_build_model.add_argument(
+        "corpus", nargs="+", help="Corpus files (ORCHID format)."
+    )
+    parser_build_model.add_argument(
+        "-o",
+        "--output",
+        dest="model_file",
+        required=True,
+        help="Model file to write (gzipped if the name ends with .gz).",
+    )
+    group = parser_build_model.add_argument_group("Parallelism")
+    group.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes for counting. Default: number of CPUs.",
+    )
+    group.add_argument(
+        "--chunk-mb",
+        type=int,
+        default=4,
+        help="Size of the work units (in MB of corpus text). Default: 4.",
+    )
+
+    # ------------------------------------
+
+    parser_compile_model.add_argument(
+        "-o",
+        "--output",
+        dest="image_file",
+        required=True,
+        help="Model image to write, use it with --model (same --engine and --smoothing).",
+    )
+
+    # ------------------------------------
+
+    parser_eval_sentseg.add_argument(
+        "corpus", nargs="+", help="Corpus files (ORCHID format)."
+    )
 
     # ------------------------------------
 
@@ -218,21 +664,72 @@ def build_parser():
 def main(args=None):
     parser = build_parser()
     args = parser.parse_args(args=args)
-    print("Run task: {}".format(args.task))
-
-    print(args)
-
-    if args.task in ("tokenize", "tokpos"):
-        if isinstance(args.column, int):
-            if args.column < 1:
-                raise parser.error(
-                    "Column must be at least 1 or larger. (Counting starts at 1): value = {}".format(
-                        args.column
-                    )
+    print("Run task: {}".format(args.task), file=sys.stderr)
+
+    print(args, file=sys.stderr)
+
+    if args.task in ("sentseg", "tokenize", "tokpos") and args.column is not None:
+        try:
+            args.column = parse_column(args.column, args.input_format)
+        except ValueError as ex:
+            raise parser.error(str(ex))
+
+    if args.task == "clean" and args.dedup == "reuse":
+        raise parser.error(
+            "Reusing output of repeated lines is not possible for clean."
+        )
+    if getattr(args, "dedup_capacity", 1) < 1:
+        raise parser.error(
+            "Dedup capacity must be at least 1: value = {}".format(args.dedup_capacity)
+        )
+
+    if args.task == "build-model":
+        if args.workers is not None and args.workers < 1:
+            raise parser.error(
+                "Workers must be at least 1: value = {}".format(args.workers)
+            )
+        if args.chunk_mb < 1:
+            raise parser.error(
+                "Chunk size must be at least 1: value = {}".format(args.chunk_mb)
+            )
+
+    if args.task in ("sentseg", "tokpos"):
+        if args.batch_size is not None and args.batch_size < 1:
+            raise parser.error(
+                "Batch size must be at least 1: value = {}".format(args.batch_size)
+            )
+        if args.batch_chars is not None and args.batch_chars < 1:
+            raise parser.error(
+                "Batch chars must be at least 1: value = {}".format(args.batch_chars)
+            )
+
+    if args.task == "tokenize" and args.output_format != "text":
+        if args.escape_special or args.subwords:
+            raise parser.error(
+                "Output format {} does not support --escape-special or --subwords.".format(
+                    args.output_format
                 )
-            # TODO: only till 3 ?
+            )
 
-            args.column -= 1
+    if args.task in ("tokenize", "tokpos") and args.output_format in RECORD_FORMATS:
+        if args.column is not None:
+            raise parser.error(
+                "Output format {} is only for whole lines, not columns.".format(
+                    args.output_format
+                )
+            )
+        if args.rows_per_batch < 1:
+            raise parser.error(
+                "Rows per batch must be at least 1: value = {}".format(
+                    args.rows_per_batch
+                )
+            )
+        if args.output_format in BINARY_FORMATS and formats.pyarrow is None:
+            raise parser.error(
+                "Output format {} requires pyarrow to be installed.".format(
+                    args.output_format
+                )
+            )
 
     if args.task == "clean":
         run_clean(args)
@@ -242,3 +739,9 @@ def main(args=None):
         run_tokenize(args)
     elif args.task == "tokpos":
         run_tokenize_postag(args)
+    elif args.task == "build-model":
+        run_build_model(args)
+    elif args.task == "compile-model":
+        run_compile_model(args)
+    elif args.task == "eval-sentseg":
+        run_eval_sentseg(args)
@@ -0,0 +1,220 @@
+"""Detect repeated (and nearly repeated) lines with bounded memory.
+
+Exact duplicates are found by hashing the line into a Bloom filter,
+near-duplicates by MinHash signatures over the tokens of a line, split into
+bands (locality sensitive hashing) that are stored in the same filter.
+The filter can be kept in a file (``mmap``) for very large inputs, it is
+then also reused by later runs.
+
+Being a Bloom filter, a small fraction (``error_rate``) of new lines may be
+reported as duplicates, but duplicates are never missed.
+"""
+import hashlib
+import math
+import mmap
+import os
+import random
+import struct
+import zlib
+
+# ----------------------------------------------------------------------------
+
+
+# file header: magic, number of bits, number of hash functions
+_BLOOM_HEADER = struct.Struct("<8sQI")
+_BLOOM_MAGIC = b"TSBLOOM1"
+
+
+class BloomFilter(object):
+    """Bloom filter for ``bytes`` keys, in memory or in a (memory mapped) file.
+
+    >>> bloom = BloomFilter(capacity=1000)
+    >>> bloom.add(b"key"), bloom.add(b"key"), b"other" in bloom
+    (False, True, False)
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.001, filename=None):
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError(
+                "Invalid bloom filter size: capacity = {}, error_rate = {}".format(
+                    capacity, error_rate
+                )
+            )
+        num_bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        num_bits = (num_bits + 7) // 8 * 8
+        self.num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        self.num_bits = num_bits
+        self.filename = filename
+
+        self._file = None
+        if filename is None:
+            self._bits = bytearray(num_bits // 8)
+            self._offset = 0
+        else:
+            self._bits = self._open_file(filename)
+            self._offset = _BLOOM_HEADER.size
+
+    def _open_file(self, filename):
+        header = _BLOOM_HEADER.pack(_BLOOM_MAGIC, self.num_bits, self.num_hashes)
+        size = len(header) + self.num_bits // 8
+
+        if os.path.exists(filename) and os.path.getsize(filename) > 0:
+            self._file = open(filename, "r+b")
+            if self._file.read(len(header)) != header:
+                self._file.close()
+                raise ValueError(
+                    "Bloom filter file {} was created with other parameters.".format(
+                        filename
+                    )
+                )
+        else:
+            self._file = open(filename, "w+b")
+            self._file.write(header)
+            self._file.truncate(size)  # sparse, zero filled
+            self._file.flush()
+
+        return mmap.mmap(self._file.fileno(), size)
+
+    def _positions(self, key):
+        digest = hashlib.md5(key).digest()
+        (h1, h2) = struct.unpack("<QQ", digest)
+        h2 |= 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        """Add the key, returns whether it was (probably) added before."""
+        bits, offset = self._bits, self._offset
+        found = True
+        for pos in self._positions(key):
+            index, mask = offset + (pos >> 3), 1 << (pos & 7)
+            if not bits[index] & mask:
+                found = False
+                bits[index] |= mask
+        return found
+
+    def __contains__(self, key):
+        bits, offset = self._bits, self._offset
+        return all(
+            bits[offset + (pos >> 3)] & (1 << (pos & 7)) for pos in self._positions(key)
+        )
+
+    def close(self):
+        if self._file is not None:
+            self._bits.flush()
+            self._bits.close()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# ----------------------------------------------------------------------------
+
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+class MinHasher(object):
+    """MinHash signatures of token sets (token n-gram shingles).
+
+    Sets with a Jaccard similarity ``s`` share at least one of ``bands`` bands
+    (each ``num_perm / bands`` values) with a probability of
+    ``1 - (1 - s ** rows) ** bands``, the default (64 / 16) finds most pairs
+    above ``s = 0.6``, use fewer bands for stricter matching.
+    """
+
+    def __init__(self, num_perm=64, bands=16, shingle_size=2, seed=1):
+        if bands < 1 or num_perm % bands:
+            raise ValueError(
+                "num_perm ({}) must be a multiple of bands ({})".format(num_perm, bands)
+            )
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rand = random.Random(seed)
+        self.perms = [
+            (rand.randrange(1, _MERSENNE_PRIME), rand.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+        self._band_struct = struct.Struct("<H{}Q".format(self.rows))
+
+    def shingles(self, tokens):
+        size = self.shingle_size
+        if len(tokens) <= size:
+            return {" ".join(tokens)}
+        starts = range(len(tokens) - size + 1)
+        return {" ".join(tokens[i : i + size]) for i in starts}  # noqa: E203
+
+    def signature(self, tokens):
+        shingles = self.shingles(tokens)
+        hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles]
+        prime = _MERSENNE_PRIME
+        return [min((a * h + b) % prime for h in hashes) for a, b in self.perms]
+
+    def band_keys(self, tokens):
+        """Returns one key (``bytes``) for each band of the signature."""
+        signature = self.signature(tokens)
+        rows, pack = self.rows, self._band_struct.pack
+        return [
+            pack(band, *signature[band * rows : (band + 1) * rows])  # noqa: E203
+            for band in range(self.bands)
+        ]
+
+
+# ----------------------------------------------------------------------------
+
+
+class Deduplicator(object):
+    """Checks lines for exact (and optionally near-) duplicates of earlier lines.
+
+    ``tokenize_fun`` splits a line into tokens for near-duplicate detection
+    (``None`` disables it). Every line adds ``1 + bands`` keys to the Bloom
+    filter with near-duplicate detection, else one; ``capacity`` is the
+    expected number of (distinct) lines.
+    """
+
+    def __init__(
+        self,
+        tokenize_fun=None,
+        capacity=1000000,
+        error_rate=0.001,
+        filename=None,
+        minhasher=None,
+    ):
+        self.tokenize_fun = tokenize_fun
+        self.minhasher = None
+        keys_per_line = 1
+        if tokenize_fun is not None:
+            self.minhasher = minhasher if minhasher is not None else MinHasher()
+            keys_per_line += self.minhasher.bands
+
+        self.bloom = BloomFilter(
+            capacity=capacity * keys_per_line, error_rate=error_rate, filename=filename
+        )
+
+    def check(self, line):
+        """Remember the line and return ``"exact"`` or ``"near"`` if it was
+        seen before (``None`` if not)."""
+        if self.bloom.add(b"\x00" + line.encode("utf-8")):
+            return "exact"
+
+        if self.minhasher is not None:
+            tokens = [token for token in self.tokenize_fun(line) if token.strip()]
+            if tokens:
+                found = False
+                for key in self.minhasher.band_keys(tokens):
+                    found = self.bloom.add(b"\x01" + key) or found
+                if found:
+                    return "near"
+
+        return None
+
+    def close(self):
+        self.bloom.close()
@@ -0,0 +1,98 @@
+"""Evaluate the sentence segmentation with ORCHID formatted corpus files.
+
+The text of every corpus paragraph is rebuilt from its words (special
+tokens like ``<space>`` are written as characters again) and segmented.
+The sentence breaks (character offsets of the breaking spaces) are
+compared with the sentences of the corpus, for the full POS model, for
+the model of the tag classes (``boundary_only``, see
+``orchid_corpus.get_boundary_corpus``) and for the classifier of the
+spaces (``breaks="spaces"``, see ``sentence_segmenter.tag_spaces``).
+"""
+from thai_segmenter.orchid_corpus import iter_paragraphs
+from thai_segmenter.orchid_corpus import paragraph_with_spaces
+
+# ----------------------------------------------------------------------------
+
+
+def paragraph_breaks(paragraph, characters):
+    """Text of a corpus paragraph and the set of offsets of its sentence
+    breaks, ``characters`` maps special tokens back to characters."""
+    text = list()
+    breaks = set()
+    offset = 0
+    for word, pos in paragraph_with_spaces(paragraph):
+        word = characters.get(word, word)
+        if pos == "SBS":
+            breaks.add(offset)
+        text.append(word)
+        offset += len(word)
+    return "".join(text), breaks
+
+
+def sentence_breaks(
+    segmenter, text, tri_gram=False, boundary_only=False, breaks="viterbi"
+):
+    """Set of offsets of the sentence breaks found by the segmenter."""
+    words, _, _, sentence_spans = segmenter.sentence_segment_spans(
+        text, tri_gram=tri_gram, boundary_only=boundary_only, breaks=breaks
+    )
+    offsets = [0]
+    for word in words:
+        offsets.append(offsets[-1] + len(word))
+    return set(offsets[end] for _, end in sentence_spans[:-1])
+
+
+def _scores(found, correct, gold):
+    precision = correct / found if found else 0.0
+    recall = correct / gold if gold else 0.0
+    total = precision + recall
+    return {
+        "found": found,
+        "correct": correct,
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / total if total else 0.0,
+    }
+
+
+def compare_boundaries(filenames, segmenter, tri_gram=False):
+    """Segment the paragraphs of the corpus files with the full model, the
+    boundary model and the space classifier, returns the scores of each
+    (precision, recall and F1 of the sentence breaks, ``"same"`` is the
+    fraction of paragraphs with the same breaks as the full model)."""
+    characters = {token: char for char, token in segmenter.wp.special.items()}
+    modes = (
+        ("full", False, "viterbi"),
+        ("boundary", True, "viterbi"),
+        ("spaces", False, "spaces"),
+    )
+    counts = {name: [0, 0, 0] for name, _, _ in modes}  # found, correct, same
+    paragraphs = gold = 0
+
+    for filename in filenames:
+        with open(filename, "r", encoding="utf-8") as fp:
+            for paragraph in iter_paragraphs(fp):
+                text, gold_breaks = paragraph_breaks(paragraph, characters)
+                paragraphs += 1
+                gold += len(gold_breaks)
+
+                full = None
+                for name, boundary_only, method in modes:
+                    breaks = sentence_breaks(
+                        segmenter,
+                        text,
+                        tri_gram=tri_gram,
+                        boundary_only=boundary_only,
+                        breaks=method,
+                    )
+                    if full is None:
+                        full = breaks
+                    counts[name][0] += len(breaks)
+                    counts[name][1] += len(breaks & gold_breaks)
+                    counts[name][2] += breaks == full
+
+    result = {"paragraphs": paragraphs, "breaks": gold}
+    for name, (found, correct, same) in counts.items():
+        result[name] = _scores(found, correct, gold)
+        result[name]["same"] = same / paragraphs if paragraphs else 1.0
+    return result
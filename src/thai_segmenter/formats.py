@@ -0,0 +1,126 @@
+"""Output formats for token records (see ``tasks.line_tokenize_and_tagger``
+and ``tasks.line_tokenizer`` with ``output_format="records"``).
+
+A record is a dict with the ``text`` of a line, the ``tokens``, their
+character offsets (``starts``, ``ends``) and either POS ``tags`` or the
+LongLexTo token ``types``. All formats use the same field names, so
+JSONL, Arrow and Parquet output load into the same columns.
+"""
+import json
+
+try:
+    # optional: columnar output (arrow, parquet)
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+# ----------------------------------------------------------------------------
+
+
+TEXT_FORMATS = ("jsonl", "conllu")
+BINARY_FORMATS = ("arrow", "parquet")
+RECORD_FORMATS = TEXT_FORMATS + BINARY_FORMATS
+
+
+def format_jsonl(record):
+    return json.dumps(record, ensure_ascii=False)
+
+
+def format_conllu(record, sent_id=None):
+    """Format a record as CoNLL-U sentence (without the trailing blank line).
+
+    The POS tags are in the XPOS column, the character offsets as
+    ``TokenRange`` in MISC. Whitespace tokens are not output but recorded as
+    missing ``SpaceAfter=No`` of the token before.
+    """
+    text, tokens = record["text"], record["tokens"]
+    starts, ends = record["starts"], record["ends"]
+    tags = record.get("tags")
+
+    lines = list()
+    if sent_id is not None:
+        lines.append("# sent_id = {}".format(sent_id))
+    lines.append("# text = {}".format(text))
+
+    num = 0
+    for i, token in enumerate(tokens):
+        if not token.strip():
+            continue
+        num += 1
+        misc = ["TokenRange={}:{}".format(starts[i], ends[i])]
+        if i + 1 < len(tokens) and tokens[i + 1].strip():
+            misc.append("SpaceAfter=No")
+        xpos = tags[i] if tags is not None else "_"
+        lines.append(
+            "\t".join(
+                [str(num), token, "_", "_", xpos, "_", "_", "_", "_", "|".join(misc)]
+            )
+        )
+
+    return "\n".join(lines)
+
+
+def write_text_records(records, outfile, output_format):
+    """Write records as JSON lines or CoNLL-U to a text file."""
+    if output_format == "jsonl":
+        for record in records:
+            outfile.write(format_jsonl(record) + "\n")
+    elif output_format == "conllu":
+        for sent_id, record in enumerate(records, 1):
+            outfile.write(format_conllu(record, sent_id) + "\n\n")
+    else:
+        raise ValueError("Unknown text output format: {}".format(output_format))
+
+
+# ----------------------------------------------------------------------------
+
+
+def _arrow_schema(label_field):
+    label_types = {"tags": pyarrow.string(), "types": pyarrow.int8()}
+    return pyarrow.schema(
+        [
+            ("text", pyarrow.string()),
+            ("tokens", pyarrow.list_(pyarrow.string())),
+            ("starts", pyarrow.list_(pyarrow.int32())),
+            ("ends", pyarrow.list_(pyarrow.int32())),
+            (label_field, pyarrow.list_(label_types[label_field])),
+        ]
+    )
+
+
+def _record_batches(records, schema, rows_per_batch):
+    batch = list()
+    for record in records:
+        batch.append(record)
+        if len(batch) >= rows_per_batch:
+            yield pyarrow.RecordBatch.from_pylist(batch, schema=schema)
+            batch = list()
+    if batch:
+        yield pyarrow.RecordBatch.from_pylist(batch, schema=schema)
+
+
+def write_binary_records(
+    records, outfile, output_format, label_field="tags", rows_per_batch=10000
+):
+    """Write records in record batches of ``rows_per_batch`` rows as Arrow IPC
+    stream or Parquet file (one row group per batch) to a binary file.
+    ``label_field`` is ``"tags"`` or ``"types"``. Requires ``pyarrow``."""
+    if output_format not in BINARY_FORMATS:
+        raise ValueError("Unknown binary output format: {}".format(output_format))
+    if pyarrow is None:
+        raise ValueError(
+            "Output format '{}' requires pyarrow to be installed".format(output_format)
+        )
+
+    schema = _arrow_schema(label_field)
+    if output_format == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(outfile, schema)
+    else:
+        writer = pyarrow.ipc.new_stream(outfile, schema)
+
+    try:
+        for batch in _record_batches(records, schema, rows_per_batch):
+            writer.write_batch(batch)
+    finally:
+        writer.close()
@@ -40,10 +40,21 @@
 # import only used for initialization and test/main code
 from __future__ import print_function
 
+import bisect
 import codecs
+import collections
+import copy
 import os.path
+import re
 import sys
 import threading
+from array import array
+
+try:
+    # optional: C++ trie, used for the compact (frozen) dictionaries if installed
+    import marisa_trie
+except ImportError:  # pragma: no cover
+    marisa_trie = None
 
 
 class Trie(object):
@@ -221,6 +232,21 @@ class Trie(object):
             return 1
         return 0
 
+    def prefix_ends(self, string, begin=0, end=None):
+        """Returns the end positions ``i`` (``begin < i <= end``) for which ``string[begin:i]``
+        is a word in the trie, in ascending order. Walks the trie only once."""
+        if end is None:
+            end = len(string)
+        ends = list()
+        trie = self
+        for i in range(begin, end):
+            trie = trie.get_node_by_char(string[i])
+            if trie is None:
+                break
+            if trie.is_word:
+                ends.append(i + 1)
+        return ends
+
     def has_char(self, char):
         """Returns true if this node has a child with the specified character."""
         for child in self.children:
@@ -250,6 +276,310 @@ class Trie(object):
             trie = trie.parent
         return "".join(reversed(chars))
 
+    def freeze(self):
+        """Returns an immutable, compact copy (FrozenTrie) of the trie rooted at this node."""
+        return FrozenTrie.from_trie(self)
+
+
+class FrozenTrie(object):
+    """Immutable, array-backed trie with the same lookup interface as Trie.
+
+    Nodes are stored in breadth-first order so that the children of a node
+    are contiguous and sorted by character. The whole trie consists of three
+    flat buffers instead of one Python object per character, which keeps the
+    memory footprint small and - because lookups never touch per-node objects -
+    lets forked processes share the pages without copy-on-write faults.
+
+    Usage:
+    >>> trie = Trie()
+    >>> trie.add("ab")
+    True
+    >>> frozen = trie.freeze()
+    >>> frozen.contains("ab"), frozen.contains("a"), frozen.contains("b")
+    (1, 0, -1)
+    """
+
+    __slots__ = ("chars", "offsets", "terminal")
+
+    def __init__(self, chars, offsets, terminal):
+        self.chars = chars  # codepoint of node i (root is 0)
+        self.offsets = offsets  # children of node i: [offsets[i], offsets[i + 1])
+        self.terminal = terminal  # 1 if node i ends a word, else 0
+
+    @classmethod
+    def from_trie(cls, trie):
+        """Builds the compact representation of the given (mutable) Trie."""
+        chars = array("I", [0])
+        offsets = array("I", [1])
+        terminal = bytearray([1 if trie.is_word else 0])
+
+        # breadth-first, so the children of each node are stored contiguously
+        queue = collections.deque([trie])
+        while queue:
+            node = queue.popleft()
+            for child in sorted(node.children, key=lambda t: t.char):
+                chars.append(ord(child.char))
+                terminal.append(1 if child.is_word else 0)
+                queue.append(child)
+            offsets.append(len(chars))
+
+        return cls(chars, offsets, bytes(terminal))
+
+    @classmethod
+    def from_words(cls, words):
+        """Builds a FrozenTrie from an iterable of words."""
+        trie = Trie()
+        for word in words:
+            if word:
+                trie.add(word)
+        return cls.from_trie(trie)
+
+    def add(self, string):
+        raise ValueError("cannot add words to a frozen trie")
+
+    def _get_node(self, string):
+        """[Internal function] Returns the node id of the path matching string or -1."""
+        chars, offsets = self.chars, self.offsets
+        node = 0
+        for char in string:
+            code = ord(char)
+            lo, hi = offsets[node], offsets[node + 1]
+            node = bisect.bisect_left(chars, code, lo, hi)
+            if node == hi or chars[node] != code:
+                return -1
+        return node
+
+    def has_prefix(self, string):
+        """Returns true if the specified string is a prefix path in the trie."""
+        return self._get_node(string) != -1
+
+    def contains(self, string):
+        """Check if the specified string is in the trie.
+        Return value 1 if contains, 0 if has_prefix, else -1"""
+        node = self._get_node(string)
+        if node == -1:
+            return -1
+        if self.terminal[node]:
+            return 1
+        return 0
+
+    def prefix_ends(self, string, begin=0, end=None):
+        """Returns the end positions ``i`` (``begin < i <= end``) for which ``string[begin:i]``
+        is a word in the trie, in ascending order. Walks the trie only once."""
+        chars, offsets, terminal = self.chars, self.offsets, self.terminal
+        if end is None:
+            end = len(string)
+        ends = list()
+        node = 0
+        for i in range(begin, end):
+            code = ord(string[i])
+            lo, hi = offsets[node], offsets[node + 1]
+            node = bisect.bisect_left(chars, code, lo, hi)
+            if node == hi or chars[node] != code:
+                break
+            if terminal[node]:
+                ends.append(i + 1)
+        return ends
+
+    def size(self):
+        """Returns the number of words in the trie."""
+        return sum(self.terminal)
+
+    def __len__(self):
+        """Returns the number of nodes (including the root)."""
+        return len(self.chars)
+
+
+class MarisaTrie(object):
+    """Immutable trie backed by ``marisa_trie.Trie`` (optional C++ extension)
+    with the same lookup interface as Trie/FrozenTrie.
+
+    Prefix matching runs in native code, so the longest matching in
+    LongParseTree is mostly not interpreter-bound anymore.
+    """
+
+    __slots__ = ("trie", "max_len")
+
+    def __init__(self, words):
+        if marisa_trie is None:
+            raise ValueError("marisa-trie is not installed")
+        words = [word for word in words if word]
+        self.trie = marisa_trie.Trie(words)
+        self.max_len = max(len(word) for word in words) if words else 0
+
+    @classmethod
+    def from_trie(cls, trie):
+        """Builds the marisa trie from the words of the given (mutable) Trie."""
+        return cls(trie.get_words(""))
+
+    @classmethod
+    def from_words(cls, words):
+        return cls(words)
+
+    @classmethod
+    def from_bytes(cls, data, max_len):
+        """Loads a marisa trie serialized with ``to_bytes``."""
+        if marisa_trie is None:
+            raise ValueError("marisa-trie is not installed")
+        obj = cls.__new__(cls)
+        obj.trie = marisa_trie.Trie().frombytes(bytes(data))
+        obj.max_len = max_len
+        return obj
+
+    def to_bytes(self):
+        return self.trie.tobytes()
+
+    def add(self, string):
+        raise ValueError("cannot add words to a frozen trie")
+
+    def has_prefix(self, string):
+        """Returns true if the specified string is a prefix path in the trie."""
+        return string in self.trie or next(self.trie.iterkeys(string), None) is not None
+
+    def contains(self, string):
+        """Check if the specified string is in the trie.
+        Return value 1 if contains, 0 if has_prefix, else -1"""
+        if string in self.trie:
+            return 1
+        if next(self.trie.iterkeys(string), None) is not None:
+            return 0
+        return -1
+
+    def prefix_ends(self, string, begin=0, end=None):
+        """Returns the end positions ``i`` (``begin < i <= end``) for which ``string[begin:i]``
+        is a word in the trie, in ascending order."""
+        if end is None or end > begin + self.max_len:
+            end = begin + self.max_len
+        # the order of marisa_trie's prefixes() is not documented, callers need it ascending
+        return sorted(
+            begin + len(word) for word in self.trie.prefixes(string[begin:end])
+        )
+
+    def size(self):
+        """Returns the number of words in the trie."""
+        return len(self.trie)
+
+    def __len__(self):
+        return len(self.trie)
+
+
+# immutable trie implementations, "marisa" is used by default if installed
+TRIE_BACKENDS = {"frozen": FrozenTrie, "marisa": MarisaTrie}
+DEFAULT_TRIE_BACKEND = "frozen" if marisa_trie is None else "marisa"
+
+
+def compact_trie(trie, backend=None):
+    """Returns an immutable, compact copy of the (mutable) Trie using the given
+    backend (see ``TRIE_BACKENDS``, default: ``DEFAULT_TRIE_BACKEND``)."""
+    if backend is None:
+        backend = DEFAULT_TRIE_BACKEND
+    if backend not in TRIE_BACKENDS:
+        raise ValueError("Unknown trie backend: {}".format(backend))
+    if backend == "marisa" and marisa_trie is None:
+        raise ValueError("Trie backend 'marisa' requires marisa-trie to be installed")
+    return TRIE_BACKENDS[backend].from_trie(trie)
+
+
+class OverlayTrie(object):
+    """Read-only view of a dictionary trie and a (small) overlay trie of additional words.
+
+    Used for custom words, so they can be replaced at runtime without
+    rebuilding (or copying) the dictionary trie.
+    """
+
+    __slots__ = ("base", "overlay")
+
+    def __init__(self, base, overlay):
+        self.base = base
+        self.overlay = overlay
+
+    @classmethod
+    def from_words(cls, base, words):
+        return cls(base, FrozenTrie.from_words(words))
+
+    def add(self, string):
+        raise ValueError("cannot add words to an overlay trie")
+
+    def has_prefix(self, string):
+        return self.base.has_prefix(string) or self.overlay.has_prefix(string)
+
+    def contains(self, string):
+        """Check if the specified string is in the trie.
+        Return value 1 if contains, 0 if has_prefix, else -1"""
+        return max(self.base.contains(string), self.overlay.contains(string))
+
+    def prefix_ends(self, string, begin=0, end=None):
+        """Returns the end positions ``i`` (``begin < i <= end``) for which ``string[begin:i]``
+        is a word in the base or overlay trie, in ascending order."""
+        ends = self.base.prefix_ends(string, begin, end)
+        extra_ends = self.overlay.prefix_ends(string, begin, end)
+        if not extra_ends:
+            return ends
+        return sorted(set(ends).union(extra_ends))
+
+    def size(self):
+        """Returns the number of words in both tries (words in both are counted twice)."""
+        return self.base.size() + self.overlay.size()
+
+
+class VocabularyIndex(object):
+    """Trie over a vocabulary to split out-of-vocabulary words into in-vocabulary subwords.
+
+    Usage:
+    >>> index = VocabularyIndex(["ab", "a", "bc"])
+    >>> index.split("abc")
+    (['a', 'bc'], 2)
+    >>> index.split("abd")
+    (None, 2)
+    """
+
+    __slots__ = ("trie",)
+
+    def __init__(self, words, backend=None):
+        trie = Trie()
+        for word in words:
+            if word:
+                trie.add(word)
+        self.trie = compact_trie(trie, backend=backend)
+
+    @classmethod
+    def from_trie(cls, trie):
+        """Index over an existing immutable trie (e. g. attached, see ``shared_model``)."""
+        index = cls.__new__(cls)
+        index.trie = trie
+        return index
+
+    def split(self, word):
+        """Returns ``(subwords, prefix_len)``: the decomposition of word into in-vocabulary
+        subwords (preferring longer subwords from the start) or None if not possible,
+        and the length of the longest in-vocabulary prefix (0 if none)."""
+        prefix_ends = self.trie.prefix_ends
+        length = len(word)
+
+        # backwards: next_end[k] = end of the first subword of a decomposition of word[k:]
+        next_end = [0] * (length + 1)
+        next_end[length] = length
+        first_ends = ()
+        for k in range(length - 1, -1, -1):
+            ends = prefix_ends(word, k)
+            if k == 0:
+                first_ends = ends
+            for end in reversed(ends):
+                if next_end[end]:
+                    next_end[k] = end
+                    break
+
+        prefix_len = first_ends[-1] if first_ends else 0
+        if not next_end[0]:
+            return None, prefix_len
+
+        subwords = list()
+        k = 0
+        while k < length:
+            subwords.append(word[k : next_end[k]])  # noqa: E203
+            k = next_end[k]
+        return subwords, prefix_len
+
 
 class LongParseTree(object):
     def __init__(self, trie, index_list, type_list):
@@ -289,18 +619,22 @@ class LongParseTree(object):
         # Adding ending characters
         self.ending_char = ["\u0e46", "\u0e2f"]
 
+    def new_context(self):
+        """Returns a shallow copy with its own (empty) index_list/type_list that
+        shares the dictionary and character tables. Parsing only changes these
+        lists, so every tokenization can run in its own context concurrently."""
+        ptree = copy.copy(self)
+        ptree.index_list = list()
+        ptree.type_list = list()
+        return ptree
+
     def next_word_valid(self, begin_pos, string):
         if begin_pos == len(string):
             return True
         if string[begin_pos] <= "~":  # English alphabets/digits/special characters
             return True
-        for i in range(begin_pos + 1, len(string)):
-            status = self.dict_.contains(string[begin_pos:i])
-            if status == 1:
-                return True
-            if status != 0:
-                break
-        return False
+        # any word (not reaching the end of the string) starting at begin_pos
+        return len(self.dict_.prefix_ends(string, begin_pos, len(string) - 1)) > 0
 
     def parse_word_instance(self, begin_pos, string):
         prev_char = "\u0000"
@@ -308,14 +642,8 @@ class LongParseTree(object):
         longest_valid_pos = -1  # Longest valid position
         num_valid_pos = 0  # Number of longest value pos (for determining ambiguity)
 
-        status = 1
-        for pos in range(begin_pos + 1, len(string) + 1):
-            if status == -1:
-                break
-            status = self.dict_.contains(string[begin_pos:pos])
-            if status != 1:
-                continue
-
+        # all dictionary words starting at begin_pos (in one trie walk)
+        for pos in self.dict_.prefix_ends(string, begin_pos):
             # Record longest so far
             longest_pos = pos
             if not self.next_word_valid(pos, string):
@@ -374,6 +702,72 @@ class LongParseTree(object):
         return longest_valid_pos
 
 
+class TokenSpans(object):
+    """Tokenization result as character offsets into the original text.
+
+    Token ``i`` is ``text[offsets[i]:offsets[i + 1]]`` with type ``types[i]``
+    (see LongLexTo types). Offsets and types are stored in compact arrays,
+    token strings are only created on demand.
+
+    Usage:
+    >>> spans = TokenSpans("ab c", array("I", [0, 2, 3, 4]), array("B", [3, 4, 3]))
+    >>> list(spans)
+    [(0, 2, 3), (2, 3, 4), (3, 4, 3)]
+    >>> list(spans.words())
+    ['ab', ' ', 'c']
+    """
+
+    __slots__ = ("text", "offsets", "types")
+
+    def __init__(self, text, offsets, types):
+        self.text = text
+        self.offsets = offsets  # array("I"), len(tokens) + 1, starts with 0
+        self.types = types  # array("B"), len(tokens)
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        """Returns the ``(start, end, type)`` tuple of the token at index."""
+        if index < 0:
+            index += len(self.types)
+        if not 0 <= index < len(self.types):
+            raise IndexError("token index out of range")
+        return self.offsets[index], self.offsets[index + 1], self.types[index]
+
+    def __iter__(self):
+        """Yields ``(start, end, type)`` tuples."""
+        offsets = self.offsets
+        return zip(offsets, offsets[1:], self.types)
+
+    def word(self, index):
+        start, end, _ = self[index]
+        return self.text[start:end]
+
+    def words(self):
+        """Yields the token strings."""
+        text, offsets = self.text, self.offsets
+        for i in range(len(self.types)):
+            yield text[offsets[i] : offsets[i + 1]]  # noqa: E203
+
+    def __repr__(self):
+        return "TokenSpans({!r}, {!r})".format(self.text, list(self))
+
+
+# character runs for the pre-tokenization in LongLexTo.word_instance
+# - english: latin letters
+# - digits: arabic or (legacy encoded) thai digits, may contain "," and "."
+# - special: ascii (up to "~") and some other punctuation, one token per char
+# - thai: everything else, passed to the LongParseTree
+_SPECIAL_CHARS = "\\x00-/:-@\\[-`{-~\u00e6\u00cf\u201c\u201d"
+_RE_CHAR_RUN = re.compile(
+    "(?P<english>[A-Za-z]+)"
+    "|(?P<digits>[0-9\u00f0-\u00f9][0-9\u00f0-\u00f9,.]*)"
+    "|(?P<special>[" + _SPECIAL_CHARS + "]+)"
+    "|(?P<thai>[^A-Za-z0-9\u00f0-\u00f9" + _SPECIAL_CHARS + "]+)"
+)
+
+
 class LongLexTo(object):
     """LongLexTo: Tokenizing Thai texts using Longest Matching Approach
 
@@ -383,18 +777,30 @@ class LongLexTo(object):
         1 = known
         2 = ambiguous
         3 = English/digits
-        4 = special characters"""
+        4 = special characters
+
+    Concurrency:
+        ``get_words``/``get_spans`` (and ``word_offsets``) keep their state per
+        call (see ``LongParseTree.new_context``) and only read the dictionary,
+        they can be called from many threads at once without locking.
+        Changing the dictionary (``freeze``, ``set_custom_words``) swaps it
+        atomically, calls in progress finish with the previous one.
+        ``word_instance``/``line_instance`` store their results in the object
+        (``index_list``, ``line_list``, ``iter_``) and are serialized."""
 
     def __init__(self, dict_file="lexitron.txt", raise_errors=False):
         """Constructor with an (optional default) dictionary file.
         Set raise_errors to True if you want Python to raise Exceptions instead of stderr messages.
         """
-        self._lock = threading.RLock()  # to block concurrent access
+        # for dictionary changes and the stateful *_instance methods
+        self._lock = threading.RLock()
 
         self.dict_file = dict_file
         self.dict_ = Trie()  # For storing words from dictionary
 
-        if not os.path.exists(dict_file):
+        if dict_file is None:  # empty, see from_trie
+            pass
+        elif not os.path.exists(dict_file):
             if raise_errors:
                 raise ValueError("Dictionary file not found: {}".format(dict_file))
             else:
@@ -411,8 +817,9 @@ class LongLexTo(object):
         self.line_list = list()  # List of line index positions
         self.type_list = list()  # List of word types (for word only)
 
-        # Parsing tree (for Thai words)
+        # Parsing tree (for Thai words), uses the dictionary + custom words
         self.ptree = LongParseTree(self.dict_, self.index_list, self.type_list)
+        self.custom_words = frozenset()
 
     def add_dict(self, dict_file):
         """Add dictionary (e.g., unknown-word file).
@@ -425,59 +832,87 @@ class LongLexTo(object):
                 if line:
                     self.dict_.add(line)
 
-    def word_instance(self, text):
-        """Word tokenization."""
+    def freeze(self, backend=None):
+        """Replace the dictionary trie with a compact, immutable version (see ``compact_trie``,
+        MarisaTrie if marisa-trie is installed, else FrozenTrie).
+        No more words can be added afterwards."""
         with self._lock:
-            # important: this method of clearing because self.ptree has references to those lists
-            self.index_list[:] = []
-            self.type_list[:] = []
-
-            pos, len_text = 0, len(text)
-            while pos < len_text:  # for the whole text length
-                # Check for special characters and English words/numbers
-                char = text[pos]
-
-                # English
-                if ("A" <= char <= "Z") or ("a" <= char <= "z"):
-                    while pos < len_text and (
-                        ("A" <= char <= "Z") or ("a" <= char <= "z")
-                    ):
-                        char = text[pos]
-                        pos += 1
-                    if pos < len_text:
-                        pos -= 1
-                    self.index_list.append(pos)
-                    self.type_list.append(3)
-                    continue
-
-                # Digits
-                if ("0" <= char <= "9") or ("\u00f0" <= char <= "\u00f9"):
-                    while pos < len_text and (
-                        ("0" <= char <= "9")
-                        or ("\u00f0" <= char <= "\u00f9")
-                        or char == ","
-                        or char == "."
-                    ):
-                        char = text[pos]
-                        pos += 1
-                    if pos < len_text:
-                        pos -= 1
-                    self.index_list.append(pos)
-                    self.type_list.append(3)
-                    continue
+            if isinstance(self.dict_, Trie):
+                self.dict_ = compact_trie(self.dict_, backend=backend)
+                self.ptree.dict_ = self._with_custom_words(self.custom_words)
+
+    def _with_custom_words(self, words):
+        if not words:
+            return self.dict_
+        return OverlayTrie.from_words(self.dict_, words)
+
+    def set_custom_words(self, words):
+        """Replace the custom words (an overlay over the dictionary, which is not changed).
+        Can be called at any time, a tokenization in progress finishes with the previous words.
+        """
+        words = frozenset(word for word in words if word)
+        with self._lock:
+            self.ptree.dict_ = self._with_custom_words(words)
+            self.custom_words = words
+
+    def word_offsets(self, text):
+        """Word tokenization, returns the lists of token end offsets and types.
+        Uses no shared state (see ``LongParseTree.new_context``)."""
+        ptree = self.ptree.new_context()
+        index_list, type_list = ptree.index_list, ptree.type_list
+        parse_thai = self.parse_thai
+        scan_runs = _RE_CHAR_RUN.finditer
+
+        pos, len_text = 0, len(text)
+        while pos < len_text:  # for the whole text length
+            # classify runs of characters, restarts if a Thai word extends past its run
+            for run in scan_runs(text, pos):
+                kind = run.lastgroup
+                start, end = run.span()
+
+                # Thai word(s) (known/unknown/ambiguous)
+                if kind == "thai":
+                    pos = parse_thai(text, start, end, ptree)
+                    # dictionary words may extend past the run (e.g. abbreviations with ".")
+                    if pos > end:
+                        break
+
+                # Special characters, each a single token
+                elif kind == "special":
+                    if end - start == 1:
+                        index_list.append(end)
+                        type_list.append(4)
+                    else:
+                        index_list.extend(range(start + 1, end + 1))
+                        type_list.extend([4] * (end - start))
 
-                # Special characters
-                if char <= "~" or char in ("\u00e6", "\u00cf", "\u201c", "\u201d", ","):
-                    pos += 1
-                    self.index_list.append(pos)
-                    self.type_list.append(4)
-                    continue
+                # English / Digits
+                else:
+                    index_list.append(end)
+                    type_list.append(3)
+            else:
+                pos = len_text
 
-                # Thai word (known/unknown/ambiguous)
-                pos = self.ptree.parse_word_instance(pos, text)
+        return index_list, type_list
 
+    def word_instance(self, text):
+        """Word tokenization, results in ``index_list``, ``type_list`` and ``iter_``."""
+        with self._lock:
+            index_list, type_list = self.word_offsets(text)
+            # update in place, self.ptree has references to those lists
+            self.index_list[:] = index_list
+            self.type_list[:] = type_list
             self.iter_ = iter(self.index_list)
 
+    def parse_thai(self, text, start, end, ptree):
+        """Segments the Thai run ``text[start:end]`` (appends to ptree.index_list/type_list)
+        with longest matching. Returns the position to continue at, may be after end."""
+        parse_word_instance = ptree.parse_word_instance
+        pos = start
+        while pos < end:
+            pos = parse_word_instance(pos, text)
+        return pos
+
     def line_instance(self, text):
         """Line-break tokenization."""
         with self._lock:
@@ -556,12 +991,28 @@ class LongLexTo(object):
 
     def get_words(self, line):
         """(Word-)Tokenizes the given string and yield the tokens."""
-        with self._lock:
-            self.word_instance(line)
-            begin = 0
-            for end in self.index_list:
-                yield line[begin:end]
-                begin = end
+        index_list, _ = self.word_offsets(line)
+        begin = 0
+        for end in index_list:
+            yield line[begin:end]
+            begin = end
+
+    def get_spans(self, line):
+        """(Word-)Tokenizes the given string and returns the token offsets (TokenSpans)
+        without creating the token strings."""
+        index_list, type_list = self.word_offsets(line)
+        offsets = array("I", [0])
+        offsets.extend(index_list)
+        return TokenSpans(line, offsets, array("B", type_list))
+
+    @classmethod
+    def from_trie(cls, trie):
+        """Tokenizer over an existing immutable dictionary trie (e. g. attached
+        from a model image, see ``shared_model``)."""
+        tokenizer = cls(dict_file=None)
+        tokenizer.dict_ = trie
+        tokenizer.ptree.dict_ = trie
+        return tokenizer
 
     @classmethod
     def create(cls, dict_file="lexitron.txt", unknown_dict_file="unknown.txt"):
@@ -572,6 +1023,111 @@ class LongLexTo(object):
         return tokenizer
 
 
+class MaxMatch(LongLexTo):
+    """Maximal matching: segments Thai runs into the fewest dictionary words.
+
+    Builds the word lattice of a Thai run from the dictionary trie (one
+    ``prefix_ends`` lookup per position) and picks the path with the least
+    unknown characters, then the least words, with dynamic programming in
+    O(n*k) (k = longest word). Non-Thai text is handled like LongLexTo.
+
+    Types are the same as for LongLexTo, type 2 (ambiguous) marks words that
+    end where an alternative path of equal cost ends, too.
+    """
+
+    def __init__(self, dict_file="lexitron.txt", raise_errors=False):
+        super(MaxMatch, self).__init__(dict_file, raise_errors=raise_errors)
+        # no boundary before dependent vowels/tonal marks or after leading vowels
+        self.no_split_before = frozenset(
+            self.ptree.front_dep_char + self.ptree.tonal_char
+        )
+        self.no_split_after = frozenset(self.ptree.rear_dep_char)
+
+    def parse_thai(self, text, start, end, ptree):
+        """Segments the Thai run ``text[start:end]`` (appends to ptree.index_list/type_list)
+        with maximal matching. Returns the position to continue at, may be after end."""
+        prefix_ends = ptree.dict_.prefix_ends
+        no_split_before, no_split_after = self.no_split_before, self.no_split_after
+        length = end - start
+
+        # possible token boundaries (relative to start)
+        can_split = bytearray([1]) * (length + 1)
+        for k in range(1, length):
+            if (
+                text[start + k] in no_split_before
+                or text[start + k - 1] in no_split_after
+            ):
+                can_split[k] = 0
+
+        # word lattice, dictionary words may extend past the run
+        word_ends = [
+            prefix_ends(text, start + k) if can_split[k] else () for k in range(length)
+        ]
+        size = max([length] + [ends[-1] - start for ends in word_ends if ends]) + 1
+        can_split.extend([1] * (size - len(can_split)))
+
+        # cost = unknown chars * penalty + words, best path to k: back[k], is_word[k]
+        unknown_penalty = size + 1
+        cost = [-1] * size
+        cost[0] = 0
+        back = [0] * size
+        is_word = bytearray(size)
+        ambiguous = bytearray(size)
+
+        for k in range(length):
+            word_cost = cost[k] + 1
+            for j in word_ends[k]:
+                j -= start
+                if not can_split[j]:
+                    continue
+                old_cost = cost[j]
+                if old_cost == -1 or word_cost < old_cost:
+                    cost[j], back[j], is_word[j], ambiguous[j] = word_cost, k, 1, 0
+                elif word_cost == old_cost:
+                    ambiguous[j] = 1
+
+            # unknown character, always possible
+            unknown_cost = word_cost + unknown_penalty
+            old_cost = cost[k + 1]
+            if old_cost == -1 or unknown_cost < old_cost:
+                cost[k + 1], back[k + 1], is_word[k + 1], ambiguous[k + 1] = (
+                    unknown_cost,
+                    k,
+                    0,
+                    0,
+                )
+
+        stop = min(
+            (k for k in range(length, size) if cost[k] != -1),
+            key=lambda k: (cost[k], k),
+        )
+
+        path = list()
+        k = stop
+        while k != 0:
+            path.append(k)
+            k = back[k]
+
+        index_list, type_list = ptree.index_list, ptree.type_list
+        for k in reversed(path):
+            if is_word[k]:
+                index_list.append(start + k)
+                type_list.append(2 if ambiguous[k] else 1)
+            elif index_list and (type_list[-1] == 0 or not can_split[back[k]]):
+                # combine unknown segments (and attach to a word that cannot be split off)
+                index_list[-1] = start + k
+                type_list[-1] = 0
+            else:
+                index_list.append(start + k)
+                type_list.append(0)
+
+        return start + stop
+
+
+# segmentation engines (for Thai runs), see word_processing
+ENGINES = {"longlexto": LongLexTo, "maxmatch": MaxMatch}
+
+
 def main(args):
     """Dummy method as example use case."""
     tokenizer = LongLexTo.create()
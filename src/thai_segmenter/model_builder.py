@@ -0,0 +1,94 @@
+"""Build model files (word and tag n-gram counts) from ORCHID formatted
+corpus files, counting in parallel worker processes.
+
+The corpus files are read as a stream and cut into chunks of text at
+paragraph starts (``#P``), every chunk is parsed and counted by a worker
+and the counts are merged (see ``orchid_corpus.corpus_counts``). The model
+file can then be loaded with ``orchid_corpus(model_file=...)``.
+"""
+import multiprocessing
+from collections import deque
+
+from thai_segmenter.orchid_corpus import corpus_counts
+from thai_segmenter.orchid_corpus import iter_paragraphs
+
+# ----------------------------------------------------------------------------
+
+
+def iter_chunks(filenames, chunk_size=4 * 1024 * 1024):
+    """Yields the text of the files in chunks of about ``chunk_size``
+    characters, split only before paragraph lines (``#P``).
+    Paragraphs never span files."""
+    for filename in filenames:
+        rest = ""
+        with open(filename, "r", encoding="utf-8") as fp:
+            while True:
+                block = fp.read(chunk_size)
+                if not block:
+                    break
+                text = rest + block
+                cut = text.rfind("\n#P")
+                if cut == -1:  # no paragraph start yet, read more
+                    rest = text
+                    continue
+                yield text[: cut + 1]
+                rest = text[cut + 1 :]  # noqa: E203
+        if rest:
+            yield rest
+
+
+def count_text(text):
+    """Count the paragraphs in ORCHID formatted text, returns ``corpus_counts``."""
+    counts = corpus_counts()
+    for paragraph in iter_paragraphs(text.splitlines()):
+        counts.add_paragraph(paragraph)
+    return counts
+
+
+def build_counts(filenames, workers=None, chunk_size=4 * 1024 * 1024):
+    """Count the corpus files with ``workers`` processes (default: number
+    of CPUs, ``1`` counts in this process) and return the merged counts."""
+    counts = corpus_counts()
+    chunks = iter_chunks(filenames, chunk_size=chunk_size)
+
+    if workers == 1:
+        for chunk in chunks:
+            counts.update(count_text(chunk))
+        return counts
+
+    pool = multiprocessing.Pool(processes=workers)
+    try:
+        # only a few chunks in flight, so the files are never fully in memory
+        max_pending = 2 * (workers or multiprocessing.cpu_count())
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(count_text, (chunk,)))
+            if len(pending) >= max_pending:
+                counts.update(pending.popleft().get())
+        while pending:
+            counts.update(pending.popleft().get())
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    return counts
+
+
+def build_model(
+    filenames, model_file, workers=None, chunk_size=4 * 1024 * 1024, summary=None
+):
+    """Count the corpus files and write the model file (see ``build_counts``)."""
+    counts = build_counts(filenames, workers=workers, chunk_size=chunk_size)
+    counts.save(model_file)
+
+    if isinstance(summary, dict):
+        summary["files"] = len(filenames)
+        summary["paragraphs"] = counts.paragraphs
+        summary["tokens"] = sum(counts.words.values())
+        summary["words"] = len(counts.words)
+        summary["tags"] = len(counts.pos)
+
+    return counts
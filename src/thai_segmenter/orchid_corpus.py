@@ -1,183 +1,410 @@
 import ast
+import gzip
+import json
+import math
 import os
+import threading
+from array import array
+from collections import Counter
+
+from thai_segmenter.cache import SizedLRUCache
+from thai_segmenter.longlexto import VocabularyIndex
+
+try:
+    # optional: dense model for batch decoding (see get_batch_model)
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+# defaults for the smoothed log-space model, see calc_log_statistics
+DEFAULT_SMOOTHING = 0.1
+DEFAULT_PRUNE = 1e-6
+
+NEG_INF = float("-inf")
+
+# memory for the decoded pieces of viterbi.viterbi_split (per model), see get_split_cache
+SPLIT_CACHE_BYTES = 16 * 1024 * 1024
+
+# tag classes of the boundary model (see orchid_corpus.get_boundary_corpus):
+# only the tags that sentence_segmenter.cut_sentence/merge_sentence look at,
+# all other tags are BOUNDARY_OTHER (sorts last, so like XVMM in the full
+# model it is the fallback state)
+BOUNDARY_CLASSES = {
+    "SBS": "SBS",
+    "NSBS": "NSBS",
+    "JCRG": "JCRG",
+    "JCMP": "JCRG",
+    "JSBR": "JSBR",
+}
+BOUNDARY_OTHER = "X"
+
+# space classifier (see orchid_corpus.get_space_model): pseudo count of the
+# naive Bayes estimate and its weight against the counts of the tag pair
+SPACE_SMOOTHING = 1.0
+SPACE_PRIOR_WEIGHT = 1.0
+
+
+def boundary_class(pos):
+    """Tag class of the boundary model for the tag ``pos``."""
+    return BOUNDARY_CLASSES.get(pos, BOUNDARY_OTHER)
+
+# ----------------------------------------------------------------------------
+
+
+def iter_paragraphs(lines):
+    """Parse ORCHID formatted lines, yields the paragraphs as lists of
+    sentences (lists of ``(word, pos)`` tuples)."""
+    state = "init"
+    sentences = []
+    words = []
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        if state == "init":
+            if line[0:7] == "%TTitle":
+                state = "book"
+            elif line[0] == "#" and line[1:2] == "P":
+                state = "paragraph"
+            elif line[0] == "#":
+                state = "sentence"
+
+        elif state == "book":
+            if line[0] == "#" and line[1:2] == "P":
+                state = "paragraph"
+
+        elif state == "paragraph":
+            if len(sentences) > 0:
+                yield sentences
+            sentences = []
+            state = "sentence"
+
+        elif state == "sentence":
+            if "//" in line:
+                if line[0:2] == "%E":
+                    state = "init"
+                else:
+                    words = []
+                    state = "word"
+            elif line[0:2] == "%E":
+                state = "eng"
+
+        elif state == "eng":
+            if "//" in line:
+                state = "init"
+
+        elif state == "word":
+            if "//" in line:
+                state = "init"
+                sentences.append(words)
+            else:
+                (word, pos) = line.split("/")
+                words.append((word, pos))
+
+    if len(sentences) > 0:
+        yield sentences
+
+
+def paragraph_with_spaces(paragraph):
+    """Join the sentences of a paragraph into one list of ``(word, pos)``.
+    Spaces in sentences are tagged NSBS (Non Sentence Break Space), the
+    sentences are separated with SBS (Sentence Break Space)."""
+    p = []
+    for i in range(len(paragraph)):
+        for word in paragraph[i]:  # for each word in sentence
+            if word[0] == "<space>":
+                p.append(("<space>", "NSBS"))
+            else:
+                p.append(word)
+
+        if i != len(paragraph) - 1:
+            p.append(("<space>", "SBS"))
+
+    return p
+
+
+class corpus_counts:
+    """Word, tag and tag n-gram counts of a corpus, the statistics model is
+    computed from them. Counts of separate corpus parts can be merged with
+    ``update`` and stored as (gzipped) JSON model file with ``save``."""
+
+    format_name = "thai-segmenter-counts"
+    format_version = 1
+
+    def __init__(self):
+        self.paragraphs = 0
+        # raw corpus words and tags
+        self.words = Counter()
+        self.pos = Counter()
+        # paragraphs with sentence break tags (see paragraph_with_spaces)
+        self.initial = Counter()
+        self.bigrams = Counter()
+        self.trigrams = Counter()
+        self.emissions = Counter()
+        self.tags = Counter()
+
+    def add_paragraph(self, paragraph):
+        for sentence in paragraph:
+            self.words.update(word for word, _ in sentence)
+            self.pos.update(pos for _, pos in sentence)
+
+        p = paragraph_with_spaces(paragraph)
+        if not p:
+            return
+        tags = [pos for _, pos in p]
+
+        self.paragraphs += 1
+        self.initial[tags[0]] += 1
+        self.bigrams.update(zip(tags, tags[1:]))
+        self.trigrams.update(zip(tags, tags[1:], tags[2:]))
+        self.emissions.update(p)
+        self.tags.update(tags)
+
+    def update(self, other):
+        """Add the counts of another ``corpus_counts``."""
+        self.paragraphs += other.paragraphs
+        self.words.update(other.words)
+        self.pos.update(other.pos)
+        self.initial.update(other.initial)
+        self.bigrams.update(other.bigrams)
+        self.trigrams.update(other.trigrams)
+        self.emissions.update(other.emissions)
+        self.tags.update(other.tags)
+
+    def map_tags(self, tag_fun):
+        """Return new counts with every tag replaced by ``tag_fun(tag)``
+        (the counts of tags that map to the same tag are merged)."""
+        counts = corpus_counts()
+        counts.paragraphs = self.paragraphs
+        counts.words = Counter(self.words)
+        for pos, count in self.pos.items():
+            counts.pos[tag_fun(pos)] += count
+        for pos, count in self.initial.items():
+            counts.initial[tag_fun(pos)] += count
+        for pos, count in self.tags.items():
+            counts.tags[tag_fun(pos)] += count
+        for (prev, curr), count in self.bigrams.items():
+            counts.bigrams[tag_fun(prev), tag_fun(curr)] += count
+        for (prev2, prev1, curr), count in self.trigrams.items():
+            counts.trigrams[tag_fun(prev2), tag_fun(prev1), tag_fun(curr)] += count
+        for (word, pos), count in self.emissions.items():
+            counts.emissions[word, tag_fun(pos)] += count
+        return counts
+
+    # ------------------------------------
+
+    def to_dict(self):
+        return {
+            "format": corpus_counts.format_name,
+            "version": corpus_counts.format_version,
+            "paragraphs": self.paragraphs,
+            "words": self.words,
+            "pos": self.pos,
+            "initial": self.initial,
+            "tags": self.tags,
+            "bigrams": [list(key) + [count] for key, count in self.bigrams.items()],
+            "trigrams": [list(key) + [count] for key, count in self.trigrams.items()],
+            "emissions": [list(key) + [count] for key, count in self.emissions.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("format") != cls.format_name or data.get("version") != 1:
+            raise ValueError(
+                "Not a model file (format {} {}): {}/{}".format(
+                    cls.format_name,
+                    cls.format_version,
+                    data.get("format"),
+                    data.get("version"),
+                )
+            )
+        counts = cls()
+        counts.paragraphs = data["paragraphs"]
+        counts.words = Counter(data["words"])
+        counts.pos = Counter(data["pos"])
+        counts.initial = Counter(data["initial"])
+        counts.tags = Counter(data["tags"])
+        counts.bigrams = Counter({tuple(key): count for *key, count in data["bigrams"]})
+        counts.trigrams = Counter(
+            {tuple(key): count for *key, count in data["trigrams"]}
+        )
+        counts.emissions = Counter(
+            {tuple(key): count for *key, count in data["emissions"]}
+        )
+        return counts
+
+    def save(self, filename):
+        """Write to a JSON model file, gzipped if the name ends with ``.gz``."""
+        opener = gzip.open if filename.endswith(".gz") else open
+        with opener(filename, "wt", encoding="utf-8") as fp:
+            json.dump(self.to_dict(), fp, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, filename):
+        """Read a model file written with ``save``."""
+        opener = gzip.open if filename.endswith(".gz") else open
+        with opener(filename, "rt", encoding="utf-8") as fp:
+            return cls.from_dict(json.load(fp))
+
+
+# ----------------------------------------------------------------------------
 
 
 class orchid_corpus:
     filename_orchid = "orchid97.txt"
 
-    def __init__(self, file_name=None):
+    def __init__(
+        self,
+        file_name=None,
+        smoothing=None,
+        prune=DEFAULT_PRUNE,
+        model_file=None,
+        keep_corpus=False,
+        counts=None,
+    ):
         if file_name is None:
             cwd = os.path.dirname(os.path.realpath(__file__))
             file_name = os.path.join(cwd, "tools", orchid_corpus.filename_orchid)
         self.orchid = file_name
+        self.model_file = model_file
+        self._lock = threading.Lock()  # only for the lazily built parts
+        # raw corpus lists, only kept with keep_corpus (else see get_corpus_pos)
         self.corpus = list()
         self.corpus_pos = list()
         self.corpus_sentence = list()
-        self.read_from_corpus()
+
+        # counts for the statistics, from the corpus or a model file (see corpus_counts.save)
+        if counts is not None:
+            self.counts = counts
+        elif model_file is None:
+            self.counts = self.read_from_corpus(keep_corpus=keep_corpus)
+        else:
+            self.counts = corpus_counts.load(model_file)
 
         # word and pos list
         self.word_list = set()
         self.pos_list = set()
         self.pos_list_sentence = set()
         self.get_word_pos_list()
-
-        # for statistics model
-        self.initp = dict()
-        self.trans_bi = dict()
-        self.trans_tri = dict()
-        self.emiss = dict()
-        self.calc_statistics()
-
-    def read_from_corpus(self):
+        self.vocabulary_index = None  # for splitting unknown words, see get_vocabulary_index
+
+        # statistics model (tag strings as keys), only computed on demand
+        self.statistics = None
+
+        # model indexed by tag ids, see calc_indexed_statistics
+        self.tags = list()
+        self.tag_ids = dict()
+        self.initp_ids = None
+        self.trans_bi_ids = None
+        self.trans_tri_ids = None
+        self.emiss_ids = dict()
+        self.calc_indexed_statistics()
+
+        # dense (NumPy) versions of the models, see get_batch_model
+        self.batch_models = dict()
+        # memoized decoded pieces, see get_split_cache
+        self.split_caches = dict()
+        # models of the tag classes for sentence boundaries, see get_boundary_corpus
+        self.boundary_corpora = dict()
+        # word tags and space classes for sentence breaks, see get_space_model
+        self.space_model = None
+
+        # optional smoothed log-space model, see calc_log_statistics
+        self.log_model = None
+        if smoothing is not None:
+            self.calc_log_statistics(smoothing=smoothing, prune=prune)
+
+    def iter_corpus(self):
+        """Yields the paragraphs of the corpus file (see ``iter_paragraphs``)."""
         with open(self.orchid, "r", encoding="utf-8") as corpus_file:
-            corpus = corpus_file.readlines()
-
-        state = "init"
-        sentences = []
-        words = []
-
-        # read to corpus
-
-        for line in corpus:
-            line = line.strip()
-
-            if state == "init":
-                if line[0:7] == "%TTitle":
-                    state = "book"
-                elif line[0] == "#" and line[1] == "P":
-                    state = "paragraph"
-                elif line[0] == "#":
-                    state = "sentence"
-
-            elif state == "book":
-                if line[0] == "#" and line[1] == "P":
-                    state = "paragraph"
-
-            elif state == "paragraph":
-                if len(sentences) > 0:
-                    self.corpus.append(sentences)
-                sentences = []
-                state = "sentence"
-
-            elif state == "sentence":
-                if "//" in line:
-                    if line[0:2] == "%E":
-                        state = "init"
-                    else:
-                        words = []
-                        state = "word"
-                elif line[0:2] == "%E":
-                    state = "eng"
-
-            elif state == "eng":
-                if "//" in line:
-                    state = "init"
-
-            elif state == "word":
-                if "//" in line:
-                    state = "init"
-                    sentences.append(words)
-                else:
-                    (word, pos) = line.split("/")
-                    words.append((word, pos))
-
-        # corpus_pos
+            for paragraph in iter_paragraphs(corpus_file):
+                yield paragraph
 
-        for paragraph in self.corpus:
-            for sentence in paragraph:
-                self.corpus_pos.append(sentence)
+    def read_from_corpus(self, keep_corpus=False):
+        """Count the corpus file while parsing it, returns the ``corpus_counts``.
+        With ``keep_corpus`` also stores the paragraphs in ``corpus``,
+        ``corpus_pos`` and ``corpus_sentence``."""
+        counts = corpus_counts()
 
-        # corpus_sentence
-        # add tag <SBS> = Sentence Break Space and <NSBS> = Non Sentence Break Space
+        for paragraph in self.iter_corpus():
+            counts.add_paragraph(paragraph)
 
-        for paragraph in self.corpus:
-            p = []
-            for i in range(len(paragraph)):
-                for word in paragraph[i]:  # for each word in sentence
-                    if word[0] == "<space>":
-                        p.append(("<space>", "NSBS"))
-                    else:
-                        p.append(word)
+            if keep_corpus:
+                self.corpus.append(paragraph)
+                # corpus_pos
+                self.corpus_pos.extend(paragraph)
+                # corpus_sentence
+                # add tag <SBS> = Sentence Break Space and <NSBS> = Non Sentence Break Space
+                self.corpus_sentence.append(paragraph_with_spaces(paragraph))
 
-                if i != len(paragraph) - 1:
-                    p.append(("<space>", "SBS"))
-
-            self.corpus_sentence.append(p)
+        return counts
 
     def get_word_pos_list(self):
-        for paragraph in self.corpus:
-            for sentence in paragraph:
-                for word in sentence:
-                    self.word_list.add(word[0])
-                    self.pos_list.add(word[1])
+        self.word_list.update(self.counts.words)
+        self.word_list.update(word for word, _ in self.counts.emissions)  # + <space>
+        self.pos_list.update(self.counts.pos)
 
         self.pos_list_sentence = self.pos_list.copy()
         self.pos_list_sentence.add("SBS")
         self.pos_list_sentence.add("NSBS")
 
     def calc_statistics(self):
-        cp = self.corpus_sentence
+        """Compute the statistics model with tag strings as keys, stored in
+        ``statistics``. Only used for ``get_statistics_model``, the taggers
+        use the indexed model (see ``calc_indexed_statistics``)."""
+        counts = self.counts
         word_list = self.word_list
         pos_list = self.pos_list_sentence
+        initp, trans_bi, trans_tri, emiss = dict(), dict(), dict(), dict()
 
         # initial probability
         for pos in pos_list:
-            self.initp[pos] = 0
+            initp[pos] = 0
 
-        for paragraph in cp:
-            self.initp[paragraph[0][1]] += 1
+        for pos, count in counts.initial.items():
+            initp[pos] += count
 
-        n = len(cp)
-        for pos in self.initp:
-            self.initp[pos] /= n
+        n = counts.paragraphs
+        for pos in initp:
+            initp[pos] /= n
 
         # transition probability
         # bigram
         for pos1 in pos_list:
-            self.trans_bi[pos1] = dict()
-            self.trans_bi[pos1]["count"] = 0
+            trans_bi[pos1] = dict()
+            trans_bi[pos1]["count"] = 0
             for pos2 in pos_list:
-                self.trans_bi[pos1][pos2] = 0
+                trans_bi[pos1][pos2] = 0
 
-        for paragraph in cp:
-            n = len(paragraph)
-            for i in range(n - 1):
-                curr_pos = paragraph[i][1]
-                next_pos = paragraph[i + 1][1]
-                self.trans_bi[curr_pos][next_pos] += 1
-                self.trans_bi[curr_pos]["count"] += 1
+        for (curr_pos, next_pos), count in counts.bigrams.items():
+            trans_bi[curr_pos][next_pos] += count
+            trans_bi[curr_pos]["count"] += count
 
-        for pos1 in self.trans_bi:
-            for pos2 in self.trans_bi[pos1]:
-                if pos2 != "count":
-                    self.trans_bi[pos1][pos2] /= self.trans_bi[pos1]["count"]
+        for pos1 in trans_bi:
+            for pos2 in trans_bi[pos1]:
+                if pos2 != "count" and trans_bi[pos1]["count"] != 0:
+                    trans_bi[pos1][pos2] /= trans_bi[pos1]["count"]
 
         # trigram
         for pos1 in pos_list:
-            self.trans_tri[pos1] = dict()
+            trans_tri[pos1] = dict()
             for pos2 in pos_list:
-                self.trans_tri[pos1][pos2] = dict()
-                self.trans_tri[pos1][pos2]["count"] = 0
+                trans_tri[pos1][pos2] = dict()
+                trans_tri[pos1][pos2]["count"] = 0
                 for pos3 in pos_list:
-                    self.trans_tri[pos1][pos2][pos3] = 0  # p(pos3|pos1,pos2)
-
-        for paragraph in cp:
-            n = len(paragraph)
-            for i in range(n - 2):
-                pos1 = paragraph[i][1]
-                pos2 = paragraph[i + 1][1]
-                pos3 = paragraph[i + 2][1]
-
-                self.trans_tri[pos1][pos2][pos3] += 1
-                self.trans_tri[pos1][pos2]["count"] += 1
-
-        for pos1 in self.trans_tri:
-            for pos2 in self.trans_tri[pos1]:
-                for pos3 in self.trans_tri[pos1][pos2]:
-                    if pos3 != "count" and self.trans_tri[pos1][pos2]["count"] != 0:
-                        self.trans_tri[pos1][pos2][pos3] /= self.trans_tri[pos1][pos2][
-                            "count"
-                        ]
+                    trans_tri[pos1][pos2][pos3] = 0  # p(pos3|pos1,pos2)
+
+        for (pos1, pos2, pos3), count in counts.trigrams.items():
+            trans_tri[pos1][pos2][pos3] += count
+            trans_tri[pos1][pos2]["count"] += count
+
+        for pos1 in trans_tri:
+            for pos2 in trans_tri[pos1]:
+                for pos3 in trans_tri[pos1][pos2]:
+                    if pos3 != "count" and trans_tri[pos1][pos2]["count"] != 0:
+                        trans_tri[pos1][pos2][pos3] /= trans_tri[pos1][pos2]["count"]
 
         # emission probability
         pos_count = dict()
@@ -185,45 +412,479 @@ class orchid_corpus:
             pos_count[pos] = 0
 
         for word in word_list:
-            self.emiss[word] = dict()
+            emiss[word] = dict()
             for pos in pos_list:
-                self.emiss[word][pos] = 0
+                emiss[word][pos] = 0
 
-        for paragraph in cp:
-            for word in paragraph:
-                pos_count[word[1]] += 1
-                self.emiss[word[0]][word[1]] += 1
+        for (word, pos), count in counts.emissions.items():
+            pos_count[pos] += count
+            emiss[word][pos] += count
 
         # modify for custom dictionary
         for pos1 in pos_list:
             kw = "_" + pos1
-            self.emiss[kw] = dict()
+            emiss[kw] = dict()
             for pos2 in pos_list:
-                self.emiss[kw][pos2] = 0 if pos2 != pos1 else 1
+                emiss[kw][pos2] = 0 if pos2 != pos1 else 1
 
         for word in word_list:
             for pos in pos_list:
-                self.emiss[word][pos] /= pos_count[pos]
+                if pos_count[pos] != 0:
+                    emiss[word][pos] /= pos_count[pos]
+
+        self.statistics = (initp, trans_bi, trans_tri, emiss)
+
+    def calc_indexed_statistics(self):
+        """Compute the statistics model as tables indexed by tag ids
+        (for ``viterbi.viterbi_ids`` and ``viterbi.viterbi_trigram_ids``).
+
+        Tag ids are assigned in sorted order, so ``max()`` over ids breaks
+        ties like over the tag strings. Emission rows only store the tags
+        with non-zero probability as ``(ids, probs)``. The probabilities are
+        the same as in ``calc_statistics``."""
+        counts = self.counts
+        self.tags = sorted(self.pos_list_sentence)
+        self.tag_ids = tag_ids = {pos: i for i, pos in enumerate(self.tags)}
+        num_tags = len(self.tags)
+
+        self.initp_ids = array("d", [0.0]) * num_tags
+        for pos, count in counts.initial.items():
+            self.initp_ids[tag_ids[pos]] = count / counts.paragraphs
+
+        # trans_bi_ids[curr][prev] = p(curr|prev)
+        totals = Counter()
+        for (prev, _), count in counts.bigrams.items():
+            totals[prev] += count
+        self.trans_bi_ids = [array("d", [0.0]) * num_tags for _ in range(num_tags)]
+        for (prev, curr), count in counts.bigrams.items():
+            self.trans_bi_ids[tag_ids[curr]][tag_ids[prev]] = count / totals[prev]
+
+        # trans_tri_ids[prev1][curr][prev2] = p(curr|prev2,prev1)
+        totals = Counter()
+        for (prev2, prev1, _), count in counts.trigrams.items():
+            totals[prev2, prev1] += count
+        self.trans_tri_ids = [
+            [array("d", [0.0]) * num_tags for _ in range(num_tags)]
+            for _ in range(num_tags)
+        ]
+        for (prev2, prev1, curr), count in counts.trigrams.items():
+            self.trans_tri_ids[tag_ids[prev1]][tag_ids[curr]][tag_ids[prev2]] = (
+                count / totals[prev2, prev1]
+            )
+
+        # emiss_ids[word] = (ids, probs)
+        totals = Counter()
+        rows = {word: list() for word in self.word_list}
+        for (word, pos), count in counts.emissions.items():
+            totals[tag_ids[pos]] += count
+            rows[word].append((tag_ids[pos], count))
+
+        typecode = "B" if num_tags <= 256 else "H"
+        for word, row in rows.items():
+            row.sort()
+            self.emiss_ids[word] = (
+                array(typecode, (tag_id for tag_id, _ in row)),
+                array("d", (count / totals[tag_id] for tag_id, count in row)),
+            )
+        # custom dictionary words with fixed pos
+        for tag_id, pos in enumerate(self.tags):
+            self.emiss_ids["_" + pos] = (array(typecode, [tag_id]), array("d", [1.0]))
+
+    def calc_log_statistics(self, smoothing=DEFAULT_SMOOTHING, prune=DEFAULT_PRUNE):
+        """Compute a smoothed model with log-probabilities (for
+        ``viterbi.viterbi_log`` and ``viterbi.viterbi_trigram_log``).
+
+        Initial and transition probabilities use additive smoothing with
+        ``smoothing`` as pseudo count, unseen trigram contexts back off to the
+        bigram probabilities. Transitions less probable than ``prune`` are
+        removed (log-probability ``-inf``). Emission rows are the same
+        non-zero ``(ids, log-probs)`` as in ``emiss_ids``."""
+        if smoothing < 0 or not 0 <= prune < 1:
+            raise ValueError(
+                "Invalid smoothing/prune values: {}/{}".format(smoothing, prune)
+            )
+        if self.counts is None:
+            raise ValueError("No counts for the log model (compiled tables only).")
+        tags, tag_ids = self.tags, self.tag_ids
+        num_tags = len(tags)
+
+        def to_ids(key):
+            return tuple(tag_ids[pos] for pos in key)
+
+        counts = self.counts
+        initial = Counter({tag_ids[pos]: n for pos, n in counts.initial.items()})
+        bigrams = Counter({to_ids(key): n for key, n in counts.bigrams.items()})
+        trigrams = Counter({to_ids(key): n for key, n in counts.trigrams.items()})
+
+        bigram_contexts = Counter()
+        for (prev, _), count in bigrams.items():
+            bigram_contexts[prev] += count
+        trigram_contexts = Counter()
+        for (prev2, prev1, _), count in trigrams.items():
+            trigram_contexts[prev2, prev1] += count
+
+        def log_prob(count, total, pruned=True):
+            if total + smoothing * num_tags == 0:
+                return NEG_INF
+            prob = (count + smoothing) / (total + smoothing * num_tags)
+            if prob == 0 or (pruned and prob < prune):
+                return NEG_INF
+            return math.log(prob)
+
+        num_paragraphs = counts.paragraphs
+        initp = array(
+            "d",
+            (log_prob(initial[i], num_paragraphs, False) for i in range(num_tags)),
+        )
+
+        # trans_bi[curr][prev] = log p(curr|prev)
+        trans_bi = [
+            array(
+                "d",
+                (
+                    log_prob(bigrams[prev, curr], bigram_contexts[prev])
+                    for prev in range(num_tags)
+                ),
+            )
+            for curr in range(num_tags)
+        ]
+
+        # trans_tri[prev1][curr][prev2] = log p(curr|prev2,prev1)
+        trans_tri = list()
+        for prev1 in range(num_tags):
+            trans_tri.append(list())
+            for curr in range(num_tags):
+                row = array("d", [trans_bi[curr][prev1]]) * num_tags
+                for prev2 in range(num_tags):
+                    if trigram_contexts[prev2, prev1]:
+                        row[prev2] = log_prob(
+                            trigrams[prev2, prev1, curr], trigram_contexts[prev2, prev1]
+                        )
+                trans_tri[prev1].append(row)
+
+        emiss = {
+            word: (ids, array("d", (math.log(prob) for prob in probs)))
+            for word, (ids, probs) in self.emiss_ids.items()
+        }
+
+        self.log_model = (initp, trans_bi, trans_tri, emiss)
+        self.batch_models.pop("log", None)
+        self.split_caches.pop("log", None)
+
+    def freeze(self):
+        """Drop the raw corpus lists (if kept) and the tag string statistics
+        and make the word/tag lists immutable. Call once after training, e. g.
+        before forking worker processes that should share the model."""
+        self.corpus = list()
+        self.corpus_pos = list()
+        self.corpus_sentence = list()
+        self.statistics = None  # recomputed on demand
+
+        if isinstance(self.word_list, set):
+            self.word_list = frozenset(self.word_list)
+        self.pos_list = frozenset(self.pos_list)
+        self.pos_list_sentence = frozenset(self.pos_list_sentence)
+        self.get_vocabulary_index()
+
+    @classmethod
+    def from_tables(
+        cls,
+        tags,
+        pos_list,
+        word_list,
+        indexed_model,
+        log_model=None,
+        vocabulary_index=None,
+    ):
+        """Corpus that only has the compiled model tables, e. g. attached from
+        a model image (see ``shared_model``). ``indexed_model`` is the tuple
+        ``(initp_ids, trans_bi_ids, trans_tri_ids, emiss_ids)``, ``log_model``
+        like ``calc_log_statistics``. No counts, so the tag string
+        statistics (``get_statistics_model``) are not available."""
+        corpus = cls.__new__(cls)
+        corpus.orchid = corpus.model_file = None
+        corpus._lock = threading.Lock()
+        corpus.corpus = list()
+        corpus.corpus_pos = list()
+        corpus.corpus_sentence = list()
+        corpus.counts = None
+
+        corpus.word_list = word_list
+        corpus.pos_list = frozenset(pos_list)
+        corpus.pos_list_sentence = frozenset(tags)
+        corpus.vocabulary_index = vocabulary_index
+        corpus.statistics = None
+
+        corpus.tags = list(tags)
+        corpus.tag_ids = {pos: i for i, pos in enumerate(corpus.tags)}
+        (
+            corpus.initp_ids,
+            corpus.trans_bi_ids,
+            corpus.trans_tri_ids,
+            corpus.emiss_ids,
+        ) = indexed_model
+        corpus.log_model = log_model
+        corpus.batch_models = dict()
+        corpus.split_caches = dict()
+        corpus.boundary_corpora = dict()
+        corpus.space_model = None
+        return corpus
 
     def exists(self, word):
         return word in self.word_list
 
+    def get_vocabulary_index(self):
+        """Returns the (lazily built) VocabularyIndex over the word list."""
+        vocabulary_index = self.vocabulary_index
+        if vocabulary_index is None:
+            with self._lock:
+                if self.vocabulary_index is None:
+                    self.vocabulary_index = VocabularyIndex(self.word_list)
+                vocabulary_index = self.vocabulary_index
+        return vocabulary_index
+
     def get_corpus_pos(self):
-        return self.corpus_pos
+        """List of sentences (lists of ``(word, pos)``), read from the corpus
+        file again if not kept (see ``keep_corpus``)."""
+        if self.corpus_pos or self.model_file is not None:
+            return self.corpus_pos
+        return [sentence for paragraph in self.iter_corpus() for sentence in paragraph]
 
     def get_corpus_sentence(self):
-        return self.corpus_sentence
+        """List of paragraphs with sentence break tags (see ``paragraph_with_spaces``),
+        read from the corpus file again if not kept (see ``keep_corpus``)."""
+        if self.corpus_sentence or self.model_file is not None:
+            return self.corpus_sentence
+        return [paragraph_with_spaces(paragraph) for paragraph in self.iter_corpus()]
 
     def get_statistics_model(self, tri_gram=True):
+        statistics = self.statistics
+        if statistics is None:
+            if self.counts is None:
+                raise ValueError(
+                    "No counts for the statistics model (compiled tables only)."
+                )
+            with self._lock:
+                if self.statistics is None:
+                    self.calc_statistics()
+                statistics = self.statistics
+        initp, trans_bi, trans_tri, emiss = statistics
         if tri_gram:
-            return self.initp, self.trans_tri, self.emiss
+            return initp, trans_tri, emiss
         else:
-            return self.initp, self.trans_bi, self.emiss
+            return initp, trans_bi, emiss
+
+    @property
+    def initp(self):
+        return self.get_statistics_model()[0]
+
+    @property
+    def trans_bi(self):
+        return self.get_statistics_model(tri_gram=False)[1]
+
+    @property
+    def trans_tri(self):
+        return self.get_statistics_model()[1]
+
+    @property
+    def emiss(self):
+        return self.get_statistics_model()[2]
+
+    def get_indexed_model(self, tri_gram=True):
+        """Like ``get_statistics_model`` but indexed by tag ids, see ``tags``."""
+        if tri_gram:
+            return self.initp_ids, self.trans_tri_ids, self.emiss_ids
+        else:
+            return self.initp_ids, self.trans_bi_ids, self.emiss_ids
+
+    def get_log_model(self, tri_gram=True):
+        """Like ``get_indexed_model`` but the smoothed log-space model (see
+        ``calc_log_statistics``), for tri-grams ``trans`` is the pair
+        ``(trans_bi, trans_tri)``."""
+        log_model = self.log_model
+        if log_model is None:
+            with self._lock:
+                if self.log_model is None:
+                    self.calc_log_statistics()
+                log_model = self.log_model
+        initp, trans_bi, trans_tri, emiss = log_model
+        if tri_gram:
+            return initp, (trans_bi, trans_tri), emiss
+        else:
+            return initp, trans_bi, emiss
+
+    def get_batch_model(self, log=False):
+        """Array version of the bigram model for ``viterbi.viterbi_ids_batch``
+        (or with ``log`` the log-space model for ``viterbi.viterbi_log_batch``),
+        requires NumPy.
+
+        Returns ``(initp, trans, emiss_rows, emiss)`` with ``trans[curr, prev]``,
+        the padded emission rows ``emiss = (ids, probs, sizes)`` (see
+        ``viterbi``) and the dict ``emiss_rows`` of the row of each word."""
+        if numpy is None:
+            raise ValueError("Batch decoding requires numpy to be installed")
+        key = "log" if log else "ids"
+        batch_model = self.batch_models.get(key)
+        if batch_model is None:
+            if log:
+                initp, trans, emiss = self.get_log_model(tri_gram=False)
+            else:
+                initp, trans, emiss = self.get_indexed_model(tri_gram=False)
+            with self._lock:
+                batch_model = self.batch_models.get(key)
+                if batch_model is None:
+                    batch_model = self._calc_batch_model(initp, trans, emiss, log)
+                    self.batch_models[key] = batch_model
+        return batch_model
+
+    def get_boundary_corpus(self, smoothing=None):
+        """Corpus (model) over the tag classes that matter for sentence
+        segmentation (``BOUNDARY_CLASSES``, all other tags are
+        ``BOUNDARY_OTHER``), built from the counts on first use. Much fewer
+        states than the full model, for ``sentence_segmenter.sentence_segment``
+        with ``boundary_only``. The fixed tags of custom and unknown words
+        (``"_" + tag``) emit the class of the tag. With ``smoothing`` also
+        the log-space model is computed (see ``calc_log_statistics``)."""
+        boundary_corpus = self.boundary_corpora.get(smoothing)
+        if boundary_corpus is None:
+            if self.counts is None:
+                raise ValueError(
+                    "No counts for the boundary model (compiled tables only)."
+                )
+            with self._lock:
+                boundary_corpus = self.boundary_corpora.get(smoothing)
+                if boundary_corpus is None:
+                    boundary_corpus = self._calc_boundary_corpus(smoothing)
+                    self.boundary_corpora[smoothing] = boundary_corpus
+        return boundary_corpus
+
+    def _calc_boundary_corpus(self, smoothing):
+        corpus = orchid_corpus(
+            file_name=self.orchid, counts=self.counts.map_tags(boundary_class)
+        )
+        emiss = corpus.emiss_ids
+        for pos in self.tags:
+            emiss["_" + pos] = emiss["_" + boundary_class(pos)]
+        if smoothing is not None:
+            corpus.calc_log_statistics(smoothing=smoothing)
+        return corpus
+
+    def get_space_model(self):
+        """Model for classifying spaces as sentence breaks without decoding
+        (``sentence_segmenter.tag_spaces``), built from the counts on first use.
+
+        Returns ``(word_tags, sbs)``: the most frequent tag of every word and
+        the set of ``(prev_tag, next_tag)`` pairs (tags of the words around a
+        space) for which the space is more likely "SBS" than "NSBS". That is
+        the share of "SBS" in the tag trigrams ``(prev_tag, space, next_tag)``,
+        with a naive Bayes estimate from the tag bigrams as prior (weighted
+        ``SPACE_PRIOR_WEIGHT``) for rare and unseen tag pairs. A tag is
+        ``None`` for words without counts, the pairs with ``None`` use the
+        tag bigrams of the other side only."""
+        space_model = self.space_model
+        if space_model is None:
+            if self.counts is None:
+                raise ValueError(
+                    "No counts for the space classifier (compiled tables only)."
+                )
+            with self._lock:
+                if self.space_model is None:
+                    self.space_model = self._calc_space_model()
+                space_model = self.space_model
+        return space_model
+
+    def _calc_space_model(self):
+        counts = self.counts
+        best = dict()
+        for (word, pos), count in counts.emissions.items():
+            if (count, pos) > best.get(word, (0, "")):
+                best[word] = (count, pos)
+        word_tags = {word: pos for word, (_, pos) in best.items()}
+
+        labels = ("SBS", "NSBS")
+        alpha, num_tags = SPACE_SMOOTHING, len(self.tags)
+
+        def naive_bayes(prev, curr):
+            scores = list()
+            for label in labels:
+                total = counts.tags[label]
+                norm = total + alpha * num_tags
+                scores.append(
+                    total
+                    * (counts.bigrams[prev, label] + alpha)
+                    / norm
+                    * (counts.bigrams[label, curr] + alpha)
+                    / norm
+                )
+            return scores[0] / sum(scores) if sum(scores) else 0.0
+
+        def label_counts(prev, curr):
+            if prev is None and curr is None:
+                return [counts.tags[label] for label in labels]
+            if curr is None:
+                return [counts.bigrams[prev, label] for label in labels]
+            if prev is None:
+                return [counts.bigrams[label, curr] for label in labels]
+            return [counts.trigrams[prev, label, curr] for label in labels]
+
+        sbs = set()
+        tags = [pos for pos in self.tags if pos not in labels] + [None]
+        for prev in tags:
+            for curr in tags:
+                count_sbs, count_nsbs = label_counts(prev, curr)
+                if prev is None or curr is None:
+                    prior = (count_sbs + alpha) / (count_sbs + count_nsbs + 2 * alpha)
+                else:
+                    prior = naive_bayes(prev, curr)
+                prob = (count_sbs + SPACE_PRIOR_WEIGHT * prior) / (
+                    count_sbs + count_nsbs + SPACE_PRIOR_WEIGHT
+                )
+                if prob > 0.5:
+                    sbs.add((prev, curr))
+        return word_tags, frozenset(sbs)
+
+    def get_split_cache(self, log=False):
+        """The cache (``SizedLRUCache``, bounded by ``SPLIT_CACHE_BYTES``) that
+        memoizes decoded pieces for ``viterbi.viterbi_split`` with the bigram
+        (or with ``log`` the log-space) model."""
+        key = "log" if log else "ids"
+        cache = self.split_caches.get(key)
+        if cache is None:
+            with self._lock:
+                cache = self.split_caches.get(key)
+                if cache is None:
+                    cache = SizedLRUCache(max_bytes=SPLIT_CACHE_BYTES)
+                    self.split_caches[key] = cache
+        return cache
+
+    def _calc_batch_model(self, initp, trans, emiss, log):
+        last_tag = len(self.tags) - 1
+        rows = list()
+        for ids, probs in emiss.values():
+            row = dict(zip(ids, probs))
+            if not log:  # the fallback state of viterbi_ids
+                row.setdefault(last_tag, 0.0)
+            rows.append(sorted(row.items()))
+
+        width = max(len(row) for row in rows)
+        ids = numpy.zeros((len(rows), width), dtype=numpy.intp)
+        probs = numpy.full((len(rows), width), NEG_INF if log else 0.0)
+        sizes = numpy.zeros(len(rows), dtype=numpy.intp)
+        for index, row in enumerate(rows):
+            sizes[index] = len(row)
+            if row:
+                ids[index, -len(row) :] = [tag_id for tag_id, _ in row]  # noqa: E203
+                probs[index, -len(row) :] = [prob for _, prob in row]  # noqa: E203
+
+        emiss_rows = {word: index for index, word in enumerate(emiss)}
+        initp = numpy.array(initp, dtype=numpy.float64)
+        trans = numpy.array([numpy.array(row) for row in trans], dtype=numpy.float64)
+        return initp, trans, emiss_rows, (ids, probs, sizes)
 
     def test_print(self):
         # TODO: check etc.
         with open("test/sentence_seg", "w", encoding="utf-8") as fout:
-            fout.write(str(self.corpus_sentence))
+            fout.write(str(self.get_corpus_sentence()))
 
 
 # initial pos map
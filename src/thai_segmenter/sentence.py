@@ -1,17 +1,130 @@
 import ast
+import json
+import struct
+import sys
+import threading
+from array import array
 
+# ----------------------------------------------------------------------------
+
+# interned tag table, shared by all sentence objects (ids fit into a byte)
+# pre-seeded with the ORCHID tags, so ids are the same in every process
+# fmt: off
+TAGS = [
+    "ADVI", "ADVN", "ADVP", "ADVS", "CFQC", "CLTV", "CMTR", "CNIT", "CVBL",
+    "DCNM", "DDAC", "DDAN", "DDAQ", "DDBQ", "DIAC", "DIAQ", "DIBQ", "DONM",
+    "EAFF", "EITT", "FIXN", "FIXV", "INT", "JCMP", "JCRG", "JSBR", "NCMN",
+    "NCNM", "NEG", "NLBL", "NONM", "NPRP", "NSBS", "NTTL", "PDMN", "PNTR",
+    "PPRS", "PREL", "PUNC", "RPRE", "SBS", "VACT", "VATT", "VSTA", "XVAE",
+    "XVAM", "XVBB", "XVBM", "XVMM",
+]
+# fmt: on
+TAG_IDS = {tag: i for i, tag in enumerate(TAGS)}
+_TAGS_LOCK = threading.Lock()
+
+
+def tag_to_id(tag):
+    """Return the id of the tag, interns unknown tags."""
+    tid = TAG_IDS.get(tag)
+    if tid is None:
+        with _TAGS_LOCK:
+            tid = TAG_IDS.get(tag)
+            if tid is None:
+                if len(TAGS) >= 256:
+                    raise ValueError("Too many distinct tags (max 256): {}".format(tag))
+                # append first, the id is only visible once it is valid
+                TAGS.append(tag)
+                tid = TAG_IDS[tag] = len(TAGS) - 1
+    return tid
+
+
+# binary header: number of tokens, length of text (bytes), length of content
+# (bytes, or 0xFFFFFFFF if same as text), length of tag names (bytes)
+_HEADER = struct.Struct("<IIII")
+_SAME_CONTENT = 0xFFFFFFFF
+
+
+class sentence(object):
+    """A (segmented / tagged) sentence.
+
+    Stores the token text once, token boundaries as character offsets in an
+    ``array("I")`` and the tags as ids into the interned ``TAGS`` table.
+    ``pos`` returns the list of ``(word, tag)`` tuples on demand.
+
+    Construct with ``sentence(content, [(word, tag), ...])`` or deserialize
+    with ``sentence.from_json`` / ``sentence.from_bytes``.
+    """
+
+    __slots__ = ("text", "_content", "offsets", "tag_ids")
 
-class sentence:
     def __init__(self, *args, **kwargs):
+        self.text = ""
+        self._content = None
+        self.offsets = array("I", [0])
+        self.tag_ids = b""
+
         if len(args) == 2:
             (sentence_content, sentence_pos) = args
-            self.content = sentence_content
             self.pos = sentence_pos
+            self.content = sentence_content
 
         elif "from_str" in kwargs:
-            attributes = ast.literal_eval(kwargs["from_str"])
-            for key in attributes:
-                setattr(self, key, attributes[key])
+            # legacy: repr() output, better use to_json/from_json
+            value = kwargs["from_str"]
+            if value.startswith('{"'):
+                attributes = json.loads(value)
+            else:
+                attributes = ast.literal_eval(value)
+            self.pos = attributes.get("pos", ())
+            self.content = attributes.get("content", self.text)
+
+    # ------------------------------------
+
+    @property
+    def content(self):
+        return self.text if self._content is None else self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = None if value == self.text else value
+
+    @property
+    def pos(self):
+        """List of ``(word, tag)`` tuples."""
+        return list(zip(self.words(), self.tags()))
+
+    @pos.setter
+    def pos(self, word_pos):
+        words = list()
+        offsets = array("I", [0])
+        tag_ids = bytearray()
+        end = 0
+        for word_tag in word_pos:
+            word, tag = word_tag[0], word_tag[1]
+            words.append(word)
+            end += len(word)
+            offsets.append(end)
+            tag_ids.append(tag_to_id(tag))
+
+        self.text = "".join(words)
+        self.offsets = offsets
+        self.tag_ids = bytes(tag_ids)
+        if self._content == self.text:
+            self._content = None
+
+    def __len__(self):
+        """Number of tokens."""
+        return len(self.tag_ids)
+
+    def words(self):
+        """Yields the tokens."""
+        text, offsets = self.text, self.offsets
+        for i in range(len(self.tag_ids)):
+            yield text[offsets[i] : offsets[i + 1]]  # noqa: E203
+
+    def tags(self):
+        """Yields the tags of the tokens."""
+        return (TAGS[tid] for tid in self.tag_ids)
 
     def __str__(self):
         return self.content
@@ -22,3 +135,86 @@ class sentence:
         represent["pos"] = self.pos
 
         return repr(represent)
+
+    # ------------------------------------
+
+    def to_json(self):
+        """Serialize to a JSON string (``{"content", "offsets", "tags"}``)."""
+        data = {
+            "content": self.content,
+            "offsets": self.offsets.tolist(),
+            "tags": list(self.tags()),
+        }
+        if self._content is not None:
+            data["text"] = self.text
+        return json.dumps(data, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, value):
+        """Deserialize from a string created with ``to_json``."""
+        data = json.loads(value)
+        obj = cls()
+        obj.text = data.get("text", data["content"])
+        obj.offsets = array("I", data["offsets"])
+        obj.tag_ids = bytes(tag_to_id(tag) for tag in data["tags"])
+        obj.content = data["content"]
+        return obj
+
+    def to_bytes(self):
+        """Serialize to a compact binary representation.
+        The tag names used are stored with it, so it can be read by any process."""
+        # map global tag ids to local ids (in order of first occurrence)
+        local_ids = dict()
+        for tid in self.tag_ids:
+            local_ids.setdefault(tid, len(local_ids))
+        tag_names = "\n".join(TAGS[tid] for tid in local_ids).encode("utf-8")
+        tag_ids = bytes(local_ids[tid] for tid in self.tag_ids)
+
+        text = self.text.encode("utf-8")
+        content = b"" if self._content is None else self._content.encode("utf-8")
+        content_len = _SAME_CONTENT if self._content is None else len(content)
+
+        offsets = array("I", self.offsets)
+        if sys.byteorder != "little":
+            offsets.byteswap()
+
+        return b"".join(
+            [
+                _HEADER.pack(len(tag_ids), len(text), content_len, len(tag_names)),
+                text,
+                content,
+                tag_names,
+                offsets.tobytes(),
+                tag_ids,
+            ]
+        )
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Deserialize from ``to_bytes`` output."""
+        num_tokens, text_len, content_len, names_len = _HEADER.unpack_from(data)
+        pos = _HEADER.size
+
+        obj = cls()
+        obj.text = bytes(data[pos : pos + text_len]).decode("utf-8")  # noqa: E203
+        pos += text_len
+        if content_len != _SAME_CONTENT:
+            content = data[pos : pos + content_len]  # noqa: E203
+            obj._content = bytes(content).decode("utf-8")
+            pos += content_len
+
+        names = bytes(data[pos : pos + names_len]).decode("utf-8")  # noqa: E203
+        pos += names_len
+        local_to_global = [tag_to_id(name) for name in names.split("\n") if names]
+
+        offsets = array("I")
+        offsets.frombytes(data[pos : pos + 4 * (num_tokens + 1)])  # noqa: E203
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        obj.offsets = offsets
+        pos += 4 * (num_tokens + 1)
+
+        obj.tag_ids = bytes(
+            local_to_global[lid] for lid in data[pos : pos + num_tokens]  # noqa: E203
+        )
+        return obj
@@ -1,7 +1,6 @@
 from __future__ import print_function
 
 import codecs
-import os
 import sys  # noqa: F401
 import time  # noqa: F401
 
@@ -10,77 +9,125 @@ from thai_segmenter import sentence as sentence
 from thai_segmenter import viterbi as vtb
 from thai_segmenter import word_processing as wp
 
+# how sentence breaks are found: POS tagging of all words (Viterbi) or by
+# classifying only the spaces (see sentence_segmenter.tag_spaces)
+SENTENCE_BREAKS = ("viterbi", "spaces")
+
 
 class sentence_segmenter:
+    """Sentence segmentation (with tokenization and POS tagging).
+
+    Concurrency: one segmenter can be shared by any number of threads (or
+    greenlets). The model (dictionary tries, probability tables) is only
+    read while segmenting, every call keeps its decoding state (token
+    offsets, Viterbi tables) in local objects, so calls do not lock or
+    interfere with each other. Parts built on first use are built once
+    under a lock. Custom words (``set_custom_dict``) are swapped atomically,
+    calls in progress finish with the previous words.
+    """
+
     data_dir = "tools"
     filename_lexitron = "lexitron_original.txt"
-    filename_dictionary = "custom_dict_word.txt"
     filename_orchid = "orchid_words.txt"
 
-    def __init__(self, corpus=None, custom_dict=dict()):
+    def __init__(
+        self,
+        corpus=None,
+        custom_dict=dict(),
+        engine="longlexto",
+        smoothing=None,
+        tokenizer_words=None,
+        split_decoding=False,
+    ):
         if corpus is None:
-            corpus = orch.orchid_corpus()
+            corpus = orch.orchid_corpus(smoothing=smoothing)
+        elif smoothing is not None and corpus.log_model is None:
+            corpus.calc_log_statistics(smoothing=smoothing)
         self.corpus = corpus
+        # with smoothing, tag with the log-space model (see orchid_corpus.calc_log_statistics)
+        self.smoothing = smoothing
+        # decode bigrams piece by piece (see viterbi.viterbi_split), faster but
+        # ties may be broken differently than by viterbi.viterbi_ids
+        self.split_decoding = split_decoding
+
+        self.dict_name = sentence_segmenter.filename_lexitron
+        self.wp = wp.word_processing(
+            self.dict_name,
+            sentence_segmenter.filename_orchid,
+            engine=engine,
+            tokenizer_words=tokenizer_words,
+        )
 
-        self.custom_dict = custom_dict
-        if custom_dict is not None:
+        self.custom_dict = dict()
+        if custom_dict:
             self.set_custom_dict(custom_dict)
-        else:
-            self.dict_name = sentence_segmenter.filename_lexitron
 
-        self.wp = wp.word_processing(self.dict_name, sentence_segmenter.filename_orchid)
+    def freeze(self):
+        """Compact the model into immutable structures (tries, word lists) and
+        drop data only needed for training. The segmenter stays fully usable."""
+        self.wp.freeze()
+        self.corpus.freeze()
+
+    # ------------------------------------
 
     def set_custom_dict(self, custom_dict):
-        word_list = set()
-        filename = os.path.join(
-            os.path.dirname(__file__),
-            sentence_segmenter.data_dir,
-            sentence_segmenter.filename_lexitron,
-        )
-        with codecs.open(filename, "r", encoding="utf-8") as f:
-            for line in f:
-                word_list.add(line.strip())
-        for word in custom_dict:
-            word_list.add(word)
-
-        filename = os.path.join(
-            os.path.dirname(__file__),
-            sentence_segmenter.data_dir,
-            sentence_segmenter.filename_dictionary,
-        )
-        with codecs.open(filename, "w", encoding="utf-8") as f:
-            for word in word_list:
-                f.write(word + "\n")
-        self.dict_name = sentence_segmenter.filename_dictionary
+        """Replace the custom words, ``{word: {"pos": tag or None}}``.
+
+        Can be called on a live segmenter: the words are an overlay over the
+        dictionary trie and the dict is swapped, never changed in place."""
+        custom_dict = {
+            word: {"pos": (info or dict()).get("pos")}
+            for word, info in custom_dict.items()
+            if word
+        }
+        for word, info in custom_dict.items():
+            if info["pos"] is not None and info["pos"] not in self.corpus.pos_list:
+                raise ValueError("Unknown POS tag for {}: {}".format(word, info["pos"]))
+
+        self.wp.set_custom_words(custom_dict)
+        self.custom_dict = custom_dict
+
+    def add_custom_word(self, word, pos=None):
+        """Add (or replace) a custom word with an optional POS tag."""
+        custom_dict = dict(self.custom_dict)
+        custom_dict[word] = {"pos": pos}
+        self.set_custom_dict(custom_dict)
+
+    def remove_custom_word(self, word):
+        """Remove a custom word, returns False if it was not a custom word."""
+        if word not in self.custom_dict:
+            return False
+        custom_dict = dict(self.custom_dict)
+        del custom_dict[word]
+        self.set_custom_dict(custom_dict)
+        return True
 
     def clean_unknown_word(self, sentence):
         new_word_list = list()
         to_be_tagged = list()
         replace_idx = list()
         last_idx = -1
+        vocabulary_index = self.corpus.get_vocabulary_index()
+        custom_dict = self.custom_dict  # may be swapped at any time
 
         for word in sentence:
-            if word in self.custom_dict and self.custom_dict[word]["pos"] is not None:
+            if word in custom_dict and custom_dict[word]["pos"] is not None:
                 new_word_list.append(word)
-                to_be_tagged.append("_" + self.custom_dict[word]["pos"])
+                to_be_tagged.append("_" + custom_dict[word]["pos"])
             elif not self.corpus.exists(word):
-                subwords = self.wp.word_segment_subwords(word)
-                valid_first = True
-                valid_all = True
-
-                for i in range(len(subwords)):
-                    if not self.corpus.exists(subwords[i]):
-                        if i == 0:
-                            valid_first = False
-                        valid_all = False
-                        break
-
-                if valid_all:  # don't split this word if it exists in custom dict
+                # split into known subwords, else tag like its longest known prefix
+                # (English, digits and special characters are not split)
+                if word[0] <= "~":
+                    subwords, prefix_len = None, 0
+                else:
+                    subwords, prefix_len = vocabulary_index.split(word)
+
+                if subwords is not None:  # all subwords known
                     new_word_list.extend(subwords)
                     to_be_tagged.extend(subwords)
-                elif valid_first:
+                elif prefix_len > 0:
                     new_word_list.append(word)
-                    to_be_tagged.append(subwords[0])
+                    to_be_tagged.append(word[:prefix_len])
                 else:
                     new_word_list.append(word)
                     to_be_tagged.append("_NCMN")
@@ -98,15 +145,16 @@ class sentence_segmenter:
         new_pos = []
         noun_tag = ["NPRP", "NCNM", "NONM", "NLBL", "NCMN", "NTTL"]
         count = 0
+        custom_dict = self.custom_dict  # may be swapped at any time
 
         for idx in reverse_idx:
             start, end = idx[0], idx[1]
             original_word = "".join(broken_words[start : (end + 1)])  # noqa: E203
             if (
-                original_word in self.custom_dict
-                and self.custom_dict[original_word]["pos"] is not None
+                original_word in custom_dict
+                and custom_dict[original_word]["pos"] is not None
             ):
-                new_pos.append(self.custom_dict[original_word]["pos"])
+                new_pos.append(custom_dict[original_word]["pos"])
             elif start != end:
                 # print(original_word)
                 noun_count = 0
@@ -181,45 +229,314 @@ class sentence_segmenter:
 
         return new_sentences, new_sen_with_pos
 
-    def sentence_segment(self, paragraph, tri_gram=False):
-        # time_start = time.time()
+    def cut_sentence_spans(self, pos):
+        """Like ``cut_sentence`` but returns ``(start, end)`` token index spans
+        of the fragments between "SBS" tokens (end exclusive)."""
+        spans = []
+        start = 0
+
+        for i, tag in enumerate(pos):
+            if tag == "SBS":
+                spans.append((start, i))
+                start = i + 1
+
+        if start < len(pos):
+            spans.append((start, len(pos)))
+
+        return spans
+
+    def merge_sentence_spans(self, pos, spans):
+        """Like ``merge_sentence`` but works on fragment spans (see ``cut_sentence_spans``)
+        and returns the token index spans of the merged sentences. Merged spans
+        include the "SBS" tokens between their fragments."""
+        if not spans:
+            return []
+
+        merged = [list(spans[0])]
+
+        for start, end in spans[1:]:
+            length = end - start
+            first_pos = pos[start] if length > 0 else None
+            last_word_len = merged[-1][1] - merged[-1][0]
+
+            merge = False
+            cut_idx = 0
+            if first_pos == "JCRG" or first_pos == "JCMP":
+                merge = True
+            elif first_pos == "JSBR":
+                if length + last_word_len < 50 or length < 10:
+                    merge = True
+                elif length > 2:
+                    # remove conjunction (with space, if any)
+                    cut_idx = 1 if pos[start + 1] != "NSBS" else 2
+
+            if merge:
+                merged[-1][1] = end
+            else:
+                merged.append([start + cut_idx, end])
+
+        return [tuple(span) for span in merged]
+
+    def span_to_sentence(self, words, pos, span):
+        """Build the ``(content, [(word, pos), ...])`` of a sentence span,
+        inner "SBS" tokens are written as non-breaking spaces."""
+        start, end = span
+        sen_with_pos = [
+            (" ", "NSBS") if pos[i] == "SBS" else (words[i], pos[i])
+            for i in range(start, end)
+        ]
+        content = "".join(word for word, _ in sen_with_pos)
+        return content, sen_with_pos
+
+    def pos_tag(self, to_be_tagged, tri_gram=False, boundary_only=False):
+        """Most probable POS tag sequence for the cleaned words (see ``clean_unknown_word``).
+
+        With ``split_decoding`` (see ``__init__``) bigram decoding is split at
+        words with a single possible tag (English, numbers, most punctuation),
+        see ``viterbi.viterbi_split``. With ``boundary_only`` the tags are
+        only the classes of the boundary model (see
+        ``orchid_corpus.get_boundary_corpus``)."""
+        corpus = self.corpus
+        if boundary_only:
+            corpus = corpus.get_boundary_corpus(smoothing=self.smoothing)
+
+        log = self.smoothing is not None
+        if log:
+            initp, trans, emiss = corpus.get_log_model(tri_gram)
+        else:
+            initp, trans, emiss = corpus.get_indexed_model(tri_gram)
+
+        if tri_gram:
+            if log:
+                path = vtb.viterbi_trigram_log(to_be_tagged, initp, trans, emiss)
+            else:
+                path = vtb.viterbi_trigram_ids(to_be_tagged, initp, trans, emiss)
+        elif self.split_decoding:
+            cache = corpus.get_split_cache(log=log)
+            path = vtb.viterbi_split(to_be_tagged, initp, trans, emiss, log, cache)
+        elif log:
+            path = vtb.viterbi_log(to_be_tagged, initp, trans, emiss)
+        else:
+            path = vtb.viterbi_ids(to_be_tagged, initp, trans, emiss)
+
+        tags = corpus.tags
+        return [tags[tag_id] for tag_id in path]
+
+    def pos_tag_batch(self, to_be_tagged_list, tri_gram=False, boundary_only=False):
+        """Like ``pos_tag`` for a list of sentences (cleaned words), decoded
+        together (see ``viterbi.viterbi_ids_batch``). Without NumPy or with
+        tri-grams one after the other."""
+        if tri_gram or vtb.numpy is None:
+            return [
+                self.pos_tag(
+                    to_be_tagged, tri_gram=tri_gram, boundary_only=boundary_only
+                )
+                for to_be_tagged in to_be_tagged_list
+            ]
+
+        corpus = self.corpus
+        if boundary_only:
+            corpus = corpus.get_boundary_corpus(smoothing=self.smoothing)
+
+        log = self.smoothing is not None
+        initp, trans, emiss_rows, emiss = corpus.get_batch_model(log=log)
+        lengths = [len(to_be_tagged) for to_be_tagged in to_be_tagged_list]
+        obs = vtb.numpy.zeros(
+            (len(lengths), max(lengths, default=0) or 1), dtype=vtb.numpy.intp
+        )
+        for row, to_be_tagged in enumerate(to_be_tagged_list):
+            obs[row, : len(to_be_tagged)] = [emiss_rows[word] for word in to_be_tagged]
+
+        if log:
+            paths = vtb.viterbi_log_batch(obs, lengths, initp, trans, emiss)
+        else:
+            paths = vtb.viterbi_ids_batch(obs, lengths, initp, trans, emiss)
+
+        tags = corpus.tags
+        return [[tags[tag_id] for tag_id in path] for path in paths]
+
+    def tag_spaces(self, words):
+        """Tags of the cleaned words (see ``wp.clean_special_characters``)
+        without decoding: the most frequent tag of every word (unknown words
+        "NCMN") and "SBS"/"NSBS" for the spaces, classified by the tags of
+        the words before and after (see ``orchid_corpus.get_space_model``).
+        Only the first space of a run can be "SBS"."""
+        word_tags, sbs = self.corpus.get_space_model()
+        custom_dict = self.custom_dict  # may be swapped at any time
+
+        context = list()  # None for unknown words
+        for word in words:
+            info = custom_dict.get(word)
+            if info is not None and info["pos"] is not None:
+                context.append(info["pos"])
+            else:
+                context.append(word_tags.get(word))
+        pos = ["NCMN" if tag is None else tag for tag in context]
+
+        prev = None  # tag of the word before the current spaces
+        first_space = None
+        for i, word in enumerate(words):
+            if word == "<space>":
+                pos[i] = "NSBS"
+                if first_space is None and i > 0:  # not leading spaces
+                    first_space = i
+                continue
+            if first_space is not None and (prev, context[i]) in sbs:
+                pos[first_space] = "SBS"
+            first_space = None
+            prev = context[i]
+
+        return pos
+
+    def tag_paragraph(
+        self, paragraph, tri_gram=False, boundary_only=False, breaks="viterbi"
+    ):
+        """Tokenize and tag (with "SBS"/"NSBS") the paragraph, returns the lists ``words, pos``.
+
+        With ``boundary_only`` tag with the (much smaller) model of the tag
+        classes that matter for sentence segmentation, see ``pos_tag``. With
+        ``breaks="spaces"`` only classify the spaces (see ``tag_spaces``)."""
+        _check_breaks(breaks)
         # preprocess
         words = self.wp.word_segment_words(paragraph)
-        # time_seg = time.time() - time_start
         tmp_paragraph = self.wp.clean_special_characters(words)
+        if breaks == "spaces":
+            pos = self.tag_spaces(tmp_paragraph)
+            if boundary_only:
+                pos = [orch.boundary_class(tag) for tag in pos]
+            return words, pos
+
         to_be_tagged, new_paragraph, replace_idx = self.clean_unknown_word(
             tmp_paragraph
         )
 
         # call viterbi function to get most possible pos sequence
-        initp, trans, emiss = self.corpus.get_statistics_model(tri_gram)
-
-        if tri_gram:
-            path = vtb.viterbi_trigram(
-                to_be_tagged, self.corpus.pos_list_sentence, initp, trans, emiss
-            )
-        else:
-            path = vtb.viterbi(
-                to_be_tagged, self.corpus.pos_list_sentence, initp, trans, emiss
-            )
-            # for i in range(len(path)):
-            #   print(to_be_tagged[i] + "\t\t" + path[i])
+        path = self.pos_tag(
+            to_be_tagged, tri_gram=tri_gram, boundary_only=boundary_only
+        )
 
         # postprocess
         pos = self.invert_unknown_word(new_paragraph, path, replace_idx)
-        sentences, sen_with_pos = self.cut_sentence(words, pos)
-        merge_sen, merge_sen_with_pos = self.merge_sentence(sentences, sen_with_pos)
+        if boundary_only:  # tags of custom words
+            pos = [orch.boundary_class(tag) for tag in pos]
+
+        return words, pos
+
+    def tag_paragraphs(
+        self, paragraphs, tri_gram=False, boundary_only=False, breaks="viterbi"
+    ):
+        """Like ``tag_paragraph`` for a list of paragraphs, the POS tags of all
+        are decoded together (see ``pos_tag_batch``). With ``breaks="spaces"``
+        one after the other."""
+        _check_breaks(breaks)
+        if breaks == "spaces":
+            return [
+                self.tag_paragraph(
+                    paragraph, boundary_only=boundary_only, breaks=breaks
+                )
+                for paragraph in paragraphs
+            ]
+
+        # preprocess
+        words_list = [self.wp.word_segment_words(paragraph) for paragraph in paragraphs]
+        cleaned = [
+            self.clean_unknown_word(self.wp.clean_special_characters(words))
+            for words in words_list
+        ]
+
+        paths = self.pos_tag_batch(
+            [to_be_tagged for to_be_tagged, _, _ in cleaned],
+            tri_gram=tri_gram,
+            boundary_only=boundary_only,
+        )
 
-        # time_rest = time.time() - time_start - time_seg
-        # print('java: {:.4f}, rest: {:.4f}'.format(time_seg, time_rest), file=sys.stderr)
+        # postprocess
+        tagged = list()
+        for words, (_, new_paragraph, replace_idx), path in zip(
+            words_list, cleaned, paths
+        ):
+            pos = self.invert_unknown_word(new_paragraph, path, replace_idx)
+            if boundary_only:  # tags of custom words
+                pos = [orch.boundary_class(tag) for tag in pos]
+            tagged.append((words, pos))
+        return tagged
+
+    def sentence_segment_spans(
+        self, paragraph, tri_gram=False, boundary_only=False, breaks="viterbi"
+    ):
+        """Sentence segmentation that returns token index spans instead of sentence objects.
+
+        Returns ``words, pos, fragment_spans, sentence_spans`` where the spans are
+        ``(start, end)`` index ranges into ``words``/``pos``."""
+        words, pos = self.tag_paragraph(
+            paragraph, tri_gram=tri_gram, boundary_only=boundary_only, breaks=breaks
+        )
+        fragment_spans = self.cut_sentence_spans(pos)
+        sentence_spans = self.merge_sentence_spans(pos, fragment_spans)
+
+        return words, pos, fragment_spans, sentence_spans
+
+    def sentence_segment(
+        self, paragraph, tri_gram=False, boundary_only=False, breaks="viterbi"
+    ):
+        """Segment the paragraph into ``sentence`` objects. With ``boundary_only``
+        faster, but the tags are only the tag classes of the boundary model
+        (see ``orchid_corpus.get_boundary_corpus``). With ``breaks="spaces"``
+        much faster, the spaces are classified instead of tagging all words
+        (see ``tag_spaces``), the tags are the most frequent tags of the words."""
+        words, pos, _, sentence_spans = self.sentence_segment_spans(
+            paragraph, tri_gram=tri_gram, boundary_only=boundary_only, breaks=breaks
+        )
 
-        # return sentences, sen_with_pos
-        # return merge_sen, merge_sen_with_pos
-        # return [sentence.sentence(sentences[i], sen_with_pos[i]) for i in range(len(sentences))]
         return [
-            sentence.sentence(merge_sen[i], merge_sen_with_pos[i])
-            for i in range(len(merge_sen))
+            sentence.sentence(*self.span_to_sentence(words, pos, span))
+            for span in sentence_spans
         ]
 
+    def sentence_segment_batch(
+        self, paragraphs, tri_gram=False, boundary_only=False, breaks="viterbi"
+    ):
+        """Like ``sentence_segment`` for a list of paragraphs, returns a list of
+        ``sentence`` objects for each, tagged together (see ``tag_paragraphs``)."""
+        segmented = list()
+        for words, pos in self.tag_paragraphs(
+            paragraphs, tri_gram=tri_gram, boundary_only=boundary_only, breaks=breaks
+        ):
+            sentence_spans = self.merge_sentence_spans(
+                pos, self.cut_sentence_spans(pos)
+            )
+            segmented.append(
+                [
+                    sentence.sentence(*self.span_to_sentence(words, pos, span))
+                    for span in sentence_spans
+                ]
+            )
+        return segmented
+
     def get_stats(self):
         return self.initp, self.trans_bi, self.trans_tri, self.emiss
+
+
+def _check_breaks(breaks):
+    if breaks not in SENTENCE_BREAKS:
+        raise ValueError(
+            "Unknown sentence break method: {} (choices: {})".format(
+                breaks, ", ".join(SENTENCE_BREAKS)
+            )
+        )
+
+
+def read_custom_dict(filename):
+    """Read a custom dictionary file, one word per line with an optional
+    POS tag after a tab, empty lines and lines starting with "#" are skipped."""
+    custom_dict = dict()
+    with codecs.open(filename, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split("\t")
+            word = parts[0].strip()
+            pos = parts[1].strip() if len(parts) > 1 and parts[1].strip() else None
+            custom_dict[word] = {"pos": pos}
+    return custom_dict
@@ -0,0 +1,411 @@
+"""Share the compiled model of a segmenter between processes without copies.
+
+The parent process writes the compiled model (dictionary tries, tag
+transition and emission tables) once into a model image, either a file
+(``write_model_image``) or a ``multiprocessing.shared_memory`` block
+(``share_model``). Worker processes (also with the ``spawn`` start method)
+attach to it in milliseconds with ``attach_segmenter``, the tables are
+read-only views into the mapped memory instead of being rebuilt from text.
+
+Usage:
+
+    with share_model(get_segmenter()) as shared:
+        with multiprocessing.Pool(initializer=init_worker, initargs=(shared.name,)) as pool:
+            pool.map(sentence_segment, lines)
+
+The image uses the native byte order, it is meant for processes on the
+same machine. Marisa tries (if installed) are loaded from the image with
+one small copy, all other tables are used in place.
+"""
+import json
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Mapping
+
+from thai_segmenter.longlexto import ENGINES
+from thai_segmenter.longlexto import FrozenTrie
+from thai_segmenter.longlexto import MarisaTrie
+from thai_segmenter.longlexto import VocabularyIndex
+from thai_segmenter.orchid_corpus import orchid_corpus
+from thai_segmenter.sentence_segmenter import sentence_segmenter
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # pragma: no cover
+    shared_memory = None  # Python < 3.8
+
+# ----------------------------------------------------------------------------
+
+
+MAGIC = b"TSMODEL1"
+# magic, length of the JSON header (bytes), data starts at the next multiple of 8
+_PREFIX = struct.Struct("<8sQ")
+_ALIGN = 8
+
+
+def is_model_image(filename):
+    """Check whether the file is a model image (see ``write_model_image``)."""
+    with open(filename, "rb") as fp:
+        return fp.read(len(MAGIC)) == MAGIC
+
+
+# ------------------------------------
+
+
+class SharedRows(Mapping):
+    """Read-only ``{word: (ids, probs)}`` emission rows over flat buffers."""
+
+    __slots__ = ("index", "offsets", "ids", "probs")
+
+    def __init__(self, index, offsets, ids, probs):
+        self.index = index  # word -> row
+        self.offsets = offsets  # row i: [offsets[i], offsets[i + 1])
+        self.ids = ids
+        self.probs = probs
+
+    def __getitem__(self, word):
+        row = self.index[word]
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return self.ids[start:end], self.probs[start:end]
+
+    def __contains__(self, word):
+        return word in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+class SharedWordSet(object):
+    """Read-only set of the corpus words (the emission rows flagged as words)."""
+
+    __slots__ = ("index", "is_word")
+
+    def __init__(self, index, is_word):
+        self.index = index
+        self.is_word = is_word
+
+    def __contains__(self, word):
+        row = self.index.get(word)
+        return row is not None and self.is_word[row] == 1
+
+    def __iter__(self):
+        is_word = self.is_word
+        return (word for word, row in self.index.items() if is_word[row])
+
+    def __len__(self):
+        return sum(self.is_word)
+
+
+# ----------------------------------------------------------------------------
+
+
+def _trie_parts(name, trie, buffers):
+    """Adds the buffers of an immutable trie, returns its header entry."""
+    if isinstance(trie, FrozenTrie):
+        buffers[name + ".chars"] = trie.chars
+        buffers[name + ".offsets"] = trie.offsets
+        buffers[name + ".terminal"] = trie.terminal
+        return {"kind": "frozen"}
+    if isinstance(trie, MarisaTrie):
+        buffers[name + ".marisa"] = trie.to_bytes()
+        return {"kind": "marisa", "max_len": trie.max_len}
+    raise ValueError(
+        "Cannot share trie of type {}, freeze the segmenter first.".format(
+            type(trie).__name__
+        )
+    )
+
+
+def _flat(rows):
+    flat = array("d")
+    for row in rows:
+        flat.extend(row)
+    return flat
+
+
+def _emission_parts(name, words, emiss, buffers):
+    offsets = array("I", [0])
+    ids, probs = array("B"), array("d")
+    for word in words:
+        (row_ids, row_probs) = emiss[word]
+        if ids.typecode != row_ids.typecode:
+            ids = array(row_ids.typecode, ids)
+        ids.extend(row_ids)
+        probs.extend(row_probs)
+        offsets.append(len(probs))
+
+    buffers[name + ".offsets"] = offsets
+    buffers[name + ".ids"] = ids
+    buffers[name + ".probs"] = probs
+
+
+def _model_parts(segmenter):
+    """Returns the header and the (named) buffers of the compiled model,
+    freezes the segmenter first (see ``sentence_segmenter.freeze``)."""
+    segmenter.freeze()
+    corpus = segmenter.corpus
+
+    header = {
+        "version": 1,
+        "byteorder": sys.byteorder,
+        "engine": segmenter.wp.engine,
+        "smoothing": segmenter.smoothing,
+        "custom_dict": segmenter.custom_dict,
+        "tags": corpus.tags,
+        "pos_list": sorted(corpus.pos_list),
+        "num_tags": len(corpus.tags),
+    }
+    buffers = dict()
+
+    # dictionary without the custom words (an overlay, see LongLexTo.set_custom_words)
+    header["dict"] = _trie_parts("dict", segmenter.wp.tokenizer_words.dict_, buffers)
+    header["vocabulary"] = _trie_parts(
+        "vocabulary", corpus.get_vocabulary_index().trie, buffers
+    )
+
+    # emission rows in the order of the words, all models use the same ids
+    words = sorted(corpus.emiss_ids)
+    buffers["words"] = "\n".join(words).encode("utf-8")
+    buffers["is_word"] = bytes(1 if word in corpus.word_list else 0 for word in words)
+
+    buffers["ids.initp"] = corpus.initp_ids
+    buffers["ids.trans_bi"] = _flat(corpus.trans_bi_ids)
+    buffers["ids.trans_tri"] = _flat(
+        row for rows in corpus.trans_tri_ids for row in rows
+    )
+    _emission_parts("ids.emiss", words, corpus.emiss_ids, buffers)
+
+    if corpus.log_model is not None:
+        (initp, trans_bi, trans_tri, emiss) = corpus.log_model
+        buffers["log.initp"] = initp
+        buffers["log.trans_bi"] = _flat(trans_bi)
+        buffers["log.trans_tri"] = _flat(row for rows in trans_tri for row in rows)
+        buffers["log.emiss.probs"] = _flat(emiss[word][1] for word in words)
+        header["log_model"] = True
+
+    return header, buffers
+
+
+def _layout(header, buffers):
+    """Returns the image prefix + header bytes and the (offset, buffer) list."""
+    table = dict()
+    offset = 0
+    parts = list()
+    for name in sorted(buffers):
+        data = buffers[name]
+        view = memoryview(data)
+        typecode = getattr(data, "typecode", "B")
+        table[name] = [offset, view.nbytes, typecode]
+        parts.append((offset, view))
+        offset += (view.nbytes + _ALIGN - 1) // _ALIGN * _ALIGN
+
+    header = dict(header, buffers=table, size=offset)
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    start = _PREFIX.size + len(header_bytes)
+    start = (start + _ALIGN - 1) // _ALIGN * _ALIGN
+    head = _PREFIX.pack(MAGIC, len(header_bytes)) + header_bytes
+    head += b"\x00" * (start - len(head))
+    return head, parts, start + offset
+
+
+def _copy_image(head, parts, buf):
+    buf[: len(head)] = head
+    for offset, view in parts:
+        start = len(head) + offset
+        buf[start : start + view.nbytes] = view.cast("B")  # noqa: E203
+
+
+def write_model_image(segmenter, filename):
+    """Write the compiled model of the segmenter (frozen first) into a file that
+    can be attached with ``attach_segmenter(filename=...)``."""
+    header, buffers = _model_parts(segmenter)
+    head, parts, size = _layout(header, buffers)
+    with open(filename, "wb") as fp:
+        fp.write(head)
+        written = 0
+        for offset, view in parts:
+            fp.write(b"\x00" * (offset - written))
+            fp.write(view)
+            written = offset + view.nbytes
+        fp.write(b"\x00" * (size - len(head) - written))
+
+
+class SharedModel(object):
+    """Model image in a ``multiprocessing.shared_memory`` block, created by
+    ``share_model``. Workers attach with its ``name``, the creating process
+    should ``unlink`` it when all workers are done (or use ``with``)."""
+
+    def __init__(self, segmenter):
+        if shared_memory is None:
+            raise ValueError("multiprocessing.shared_memory requires Python 3.8+")
+        header, buffers = _model_parts(segmenter)
+        head, parts, size = _layout(header, buffers)
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        _copy_image(head, parts, self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def size(self):
+        return self.shm.size
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        self.unlink()
+
+
+def share_model(segmenter):
+    """Place the compiled model of the segmenter (frozen first) in shared memory,
+    returns a ``SharedModel`` (attach with ``attach_segmenter(name=...)``)."""
+    return SharedModel(segmenter)
+
+
+# ----------------------------------------------------------------------------
+
+
+if shared_memory is not None:
+
+    class AttachedMemory(shared_memory.SharedMemory):
+        """Shared memory block of an attached model, stays mapped as long as
+        views of the model tables exist (also at interpreter shutdown)."""
+
+        def __del__(self):
+            try:
+                self.close()
+            except (BufferError, OSError):
+                pass
+
+
+def _open_shared_memory(name):
+    try:
+        # the creating process unlinks the block, not the workers
+        return AttachedMemory(name=name, track=False)
+    except TypeError:  # pragma: no cover
+        # Python < 3.13: registered with the resource tracker, which is shared
+        # with the creating process for Pool workers (the block stays until unlink)
+        return AttachedMemory(name=name)
+
+
+def _attach_trie(name, entry, views):
+    if entry["kind"] == "frozen":
+        return FrozenTrie(
+            views[name + ".chars"],
+            views[name + ".offsets"],
+            views[name + ".terminal"],
+        )
+    return MarisaTrie.from_bytes(views[name + ".marisa"], entry["max_len"])
+
+
+def _rows(flat, num_rows, size):
+    return [flat[i * size : (i + 1) * size] for i in range(num_rows)]  # noqa: E203
+
+
+def _attach(buf, owner=None):
+    (magic, header_len) = _PREFIX.unpack_from(buf)
+    if magic != MAGIC:
+        raise ValueError("Not a model image.")
+    start = _PREFIX.size
+    header = bytes(buf[start : start + header_len])  # noqa: E203
+    header = json.loads(header.decode("utf-8"))
+    if header["byteorder"] != sys.byteorder:
+        raise ValueError("Model image has another byte order.")
+    start = (start + header_len + _ALIGN - 1) // _ALIGN * _ALIGN
+
+    views = dict()
+    for name, (offset, nbytes, typecode) in header["buffers"].items():
+        view = buf[start + offset : start + offset + nbytes]  # noqa: E203
+        views[name] = view.cast(typecode) if typecode != "B" else view
+
+    num_tags = header["num_tags"]
+    words = bytes(views["words"]).decode("utf-8")
+    words = words.split("\n") if words else list()
+    index = dict(zip(words, range(len(words))))
+    word_list = SharedWordSet(index, views["is_word"])
+    offsets, ids = views["ids.emiss.offsets"], views["ids.emiss.ids"]
+
+    indexed_model = (
+        views["ids.initp"],
+        _rows(views["ids.trans_bi"], num_tags, num_tags),
+        [
+            _rows(rows, num_tags, num_tags)
+            for rows in _rows(views["ids.trans_tri"], num_tags, num_tags * num_tags)
+        ],
+        SharedRows(index, offsets, ids, views["ids.emiss.probs"]),
+    )
+    log_model = None
+    if header.get("log_model"):
+        log_model = (
+            views["log.initp"],
+            _rows(views["log.trans_bi"], num_tags, num_tags),
+            [
+                _rows(rows, num_tags, num_tags)
+                for rows in _rows(views["log.trans_tri"], num_tags, num_tags * num_tags)
+            ],
+            SharedRows(index, offsets, ids, views["log.emiss.probs"]),
+        )
+
+    corpus = orchid_corpus.from_tables(
+        header["tags"],
+        header["pos_list"],
+        word_list,
+        indexed_model,
+        log_model=log_model,
+        vocabulary_index=VocabularyIndex.from_trie(
+            _attach_trie("vocabulary", header["vocabulary"], views)
+        ),
+    )
+    tokenizer = ENGINES[header["engine"]].from_trie(
+        _attach_trie("dict", header["dict"], views)
+    )
+    segmenter = sentence_segmenter(
+        corpus=corpus,
+        custom_dict=header["custom_dict"],
+        engine=header["engine"],
+        smoothing=header["smoothing"],
+        tokenizer_words=tokenizer,
+    )
+    segmenter.shared_model = owner  # keeps the memory mapped
+    return segmenter
+
+
+def attach_segmenter(name=None, filename=None):
+    """Returns a segmenter over the model image in shared memory (``name``,
+    see ``share_model``) or in a file (see ``write_model_image``)."""
+    if (name is None) == (filename is None):
+        raise ValueError(
+            "Either the name of the shared memory or a filename is required."
+        )
+
+    if name is not None:
+        if shared_memory is None:
+            raise ValueError("multiprocessing.shared_memory requires Python 3.8+")
+        shm = _open_shared_memory(name)
+        return _attach(shm.buf.toreadonly(), owner=shm)
+
+    with open(filename, "rb") as fp:
+        mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    return _attach(memoryview(mapped), owner=mapped)
+
+
+def init_worker(name=None, filename=None):
+    """``multiprocessing.Pool`` initializer, attaches the model image and
+    uses it as default segmenter (for ``tasks.sentence_segment`` etc.)."""
+    from thai_segmenter.tasks import set_default_segmenter
+
+    set_default_segmenter(attach_segmenter(name=name, filename=filename))
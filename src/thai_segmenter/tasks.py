@@ -1,7 +1,16 @@
+import collections
+import csv
+import functools
+import io
+import json
 import re
+import threading
 
+import thai_segmenter.orchid_corpus
 import thai_segmenter.sentence_segmenter
-from thai_segmenter import viterbi as vtb
+import thai_segmenter.shared_model
+import thai_segmenter.word_processing
+from thai_segmenter.dedup import Deduplicator
 from thai_segmenter.sentence import sentence as sentence_cls
 
 # ----------------------------------------------------------------------------
@@ -50,10 +59,34 @@ def is_head_line(
 
 
 __segmenter = None
+__segmenter_lock = threading.Lock()
 
 
-def get_segmenter():
-    segmenter = thai_segmenter.sentence_segmenter.sentence_segmenter()
+def get_segmenter(
+    engine="longlexto", smoothing=None, model_file=None, split_decoding=False
+):
+    if model_file is not None and thai_segmenter.shared_model.is_model_image(
+        model_file
+    ):
+        # compiled model, engine and smoothing are fixed (see shared_model)
+        segmenter = thai_segmenter.shared_model.attach_segmenter(filename=model_file)
+        if (segmenter.wp.engine, segmenter.smoothing) != (engine, smoothing):
+            raise ValueError(
+                "Model image {} was compiled with engine {} and smoothing {}".format(
+                    model_file, segmenter.wp.engine, segmenter.smoothing
+                )
+            )
+        segmenter.split_decoding = split_decoding
+        return segmenter
+
+    corpus = None
+    if model_file is not None:  # see model_builder
+        corpus = thai_segmenter.orchid_corpus.orchid_corpus(
+            model_file=model_file, smoothing=smoothing
+        )
+    segmenter = thai_segmenter.sentence_segmenter.sentence_segmenter(
+        corpus=corpus, engine=engine, smoothing=smoothing, split_decoding=split_decoding
+    )
     # TODO: maybe set in sentence_segmenter class
     # segmenter.sentence = thai_segmenter.sentence_segmenter.sentence
     # segmenter.vtb = thai_segmenter.sentence_segmenter.vtb
@@ -67,19 +100,47 @@ def _get_segmenter_default(segmenter=None):
     if segmenter is not None:
         return segmenter
 
-    if __segmenter is None:
-        __segmenter = get_segmenter()
+    default_segmenter = __segmenter
+    if default_segmenter is None:
+        # build only once, even if called from many threads at the start
+        with __segmenter_lock:
+            if __segmenter is None:
+                __segmenter = get_segmenter()
+            default_segmenter = __segmenter
+
+    return default_segmenter
+
 
-    return __segmenter
+def set_default_segmenter(segmenter):
+    """Replace the segmenter used if none is given (e. g. in worker processes,
+    see ``shared_model.init_worker``)."""
+    global __segmenter
+
+    with __segmenter_lock:
+        __segmenter = segmenter
 
 
 # ------------------------------------
 
 
-def sentence_segment(sentence, segmenter=None):
+def sentence_segment(sentence, segmenter=None, boundary_only=False, breaks="viterbi"):
     segmenter = _get_segmenter_default(segmenter)
 
-    return segmenter.sentence_segment(sentence)
+    return segmenter.sentence_segment(
+        sentence, boundary_only=boundary_only, breaks=breaks
+    )
+
+
+def sentence_segment_batch(
+    sentences, segmenter=None, boundary_only=False, breaks="viterbi"
+):
+    """Like ``sentence_segment`` for a list of texts, the POS tags of all are
+    decoded together (see ``sentence_segmenter.tag_paragraphs``)."""
+    segmenter = _get_segmenter_default(segmenter)
+
+    return segmenter.sentence_segment_batch(
+        sentences, boundary_only=boundary_only, breaks=breaks
+    )
 
 
 def tokenize(sentence, segmenter=None, escaped=False, subwords=False):
@@ -100,25 +161,27 @@ def tokenize(sentence, segmenter=None, escaped=False, subwords=False):
     return tokens
 
 
-def tokenize_and_postag(sentence, segmenter=None, tri_gram=False):
+def tokenize_spans(sentence, segmenter=None):
+    """Tokenize and return the character offsets and LongLexTo types
+    of the tokens (see ``longlexto.TokenSpans``) instead of strings."""
     segmenter = _get_segmenter_default(segmenter)
 
-    # tokenize
+    return segmenter.wp.word_segment_spans(sentence)
+
+
+def format_spans(spans):
+    """Format token spans as ``start:end:type`` separated by blanks."""
+    return " ".join("{}:{}:{}".format(start, end, typ) for start, end, typ in spans)
+
+
+def _tokenize_for_tagging(sentence, segmenter):
     words = segmenter.wp.word_segment_words(sentence)
     words_escd = segmenter.wp.clean_special_characters(words)
     to_be_tagged, tokens, replace_idx = segmenter.clean_unknown_word(words_escd)
+    return words, to_be_tagged, tokens, replace_idx
 
-    # pos tag
-    # call viterbi function to get most possible pos sequence
-    initp, trans, emiss = segmenter.corpus.get_statistics_model(tri_gram)
-    if tri_gram:
-        path = vtb.viterbi_trigram(
-            to_be_tagged, segmenter.corpus.pos_list_sentence, initp, trans, emiss
-        )
-    else:
-        path = vtb.viterbi(
-            to_be_tagged, segmenter.corpus.pos_list_sentence, initp, trans, emiss
-        )
+
+def _tagged_sentence(sentence, words, tokens, replace_idx, path, segmenter):
     pos = segmenter.invert_unknown_word(tokens, path, replace_idx)
 
     # make sentence object
@@ -127,6 +190,37 @@ def tokenize_and_postag(sentence, segmenter=None, tri_gram=False):
     return sentence_cls(sentence, words_and_pos)
 
 
+def tokenize_and_postag(sentence, segmenter=None, tri_gram=False):
+    segmenter = _get_segmenter_default(segmenter)
+
+    # tokenize
+    words, to_be_tagged, tokens, replace_idx = _tokenize_for_tagging(
+        sentence, segmenter
+    )
+
+    # pos tag
+    # call viterbi function to get most possible pos sequence
+    path = segmenter.pos_tag(to_be_tagged, tri_gram=tri_gram)
+    return _tagged_sentence(sentence, words, tokens, replace_idx, path, segmenter)
+
+
+def tokenize_and_postag_batch(sentences, segmenter=None, tri_gram=False):
+    """Like ``tokenize_and_postag`` for a list of sentences, the POS tags of all
+    are decoded together (see ``sentence_segmenter.pos_tag_batch``)."""
+    segmenter = _get_segmenter_default(segmenter)
+
+    tokenized = [_tokenize_for_tagging(sentence, segmenter) for sentence in sentences]
+    paths = segmenter.pos_tag_batch(
+        [to_be_tagged for _, to_be_tagged, _, _ in tokenized], tri_gram=tri_gram
+    )
+    return [
+        _tagged_sentence(sentence, words, tokens, replace_idx, path, segmenter)
+        for sentence, (words, _, tokens, replace_idx), path in zip(
+            sentences, tokenized, paths
+        )
+    ]
+
+
 # ----------------------------------------------------------------------------
 
 
@@ -180,203 +274,757 @@ def line_cleaner(
         summary["keep"] = num_keep
 
 
-def line_sentence_segmenter(
-    lines, has_headers=False, header_detect_fun=None, summary=None
+def get_deduplicator(
+    near_duplicates=False,
+    engine="longlexto",
+    capacity=1000000,
+    error_rate=0.001,
+    filename=None,
+    tokenize_fun=None,
 ):
-    segmenter = get_segmenter()
-
+    """Returns a ``Deduplicator``, near-duplicates are detected with MinHash
+    over the tokens of the lines. Pass the ``tokenize_fun`` of the segmenter
+    of the task (e. g. ``functools.partial(tokenize, segmenter=segmenter)``),
+    else only a word tokenizer for the ``engine`` is loaded (no model)."""
+    if not near_duplicates:
+        tokenize_fun = None
+    elif tokenize_fun is None:
+        tokenize_fun = thai_segmenter.word_processing.word_processing(
+            thai_segmenter.sentence_segmenter.sentence_segmenter.filename_lexitron,
+            thai_segmenter.sentence_segmenter.sentence_segmenter.filename_orchid,
+            engine=engine,
+        ).word_segment_words
+
+    return Deduplicator(
+        tokenize_fun=tokenize_fun,
+        capacity=capacity,
+        error_rate=error_rate,
+        filename=filename,
+    )
+
+
+def line_deduplicator(
+    lines,
+    deduplicator=None,
+    has_headers=False,
+    header_detect_fun=None,
+    summary=None,
+):
+    """Drop lines that are (near-) duplicates of earlier lines, see
+    ``get_deduplicator``. Default is exact duplicates only (in memory).
+    Blank and header lines are always kept."""
+    if deduplicator is None:
+        deduplicator = get_deduplicator()
     if not callable(header_detect_fun):
         header_detect_fun = is_head_line
 
-    num_lines = num_headers = num_segmented = num_sentences = 0
+    counters = {"unique": 0, "duplicates": 0, "near_duplicates": 0}
 
     for line in lines:
-        num_lines += 1
-        line = line.strip()
-
-        if not line:
+        text = line.strip()
+        if not text or (has_headers and header_detect_fun(text)):
+            yield line
             continue
 
-        if has_headers and header_detect_fun(line):
-            num_headers += 1
+        found = deduplicator.check(text)
+        if found == "exact":
+            counters["duplicates"] += 1
+        elif found == "near":
+            counters["near_duplicates"] += 1
+        else:
+            counters["unique"] += 1
             yield line
-            continue
 
-        # sentence segment
-        sentences = sentence_segment(line, segmenter)
-        if len(sentences) > 1:
-            num_segmented += 1
-        num_sentences += len(sentences)
+    if isinstance(summary, dict):
+        summary.update(counters)
 
-        for sentence in sentences:
-            yield str(sentence)
 
-    if isinstance(summary, dict):
-        summary["lines"] = num_lines
-        summary["headers"] = num_headers
-        summary["sentences"] = num_sentences
-        summary["segmented"] = num_segmented
+# ------------------------------------
 
 
-def line_sentence_segmenter_column(
-    lines, column=None, has_headers=False, header_detect_fun=None, summary=None
-):
-    segmenter = get_segmenter()
+INPUT_FORMATS = ("tsv", "csv", "jsonl")
+
 
+def _as_columns(column, input_format="tsv"):
+    """Normalize ``column`` (index, field name or a list of them) to a list."""
+    if input_format not in INPUT_FORMATS:
+        raise ValueError(
+            "Unknown input format: {} (choices: {})".format(
+                input_format, ", ".join(INPUT_FORMATS)
+            )
+        )
+    if column is None:
+        if input_format != "tsv":
+            raise ValueError("A column is required for {} input.".format(input_format))
+        return None
+    columns = [column] if isinstance(column, (int, str)) else list(column)
+    if not columns:
+        raise ValueError("No columns given.")
+    for col in columns:
+        if isinstance(col, int):
+            if col < 0 or input_format == "jsonl":
+                raise ValueError("Invalid column for {}: {}".format(input_format, col))
+        elif input_format == "tsv":
+            raise ValueError("Field names require csv or jsonl input: {}".format(col))
+    return columns
+
+
+def _column_spans(line, columns):
+    """Returns the ``(start, end)`` offsets of the (sorted) columns in a tab
+    separated line, only splits as far as needed. ``None`` if missing."""
+    spans = list()
+    start = col = 0
+    for column in columns:
+        while col < column:
+            start = line.find("\t", start) + 1
+            if start == 0:
+                return None
+            col += 1
+        end = line.find("\t", start)
+        spans.append((start, len(line) if end == -1 else end))
+    return spans
+
+
+def line_column_mapper(
+    lines,
+    fun,
+    column=None,
+    input_format="tsv",
+    has_headers=False,
+    header_detect_fun=None,
+    summary=None,
+    cache=None,
+    batch_size=None,
+    batch_chars=None,
+    result_fun=None,
+):
+    """Replace the text of the selected column(s) of each line with ``fun(text)``.
+
+    ``fun`` returns a string or a list of strings (then one line is
+    output for each, only for a single column). ``column`` is a (0-based)
+    index, a field name (csv with header row, jsonl) or a list of them,
+    ``None`` is the whole (stripped) line. Fields that are not selected
+    are copied unchanged. Lines without the column are passed through
+    and counted as ``skipped``. Blank lines are dropped.
+
+    With a ``cache`` (e. g. ``SizedLRUCache``) the result of ``fun`` is
+    reused for repeated texts (counted as ``reused``). ``result_fun`` is
+    applied to every result of ``fun``, computed or reused, before it is
+    output (e. g. to format it and count what is output), then ``fun``
+    may return anything (lists are cached as tuples).
+
+    With a ``batch_size`` and/or ``batch_chars``, ``fun`` is called with
+    lists of (up to ``batch_size``) texts and returns the list of their
+    results, the records are parsed once and read ahead until a batch is
+    full. ``batch_chars`` limits the characters of the texts (and passed
+    through lines) of a batch (a longer record is a batch on its own), so
+    the memory for the records read ahead stays bounded."""
+    columns = _as_columns(column, input_format)
     if not callable(header_detect_fun):
         header_detect_fun = is_head_line
+    if batch_size is not None and batch_size < 1:
+        raise ValueError("Batch size must be at least 1: {}".format(batch_size))
+    if batch_chars is not None and batch_chars < 1:
+        raise ValueError("Batch chars must be at least 1: {}".format(batch_chars))
+
+    def parse_records(lines, counters):
+        if input_format == "csv":
+            format_row = _csv_row_formatter()
+            records = _parse_csv(lines, columns, counters, format_row)
+            return records, functools.partial(_format_csv, format_row=format_row)
+        elif input_format == "jsonl":
+            return _parse_jsonl(lines, columns, counters), _format_jsonl
+        records = _parse_tsv(lines, columns, has_headers, header_detect_fun, counters)
+        return records, _format_tsv
+
+    counters = {"lines": 0, "headers": 0, "skipped": 0}
+    if cache is not None:
+        counters["reused"] = 0
+    (records, format_record) = parse_records(lines, counters)
+    if batch_size is not None or batch_chars is not None:
+        if cache is not None:
+            fun = _cached_batch_fun(fun, cache, counters)
+        records = _map_batches(records, fun, batch_size, batch_chars)
+    else:
+        if cache is not None:
+            fun = _cached_fun(fun, cache, counters)
+        records = _map_texts(records, fun)
+
+    for record, values in records:
+        if values is None:
+            yield record
+            continue
+        if result_fun is not None:
+            values = [result_fun(value) for value in values]
+        for line in format_record(record, values, columns):
+            yield line
 
-    num_lines = num_headers = num_segmented = num_sentences = 0
+    if columns is None:
+        del counters["skipped"]
+    if isinstance(summary, dict):
+        summary.update(counters)
+
+
+def _cached_fun(fun, cache, counters):
+    marker = object()
+
+    def cached(text):
+        value = cache.get(text, marker)
+        if value is marker:
+            value = fun(text)
+            if isinstance(value, list):
+                value = tuple(value)  # shared, so immutable
+            cache.put(text, value)
+        else:
+            counters["reused"] += 1
+        return value
+
+    return cached
+
+
+def _cached_batch_fun(fun, cache, counters):
+    """Like ``_cached_fun`` for ``fun`` on lists of texts, only the texts not
+    in the ``cache`` (once each) are passed on to ``fun``."""
+    marker = object()
+
+    def cached(texts):
+        values = [cache.get(text, marker) for text in texts]
+        (todo, todo_set) = (list(), set())
+        for text, value in zip(texts, values):
+            if value is marker and text not in todo_set:
+                todo.append(text)
+                todo_set.add(text)
+        computed = dict()
+        for text, value in zip(todo, fun(todo)):
+            if isinstance(value, list):
+                value = tuple(value)  # shared, so immutable
+            cache.put(text, value)
+            computed[text] = value
+        counters["reused"] += len(texts) - len(todo)
+        return [
+            computed[text] if value is marker else value
+            for text, value in zip(texts, values)
+        ]
+
+    return cached
+
+
+def _map_texts(records, fun):
+    """Yields ``(record, values)`` with the result of ``fun`` for each of the
+    texts of the ``(record, texts)`` (``None`` for passed through records)."""
+    for record, texts in records:
+        yield record, None if texts is None else [fun(text) for text in texts]
+
+
+def _map_batches(records, fun, max_texts=None, max_chars=None):
+    """Like ``_map_texts`` but ``fun`` is called with lists of up to
+    ``max_texts`` texts with together at most ``max_chars`` characters (or a
+    single longer text). Each record is parsed once and kept (with passed
+    through lines in between, counted as characters) until the values of
+    all its texts are computed."""
+    pending = collections.deque()
+    values = list()
+    texts, chars = list(), 0
+    for record, record_texts in records:
+        if record_texts is None:
+            if not pending:
+                yield record, None
+                continue
+            pending.append((record, None))
+            chars += len(record)
+            if max_chars is not None and chars > max_chars:
+                values.extend(fun(texts))
+                texts, chars = list(), 0
+                for item in _pop_computed(pending, values):
+                    yield item
+            continue
+
+        pending.append((record, record_texts))
+        for text in record_texts:
+            if texts and max_chars is not None and chars + len(text) > max_chars:
+                values.extend(fun(texts))
+                texts, chars = list(), 0
+                for item in _pop_computed(pending, values):
+                    yield item
+            texts.append(text)
+            chars += len(text)
+            if len(texts) == max_texts:
+                values.extend(fun(texts))
+                texts, chars = list(), 0
+                for item in _pop_computed(pending, values):
+                    yield item
+    if texts:
+        values.extend(fun(texts))
+    for item in _pop_computed(pending, values):
+        yield item
+
+
+def _pop_computed(pending, values):
+    """Yields (and removes) the leading ``pending`` records with the
+    ``values`` for their texts, as far as they are computed."""
+    pos = 0
+    while pending:
+        (record, texts) = pending[0]
+        if texts is None:
+            yield record, None
+        elif pos + len(texts) <= len(values):
+            end = pos + len(texts)
+            yield record, values[pos:end]
+            pos = end
+        else:
+            break
+        pending.popleft()
+    del values[:pos]
+
+
+def _as_values(values, columns):
+    if isinstance(values, str):
+        return [values]
+    if columns is not None and len(columns) > 1:
+        raise ValueError("Multiple output values only for a single column.")
+    return values
+
+
+# The ``_parse_*`` functions yield ``(record, texts)`` for the lines of an
+# input format, ``texts`` is ``None`` if the line is passed through (then
+# ``record`` is the output line). The ``_format_*`` functions yield the
+# output line(s) of a record for the results of ``fun`` for its texts.
+
+
+def _parse_tsv(lines, columns, has_headers, header_detect_fun, counters):
+    if columns is not None:
+        sorted_columns = sorted(set(columns))
 
     for line in lines:
-        num_lines += 1
-        line = line.strip()
+        counters["lines"] += 1
+        # only strip line endings, leading/trailing fields may be empty
+        line = line.strip() if columns is None else line.rstrip("\r\n")
 
-        if not line:
+        if not line or (columns is not None and not line.strip()):
             continue
 
         if has_headers and header_detect_fun(line):
-            num_headers += 1
-            yield line
+            counters["headers"] += 1
+            yield line, None
             continue
 
-        if column is not None:
-            # TODO: how often to split
-            parts = line.split("\t")
-            pre_parts = [p for i, p in enumerate(parts) if i < column]
-            main_part = parts[column]
-            post_parts = [p for i, p in enumerate(parts) if i > column]
-        else:
-            pre_parts, post_parts = list(), list()
-            main_part = line
+        if columns is None:
+            yield (line, None), [line]
+            continue
 
-        # sentence segment
-        sentences = sentence_segment(main_part, segmenter)
-        if len(sentences) > 1:
-            num_segmented += 1
-        num_sentences += len(sentences)
+        spans = _column_spans(line, sorted_columns)
+        if spans is None:
+            counters["skipped"] += 1
+            yield line, None
+            continue
 
-        for sentence in sentences:
-            parts = pre_parts + [str(sentence)] + post_parts
-            line_out = "\t".join(parts)
+        yield (line, spans), [line[start:end] for start, end in spans]
+
+
+def _format_tsv(record, values, columns):
+    (line, spans) = record
+    if spans is None:
+        for value in _as_values(values[0], columns):
+            yield value
+        return
+
+    if len(spans) == 1:
+        ((start, end),) = spans
+        (head, tail) = (line[:start], line[end:])
+        for value in _as_values(values[0], columns):
+            yield head + value + tail
+        return
+
+    pieces = list()
+    last = 0
+    for (start, end), value in zip(spans, values):
+        pieces.append(line[last:start])
+        pieces.extend(_as_values(value, columns))
+        last = end
+    pieces.append(line[last:])
+    yield "".join(pieces)
+
+
+def _csv_row_formatter():
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="")
+
+    def format_row(row):
+        buf.seek(0)
+        buf.truncate()
+        writer.writerow(row)
+        return buf.getvalue()
+
+    return format_row
+
+
+def _parse_csv(lines, columns, counters, format_row):
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    counters["lines"] += 1
+    counters["headers"] += 1
+    yield format_row(header), None
+
+    indices = list()
+    for col in columns:
+        if isinstance(col, str):
+            if col not in header:
+                raise ValueError("Unknown field: {}".format(col))
+            col = header.index(col)
+        indices.append(col)
+
+    for row in reader:
+        counters["lines"] += 1
+        if not row:
+            continue
 
-            yield line_out
+        if max(indices) >= len(row):
+            counters["skipped"] += 1
+            yield format_row(row), None
+            continue
 
-    if isinstance(summary, dict):
-        summary["lines"] = num_lines
-        summary["headers"] = num_headers
-        summary["sentences"] = num_sentences
-        summary["segmented"] = num_segmented
+        yield (row, indices), [row[index] for index in indices]
 
 
-def line_tokenizer(
-    lines,
-    escape_special=False,
-    tokenize_subwords=False,
-    column=None,
-    has_headers=False,
-    header_detect_fun=None,
-    summary=None,
-):
-    segmenter = get_segmenter()
+def _format_csv(record, values, columns, format_row):
+    (row, indices) = record
+    if len(indices) == 1:
+        (index,) = indices
+        for value in _as_values(values[0], columns):
+            row[index] = value
+            yield format_row(row)
+        return
 
-    if not callable(header_detect_fun):
-        header_detect_fun = is_head_line
+    for index, value in zip(indices, values):
+        (row[index],) = _as_values(value, columns)
+    yield format_row(row)
 
-    num_lines = num_headers = num_sentences = num_tokens = 0
 
+def _parse_jsonl(lines, columns, counters):
     for line in lines:
-        num_lines += 1
+        counters["lines"] += 1
         line = line.strip()
-
         if not line:
             continue
 
-        if has_headers and header_detect_fun(line):
-            num_headers += 1
-            yield line
+        try:
+            record = json.loads(line)
+        except ValueError:  # malformed, passed through like other records
+            record = None
+        if not isinstance(record, dict) or not all(
+            isinstance(record.get(col), str) for col in columns
+        ):
+            counters["skipped"] += 1
+            yield line, None
             continue
 
-        if column is not None:
-            # TODO: how often to split
-            parts = line.split("\t")
-            pre_parts = [p for i, p in enumerate(parts) if i < column]
-            main_part = parts[column]
-            post_parts = [p for i, p in enumerate(parts) if i > column]
-        else:
-            pre_parts, post_parts = list(), list()
-            main_part = line
+        yield record, [record[field] for field in columns]
+
+
+def _format_jsonl(record, values, columns):
+    if len(columns) == 1:
+        (field,) = columns
+        for value in _as_values(values[0], columns):
+            record[field] = value
+            yield json.dumps(record, ensure_ascii=False)
+        return
+
+    for field, value in zip(columns, values):
+        (record[field],) = _as_values(value, columns)
+    yield json.dumps(record, ensure_ascii=False)
+
+
+def sentence_record(sentence):
+    """Token record (see ``formats``) of a tagged sentence."""
+    offsets = sentence.offsets.tolist()
+    return {
+        "text": sentence.text,
+        "tokens": list(sentence.words()),
+        "starts": offsets[:-1],
+        "ends": offsets[1:],
+        "tags": list(sentence.tags()),
+    }
+
+
+def spans_record(text, spans):
+    """Token record (see ``formats``) of token spans (see ``tokenize_spans``)."""
+    return {
+        "text": text,
+        "tokens": [text[start:end] for start, end, _ in spans],
+        "starts": [start for start, _, _ in spans],
+        "ends": [end for _, end, _ in spans],
+        "types": [typ for _, _, typ in spans],
+    }
+
+
+def _check_output_format(output_format, choices, column):
+    if output_format not in choices:
+        raise ValueError(
+            "Unknown output format: {} (choices: {})".format(
+                output_format, ", ".join(choices)
+            )
+        )
+    if output_format == "records" and column is not None:
+        raise ValueError("Records output only for whole lines, not columns.")
 
-        # tokenize
-        tokens = tokenize(
-            main_part, segmenter, escaped=escape_special, subwords=tokenize_subwords
+
+def line_sentence_segmenter(
+    lines,
+    has_headers=False,
+    header_detect_fun=None,
+    summary=None,
+    engine="longlexto",
+    smoothing=None,
+    model_file=None,
+    cache=None,
+    boundary_only=False,
+    breaks="viterbi",
+    split_decoding=False,
+    batch_size=None,
+    batch_chars=None,
+    segmenter=None,
+):
+    return line_sentence_segmenter_column(
+        lines,
+        has_headers=has_headers,
+        header_detect_fun=header_detect_fun,
+        summary=summary,
+        engine=engine,
+        smoothing=smoothing,
+        model_file=model_file,
+        cache=cache,
+        boundary_only=boundary_only,
+        breaks=breaks,
+        split_decoding=split_decoding,
+        batch_size=batch_size,
+        batch_chars=batch_chars,
+        segmenter=segmenter,
+    )
+
+
+def line_sentence_segmenter_column(
+    lines,
+    column=None,
+    has_headers=False,
+    header_detect_fun=None,
+    summary=None,
+    engine="longlexto",
+    smoothing=None,
+    model_file=None,
+    input_format="tsv",
+    cache=None,
+    boundary_only=False,
+    breaks="viterbi",
+    split_decoding=False,
+    batch_size=None,
+    batch_chars=None,
+    segmenter=None,
+):
+    """Sentence segment the text (or a single column, see ``line_column_mapper``),
+    yields a line for each sentence. With ``boundary_only`` the faster model
+    of the tag classes is used (see ``orchid_corpus.get_boundary_corpus``),
+    with ``breaks="spaces"`` only the spaces are classified (see
+    ``sentence_segmenter.tag_spaces``), with ``split_decoding`` see
+    ``sentence_segmenter.pos_tag``. With a ``batch_size`` and/or
+    ``batch_chars`` the lines are tagged in batches (see
+    ``sentence_segment_batch``), as in ``line_tokenize_and_tagger``. A
+    ``segmenter`` (e. g. shared with ``get_deduplicator``) is used instead
+    of one built from ``engine``, ``smoothing``, ``model_file`` and
+    ``split_decoding``."""
+    columns = _as_columns(column, input_format)
+    if columns is not None and len(columns) > 1:
+        raise ValueError("Sentence segmentation only supports a single column.")
+    if segmenter is None:
+        segmenter = get_segmenter(
+            engine=engine,
+            smoothing=smoothing,
+            model_file=model_file,
+            split_decoding=split_decoding,
         )
+    if breaks == "spaces":  # build it now (or fail early)
+        segmenter.corpus.get_space_model()
+    elif boundary_only:
+        segmenter.corpus.get_boundary_corpus(smoothing=segmenter.smoothing)
 
-        num_sentences += 1
-        num_tokens += len(tokens)
+    counters = {"sentences": 0, "segmented": 0}
 
-        sentence_tok = " ".join(tokens)
-        parts = pre_parts + [sentence_tok] + post_parts
-        line_out = "\t".join(parts)
+    def segment_result(sentences):
+        # counted for every output, also if reused from the cache
+        if len(sentences) > 1:
+            counters["segmented"] += 1
+        counters["sentences"] += len(sentences)
 
+        return [str(sentence) for sentence in sentences]
+
+    def segment(text):
+        # sentence segment
+        return sentence_segment(
+            text, segmenter, boundary_only=boundary_only, breaks=breaks
+        )
+
+    def segment_texts(texts):
+        return sentence_segment_batch(
+            texts, segmenter, boundary_only=boundary_only, breaks=breaks
+        )
+
+    for line_out in line_column_mapper(
+        lines,
+        segment if batch_size is None and batch_chars is None else segment_texts,
+        column=column,
+        input_format=input_format,
+        has_headers=has_headers,
+        header_detect_fun=header_detect_fun,
+        summary=summary,
+        cache=cache,
+        batch_size=batch_size,
+        batch_chars=batch_chars,
+        result_fun=segment_result,
+    ):
         yield line_out
 
     if isinstance(summary, dict):
-        summary["lines"] = num_lines
-        summary["headers"] = num_headers
-        summary["sentences"] = num_sentences
-        summary["tokens"] = num_tokens
+        summary.update(counters)
 
 
-def line_tokenize_and_tagger(
-    lines, column=None, has_headers=False, header_detect_fun=None, summary=None
+def line_tokenizer(
+    lines,
+    escape_special=False,
+    tokenize_subwords=False,
+    column=None,
+    has_headers=False,
+    header_detect_fun=None,
+    summary=None,
+    output_format="text",
+    engine="longlexto",
+    input_format="tsv",
+    cache=None,
+    segmenter=None,
 ):
-    segmenter = get_segmenter()
+    """Tokenize the text (or columns, see ``line_column_mapper``) of each line.
 
-    if not callable(header_detect_fun):
-        header_detect_fun = is_head_line
+    ``output_format`` is ``"text"`` (blank separated tokens), ``"offsets"``
+    (see ``format_spans``) or ``"records"`` (dicts, see ``formats``). A
+    ``segmenter`` is used instead of one built for the ``engine``."""
+    _check_output_format(output_format, ("text", "offsets", "records"), column)
+    _as_columns(column, input_format)
+    if segmenter is None:
+        segmenter = get_segmenter(engine=engine)
 
-    num_lines = num_headers = num_sentences = num_tokens = 0
+    counters = {"sentences": 0, "tokens": 0}
 
-    for line in lines:
-        num_lines += 1
-        line = line.strip()
+    def tokenize_text(text):
+        # tokenize
+        if output_format in ("records", "offsets"):
+            return tokenize_spans(text, segmenter)
+        return tokenize(
+            text, segmenter, escaped=escape_special, subwords=tokenize_subwords
+        )
 
-        if not line:
-            continue
+    def tokenize_result(tokens):
+        # counted for every output, also if reused from the cache
+        counters["sentences"] += 1
+        counters["tokens"] += len(tokens)
+
+        if output_format == "records":
+            return [spans_record(tokens.text, tokens)]
+        elif output_format == "offsets":
+            return format_spans(tokens)
+        return " ".join(tokens)
+
+    for line_out in line_column_mapper(
+        lines,
+        tokenize_text,
+        column=column,
+        input_format=input_format,
+        has_headers=has_headers,
+        header_detect_fun=header_detect_fun,
+        summary=summary,
+        cache=cache,
+        result_fun=tokenize_result,
+    ):
+        if output_format == "records" and isinstance(line_out, str):
+            continue  # header lines
+        yield line_out
 
-        if has_headers and header_detect_fun(line):
-            num_headers += 1
-            yield line
-            continue
+    if isinstance(summary, dict):
+        summary.update(counters)
 
-        if column is not None:
-            # TODO: how often to split
-            parts = line.split("\t")
-            pre_parts = [p for i, p in enumerate(parts) if i < column]
-            main_part = parts[column]
-            post_parts = [p for i, p in enumerate(parts) if i > column]
-        else:
-            pre_parts, post_parts = list(), list()
-            main_part = line
 
-        # tokenize and pos-tag
-        sentence = tokenize_and_postag(main_part, segmenter)
+def line_tokenize_and_tagger(
+    lines,
+    column=None,
+    has_headers=False,
+    header_detect_fun=None,
+    summary=None,
+    engine="longlexto",
+    smoothing=None,
+    model_file=None,
+    input_format="tsv",
+    cache=None,
+    output_format="text",
+    batch_size=None,
+    batch_chars=None,
+    split_decoding=False,
+    segmenter=None,
+):
+    """Tokenize and POS tag the text (or columns, see ``line_column_mapper``) of each line.
+
+    ``output_format`` is ``"text"`` (``word|POS`` separated by blanks) or
+    ``"records"`` (dicts, see ``formats``). With a ``batch_size`` and/or
+    ``batch_chars`` (maximum characters of the texts of a batch) the lines
+    are tagged in batches (see ``tokenize_and_postag_batch``), else one by
+    one, with ``split_decoding`` see ``sentence_segmenter.pos_tag``. A
+    ``segmenter`` is used instead of one built from ``engine``,
+    ``smoothing``, ``model_file`` and ``split_decoding``."""
+    _check_output_format(output_format, ("text", "records"), column)
+    _as_columns(column, input_format)
+    if segmenter is None:
+        segmenter = get_segmenter(
+            engine=engine,
+            smoothing=smoothing,
+            model_file=model_file,
+            split_decoding=split_decoding,
+        )
+
+    counters = {"sentences": 0, "tokens": 0}
 
-        num_sentences += 1
-        num_tokens += len(sentence.pos)
+    def tag_result(sentence):
+        # counted for every output, also if reused from the cache
+        counters["sentences"] += 1
+        counters["tokens"] += len(sentence)
 
-        sentence_tagged = " ".join("{}|{}".format(w, p) for w, p in sentence.pos)
-        parts = pre_parts + [sentence_tagged] + post_parts
-        line_out = "\t".join(parts)
+        if output_format == "records":
+            return [sentence_record(sentence)]
+        return " ".join("{}|{}".format(w, p) for w, p in sentence.pos)
 
+    def tag_text(text):
+        # tokenize and pos-tag
+        return tokenize_and_postag(text, segmenter)
+
+    def tag_texts(texts):
+        return tokenize_and_postag_batch(texts, segmenter)
+
+    for line_out in line_column_mapper(
+        lines,
+        tag_text if batch_size is None and batch_chars is None else tag_texts,
+        column=column,
+        input_format=input_format,
+        has_headers=has_headers,
+        header_detect_fun=header_detect_fun,
+        summary=summary,
+        cache=cache,
+        batch_size=batch_size,
+        batch_chars=batch_chars,
+        result_fun=tag_result,
+    ):
+        if output_format == "records" and isinstance(line_out, str):
+            continue  # header lines
         yield line_out
 
     if isinstance(summary, dict):
-        summary["lines"] = num_lines
-        summary["headers"] = num_headers
-        summary["sentences"] = num_sentences
-        summary["tokens"] = num_tokens
+        summary.update(counters)
 
 
 # ----------------------------------------------------------------------------
@@ -1,3 +1,10 @@
+try:
+    # optional: batch decoding (see viterbi_ids_batch)
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
 def viterbi(obs, states, initp, trans, emiss):
     obs_count = len(obs)
     vtb = [{}]
@@ -99,3 +106,489 @@ def viterbi_trigram(obs, states, initp, trans, emiss):
         ((vtb[obs_count - 1][st2][st1]), st2, st1) for st2 in states for st1 in states
     )
     return path[prev1][state]
+
+
+# ----------------------------------------------------------------------------
+# Integer-indexed versions (see orchid_corpus.get_indexed_model)
+#
+# States are tag ids 0..n-1 (in sorted tag order, so ties are broken the same
+# way as above), the tables are lists/arrays indexed by tag id:
+# - initp[curr]
+# - trans[curr][prev] (bigram) or trans[prev1][curr][prev2] (trigram)
+# - emiss[word] = (ids, probs), only the tags with a non-zero probability
+# Only states that can emit the current word are computed, all others have a
+# zero probability and (like max() above would) point to the last state.
+
+
+def viterbi_ids(obs, initp, trans, emiss):
+    """Bigram Viterbi on integer-indexed tables, returns the list of tag ids."""
+    return _viterbi_ids(obs, initp, trans, emiss)[0]
+
+
+def _viterbi_ids(obs, initp, trans, emiss, start=None):
+    """``viterbi_ids``, optionally with the known tag ``start`` of the first
+    word, returns the path and whether its end is reachable (non-zero)."""
+    num_states = len(initp)
+    last_state = num_states - 1
+
+    (ids, probs) = emiss[obs[0]]
+    vtb = [0.0] * num_states
+    for state, prob in zip(ids, probs):
+        if start is None:
+            vtb[state] = initp[state] * prob
+        elif state == start:
+            vtb[state] = prob
+    back = list()
+
+    for t in range(1, len(obs)):
+        prev_ids = ids
+        (ids, probs) = emiss[obs[t]]
+        prev_vtb = vtb
+        vtb = [0.0] * num_states
+        ptr = [last_state] * num_states
+
+        for state, prob in zip(ids, probs):
+            trans_to = trans[state]
+            (max_prob, max_prev_state) = max(
+                ((prev_vtb[prev] * trans_to[prev] * prob, prev) for prev in prev_ids),
+                default=(0.0, last_state),
+            )
+            if max_prob:
+                vtb[state] = max_prob
+                ptr[state] = max_prev_state
+
+        max_prob = max(vtb)
+        if max_prob < 10e-40:
+            (prob, max_state) = max(
+                ((initp[state] * prob, state) for state, prob in zip(ids, probs)),
+                default=(0.0, last_state),
+            )
+            if not prob:
+                max_state = last_state
+            (_, max_prev_state) = max(zip(prev_vtb, range(num_states)))
+            vtb[max_state] = prob
+            ptr[max_state] = max_prev_state
+        elif max_prob < 10e-15:
+            vtb = [prob * 10e10 for prob in vtb]
+
+        back.append(ptr)
+
+    (max_prob, state) = max(zip(vtb, range(num_states)))
+    path = [state]
+    for ptr in reversed(back):
+        state = ptr[state]
+        path.append(state)
+    path.reverse()
+    return path, max_prob > 0.0
+
+
+def viterbi_trigram_ids(obs, initp, trans, emiss):
+    """Trigram Viterbi on integer-indexed tables, returns the list of tag ids."""
+    num_states = len(initp)
+    last_state = num_states - 1
+
+    # vtb[prev1][curr], the first word has no real prev1, so all rows are equal
+    (ids, probs) = emiss[obs[0]]
+    first = [0.0] * num_states
+    for state, prob in zip(ids, probs):
+        first[state] = initp[state] * prob
+    vtb = [first] * num_states
+    prev_ids = range(num_states)
+    back = list()
+
+    for t in range(1, len(obs)):
+        (prev2_ids, prev_ids) = (prev_ids, ids)
+        (ids, probs) = emiss[obs[t]]
+        prev_vtb = vtb
+        vtb = [[0.0] * num_states for _ in range(num_states)]
+        ptr = [[last_state] * num_states for _ in range(num_states)]
+
+        for curr_state, prob in zip(ids, probs):
+            for prev1 in prev_ids:
+                trans_to = trans[prev1][curr_state]
+                (max_prob, prev2) = max(
+                    (
+                        (prev_vtb[prev2][prev1] * trans_to[prev2] * prob, prev2)
+                        for prev2 in prev2_ids
+                    ),
+                    default=(0.0, last_state),
+                )
+                if max_prob:
+                    vtb[prev1][curr_state] = max_prob
+                    ptr[prev1][curr_state] = prev2
+
+        back.append(ptr)
+
+        max_prob = max(
+            (vtb[prev1][curr] for prev1 in prev_ids for curr in ids), default=0.0
+        )
+        if max_prob < 10e-15:
+            for prev1 in prev_ids:
+                row = vtb[prev1]
+                for curr in ids:
+                    row[curr] *= 10e10
+
+    (_, prev1, state) = max(
+        (vtb[st2][st1], st2, st1)
+        for st2 in range(num_states)
+        for st1 in range(num_states)
+    )
+    path = [state]
+    for ptr in reversed(back):
+        (prev1, state) = (ptr[prev1][state], prev1)
+        path.append(state)
+    path.reverse()
+    return path
+
+
+# ----------------------------------------------------------------------------
+# Log-space versions (see orchid_corpus.get_log_model)
+#
+# Same table layout as the integer-indexed versions, but log-probabilities of
+# a smoothed model, so no rescaling is needed. Pruned transitions are -inf,
+# only if no state is reachable at all, decoding restarts (like above).
+
+NEG_INF = float("-inf")
+
+
+def viterbi_log(obs, initp, trans, emiss):
+    """Bigram Viterbi on a log-space model, returns the list of tag ids."""
+    return _viterbi_log(obs, initp, trans, emiss)[0]
+
+
+def _viterbi_log(obs, initp, trans, emiss, start=None):
+    """``viterbi_log`` with an optional known first tag, see ``_viterbi_ids``."""
+    num_states = len(initp)
+
+    (ids, probs) = emiss[obs[0]]
+    vtb = [NEG_INF] * num_states
+    for state, prob in zip(ids, probs):
+        if start is None:
+            vtb[state] = initp[state] + prob
+        elif state == start:
+            vtb[state] = prob
+    back = list()
+
+    for t in range(1, len(obs)):
+        prev_ids = ids
+        (ids, probs) = emiss[obs[t]]
+        prev_vtb = vtb
+        vtb = [NEG_INF] * num_states
+        ptr = [0] * num_states
+
+        for state, prob in zip(ids, probs):
+            trans_to = trans[state]
+            (max_prob, ptr[state]) = max(
+                (prev_vtb[prev] + trans_to[prev], prev) for prev in prev_ids
+            )
+            vtb[state] = max_prob + prob
+
+        if max(vtb) == NEG_INF:  # all pruned, restart with best previous state
+            (_, max_prev_state) = max((prev_vtb[prev], prev) for prev in prev_ids)
+            for state, prob in zip(ids, probs):
+                vtb[state] = initp[state] + prob
+                ptr[state] = max_prev_state
+
+        back.append(ptr)
+
+    (max_prob, state) = max((vtb[state], state) for state in ids)
+    path = [state]
+    for ptr in reversed(back):
+        state = ptr[state]
+        path.append(state)
+    path.reverse()
+    return path, max_prob != NEG_INF
+
+
+def viterbi_trigram_log(obs, initp, trans, emiss):
+    """Trigram Viterbi on a log-space model, ``trans`` is the pair
+    ``(trans_bi, trans_tri)``, returns the list of tag ids."""
+    (trans_bi, trans_tri) = trans
+    num_states = len(initp)
+
+    # first two words with bigram probabilities, then vtb[prev1][curr]
+    (ids, probs) = emiss[obs[0]]
+    first = [NEG_INF] * num_states
+    for state, prob in zip(ids, probs):
+        first[state] = initp[state] + prob
+    if len(obs) == 1:
+        return [max((first[state], state) for state in ids)[1]]
+
+    prev_ids = ids
+    (ids, probs) = emiss[obs[1]]
+    vtb = [None] * num_states
+    for prev1 in prev_ids:
+        vtb[prev1] = row = [NEG_INF] * num_states
+        for curr, prob in zip(ids, probs):
+            row[curr] = first[prev1] + trans_bi[curr][prev1] + prob
+    if max(vtb[prev1][curr] for prev1 in prev_ids for curr in ids) == NEG_INF:
+        (_, prev1) = max((first[prev1], prev1) for prev1 in prev_ids)
+        for curr, prob in zip(ids, probs):
+            vtb[prev1][curr] = initp[curr] + prob
+    back = list()
+
+    for t in range(2, len(obs)):
+        (prev2_ids, prev_ids) = (prev_ids, ids)
+        (ids, probs) = emiss[obs[t]]
+        prev_vtb = vtb
+        vtb = [None] * num_states
+        ptr = [None] * num_states
+        max_prob = NEG_INF
+
+        for prev1 in prev_ids:
+            vtb[prev1] = row = [NEG_INF] * num_states
+            ptr[prev1] = row_ptr = [0] * num_states
+            trans_from = trans_tri[prev1]
+            for curr, prob in zip(ids, probs):
+                trans_to = trans_from[curr]
+                (row[curr], row_ptr[curr]) = max(
+                    (prev_vtb[prev2][prev1] + trans_to[prev2] + prob, prev2)
+                    for prev2 in prev2_ids
+                )
+            max_prob = max(max_prob, max(row))
+
+        if max_prob == NEG_INF:  # all pruned, restart with best previous states
+            (_, prev2, prev1) = max(
+                (prev_vtb[prev2][prev1], prev2, prev1)
+                for prev2 in prev2_ids
+                for prev1 in prev_ids
+            )
+            for curr, prob in zip(ids, probs):
+                vtb[prev1][curr] = initp[curr] + prob
+                ptr[prev1][curr] = prev2
+
+        back.append(ptr)
+
+    (_, prev1, state) = max(
+        (vtb[prev1][curr], prev1, curr) for prev1 in prev_ids for curr in ids
+    )
+    path = [state, prev1]
+    for ptr in reversed(back):
+        (prev1, state) = (ptr[prev1][state], prev1)
+        path.append(prev1)
+    path.reverse()
+    return path
+
+
+# ----------------------------------------------------------------------------
+# Split decoding (bigram, integer-indexed or log-space tables)
+#
+# A word with a single possible tag (emission row of one tag: unknown English
+# words and numbers are tagged as "_NCMN", many punctuation marks and Thai
+# words have one tag) fixes the state, every path has to pass through it. So the
+# sentence can be decoded piece by piece between those words, each piece
+# starting from the tag the previous one ended with. The pieces of mixed
+# language text ("_NCMN <space> _NCMN", ...) repeat a lot and are memoized.
+# If the end of a piece is unreachable (zero probability), it is extended to
+# the next split point, so the restarts work as in a full decode. Results are
+# those of viterbi_ids/viterbi_log, except for the tie-breaking between paths
+# with the same probability (floating point rounding decides) and, for
+# unsmoothed models, the underflow rescaling of viterbi_ids (each piece starts
+# from the probability of its first word only).
+
+SPLIT_CACHE_MAX_WORDS = 16
+
+
+def viterbi_split(obs, initp, trans, emiss, log=False, cache=None):
+    """Bigram Viterbi (``viterbi_ids`` or with ``log`` ``viterbi_log``) of
+    ``obs`` decoded piece by piece, split at the words with a single possible
+    tag. Short pieces are memoized in ``cache`` (if given, a thread-safe
+    ``cache.SizedLRUCache`` per model, keyed by start tag and words).
+    Returns the list of tag ids."""
+    decode = _viterbi_log if log else _viterbi_ids
+    last = len(obs) - 1
+    path = list()
+    begin = 0
+    start = None
+
+    for end in range(1, len(obs)):
+        if end < last and len(emiss[obs[end]][0]) != 1:
+            continue
+
+        words = obs[begin : end + 1]  # noqa: E203
+        if cache is not None and start is not None:
+            key = (start, tuple(words))
+            piece = cache.get(key)
+            if piece is None:
+                (states, reachable) = decode(words, initp, trans, emiss, start)
+                piece = (tuple(states), reachable)  # shared, so immutable
+                if len(words) <= SPLIT_CACHE_MAX_WORDS:
+                    cache.put(key, piece)
+        else:
+            piece = decode(words, initp, trans, emiss, start)
+        (states, reachable) = piece
+        if not reachable and end < last:
+            continue  # decode up to the next split point
+
+        path.extend(states if start is None else states[1:])
+        start = path[-1]
+        begin = end
+
+    if not path:  # a single word
+        path = decode(obs, initp, trans, emiss)[0]
+    return path
+
+
+# ----------------------------------------------------------------------------
+# Batch versions (NumPy, see orchid_corpus.get_batch_model)
+#
+# Decode many sentences at once: ``obs`` is a 2-D array of emission row ids
+# (one sentence per row, padded), ``lengths`` the number of words of each.
+# initp and trans[curr, prev] are dense arrays, the emission rows are
+# ``emiss = (ids, probs, sizes)``: the sorted tag ids (and probabilities) of
+# each row are right-aligned in ``ids[row]``/``probs[row]`` after
+# ``len - sizes[row]`` padding slots (id 0, probability 0.0 or -inf).
+# As in the integer-indexed versions only the tags that can emit a word are
+# computed, for unsmoothed models the last tag is always included (it is the
+# fallback state). The sentences are packed longest first, so every time step
+# is a few array operations over the sentences that are still running.
+# Results are identical to viterbi_ids/viterbi_log (ties: the last state wins).
+
+
+def _argmax_last(values):
+    """Index of the last maximum along the last axis, like ``max((v, i), ...)``."""
+    last = values.shape[-1] - 1
+    return last - numpy.argmax(values[..., ::-1], axis=-1)
+
+
+def _argmax_last_of(values, mask):
+    """Like ``_argmax_last`` over the masked (True) slots of each row, if all
+    of them are -inf the last masked slot."""
+    masked = numpy.where(mask, values, NEG_INF)
+    best = _argmax_last(masked)
+    none = masked.max(axis=1) == NEG_INF
+    if none.any():
+        best[none] = _argmax_last(mask[none])
+    return best
+
+
+def _pack(obs, lengths):
+    """Sort the sentences longest first, returns ``(order, obs, lengths, active)``
+    with ``active[t]`` the number of sentences with more than ``t`` words."""
+    lengths = numpy.asarray(lengths, dtype=numpy.intp)
+    order = numpy.argsort(-lengths, kind="stable")
+    (obs, lengths) = (numpy.asarray(obs)[order], lengths[order])
+    steps = obs.shape[1]
+    active = numpy.searchsorted(-lengths, -numpy.arange(steps + 1), side="left")
+    return order, obs, lengths, active
+
+
+def _emission_slots(emiss, rows):
+    """Returns the ``(ids, probs, width)`` of the emission rows, only the last
+    ``width`` slots (enough for the row with the most tags)."""
+    (ids, probs, sizes) = emiss
+    width = int(sizes[rows].max())
+    return ids[rows, -width:], probs[rows, -width:], width
+
+
+def _unpack_paths(order, obs, lengths, active, emiss, final, back):
+    """Follow the back pointers from the final slots, returns the paths (lists
+    of tag ids) in the original order. ``back[t - 1]`` is ``(ptr, width)``:
+    the previous slot of each of the ``width`` last slots at step ``t``,
+    all slots count from the start of the emission rows."""
+    ids = emiss[0]
+    full = ids.shape[1]
+    slot = final.copy()
+    out = numpy.zeros(obs.shape, dtype=numpy.intp)
+    for t in range(obs.shape[1] - 1, 0, -1):
+        num = active[t]
+        if not num:
+            continue
+        out[:num, t] = ids[obs[:num, t], slot[:num]]
+        (ptr, width) = back[t - 1]
+        slot[:num] = ptr[numpy.arange(num), slot[:num] - (full - width)]
+    num = active[0]
+    out[:num, 0] = ids[obs[:num, 0], slot[:num]]
+
+    paths = [None] * len(order)
+    for row, index in enumerate(order.tolist()):
+        paths[index] = out[row, : lengths[row]].tolist()
+    return paths
+
+
+def viterbi_ids_batch(obs, lengths, initp, trans, emiss):
+    """Bigram Viterbi (see ``viterbi_ids``) for a batch of sentences,
+    returns the list of tag id lists."""
+    (order, obs, lengths, active) = _pack(obs, lengths)
+    full = emiss[0].shape[1]
+    final = numpy.zeros(len(lengths), dtype=numpy.intp)
+    back = list()
+
+    num = active[0]
+    if not num:
+        return _unpack_paths(order, obs, lengths, active, emiss, final, back)
+    (ids, probs, width) = _emission_slots(emiss, obs[:num, 0])
+    vtb = initp[ids] * probs
+
+    for t in range(1, obs.shape[1] + 1):
+        (num, prev_num) = (active[t], active[t - 1])
+        final[num:prev_num] = _argmax_last(vtb[num:]) + (full - width)
+        if not num:
+            break
+
+        (prev_vtb, prev_ids, prev_width) = (vtb[:num], ids[:num], width)
+        (ids, probs, width) = _emission_slots(emiss, obs[:num, t])
+
+        scores = trans[ids[:, :, None], prev_ids[:, None, :]]
+        scores *= prev_vtb[:, None, :]
+        scores *= probs[:, :, None]
+        ptr = _argmax_last(scores)
+        vtb = numpy.take_along_axis(scores, ptr[:, :, None], axis=2)[:, :, 0]
+        ptr[vtb == 0.0] = prev_width - 1  # the last tag
+
+        max_prob = vtb.max(axis=1)
+        restart = numpy.flatnonzero(max_prob < 10e-40)
+        if len(restart):  # restart with the best state (see viterbi_ids)
+            start = initp[ids[restart]] * probs[restart]
+            max_state = _argmax_last(start)
+            vtb[restart, max_state] = start[numpy.arange(len(restart)), max_state]
+            ptr[restart, max_state] = _argmax_last(prev_vtb[restart])
+        rescale = (max_prob >= 10e-40) & (max_prob < 10e-15)
+        vtb[rescale] *= 10e10
+
+        back.append((ptr + (full - prev_width), width))
+
+    return _unpack_paths(order, obs, lengths, active, emiss, final, back)
+
+
+def viterbi_log_batch(obs, lengths, initp, trans, emiss):
+    """Bigram Viterbi on a log-space model (see ``viterbi_log``) for a batch
+    of sentences, returns the list of tag id lists."""
+    (order, obs, lengths, active) = _pack(obs, lengths)
+    full = emiss[0].shape[1]
+    final = numpy.zeros(len(lengths), dtype=numpy.intp)
+    back = list()
+
+    num = active[0]
+    if not num:
+        return _unpack_paths(order, obs, lengths, active, emiss, final, back)
+    (ids, probs, width) = _emission_slots(emiss, obs[:num, 0])
+    vtb = initp[ids] + probs
+    valid = probs != NEG_INF
+
+    for t in range(1, obs.shape[1] + 1):
+        (num, prev_num) = (active[t], active[t - 1])
+        final[num:prev_num] = _argmax_last_of(vtb[num:], valid[num:]) + (full - width)
+        if not num:
+            break
+
+        (prev_vtb, prev_valid) = (vtb[:num], valid[:num])
+        (prev_ids, prev_width) = (ids[:num], width)
+        (ids, probs, width) = _emission_slots(emiss, obs[:num, t])
+
+        scores = trans[ids[:, :, None], prev_ids[:, None, :]]
+        scores += prev_vtb[:, None, :]
+        ptr = _argmax_last(scores)
+        vtb = numpy.take_along_axis(scores, ptr[:, :, None], axis=2)[:, :, 0]
+        vtb += probs
+        valid = probs != NEG_INF
+
+        restart = numpy.flatnonzero((vtb == NEG_INF).all(axis=1))
+        if len(restart):  # all pruned, restart with best previous state
+            vtb[restart] = initp[ids[restart]] + probs[restart]
+            max_prev = _argmax_last_of(prev_vtb[restart], prev_valid[restart])
+            ptr[restart] = max_prev[:, None]
+
+        back.append((ptr + (full - prev_width), width))
+
+    return _unpack_paths(order, obs, lengths, active, emiss, final, back)
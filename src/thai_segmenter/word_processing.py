@@ -16,17 +16,38 @@ class word_processing:
     filename_lexitron = "lexitron.txt"
     filename_lexitron_orig = "lexitron_original.txt"
 
-    def __init__(self, dict_file_paragraph, dict_file_words):
+    def __init__(
+        self,
+        dict_file_paragraph,
+        dict_file_words,
+        engine="longlexto",
+        tokenizer_words=None,
+    ):
+        if engine not in longlexto.ENGINES:
+            raise ValueError(
+                "Unknown segmentation engine: {} (choices: {})".format(
+                    engine, ", ".join(sorted(longlexto.ENGINES))
+                )
+            )
+        self.engine = engine
+
         self.cwd = os.path.dirname(os.path.realpath(__file__))
         self.dict_dir = os.path.join(self.cwd, "tools")
 
-        dict_file = os.path.join(self.dict_dir, word_processing.filename_lexitron)
-
-        shutil.copyfile(os.path.join(self.dict_dir, dict_file_paragraph), dict_file)
-        self.tokenizer_words = longlexto.LongLexTo.create(dict_file=dict_file)
-
-        shutil.copyfile(os.path.join(self.dict_dir, dict_file_words), dict_file)
-        self.tokenizer_subwords = longlexto.LongLexTo.create(dict_file=dict_file)
+        # engine only for words, subwords (for unknown words) always with longest matching
+        if tokenizer_words is None:
+            tokenizer_words = longlexto.ENGINES[engine].create(
+                dict_file=os.path.join(self.dict_dir, dict_file_paragraph)
+            )
+        self.tokenizer_words = tokenizer_words
+        # only built if needed (see tokenizer_subwords), unknown words are split
+        # with the vocabulary index (see orchid_corpus.get_vocabulary_index)
+        self.dict_file_words = os.path.join(self.dict_dir, dict_file_words)
+        self._tokenizer_subwords = None
+        self._lock = threading.Lock()
+
+        # dictionaries are fixed from here on, use the compact (native if available) tries
+        self.freeze()
 
         self.special = {
             " ": "<space>",
@@ -108,9 +129,36 @@ class word_processing:
 
         return words
 
+    @property
+    def tokenizer_subwords(self):
+        tokenizer = self._tokenizer_subwords
+        if tokenizer is None:
+            with self._lock:  # only while building
+                if self._tokenizer_subwords is None:
+                    tokenizer = longlexto.LongLexTo.create(
+                        dict_file=self.dict_file_words
+                    )
+                    tokenizer.freeze()
+                    self._tokenizer_subwords = tokenizer
+                tokenizer = self._tokenizer_subwords
+        return tokenizer
+
+    def freeze(self):
+        """Compact the tokenizer dictionaries into immutable tries (see LongLexTo.freeze)."""
+        self.tokenizer_words.freeze()
+        if self._tokenizer_subwords is not None:
+            self._tokenizer_subwords.freeze()
+
+    def set_custom_words(self, words):
+        """Replace the custom words of the word tokenizer (see LongLexTo.set_custom_words)."""
+        self.tokenizer_words.set_custom_words(words)
+
     def word_segment_words(self, sentence):
         return list(self.tokenizer_words.get_words(sentence))
 
+    def word_segment_spans(self, sentence):
+        return self.tokenizer_words.get_spans(sentence)
+
     def word_segment_subwords(self, word):
         return list(self.tokenizer_subwords.get_words(word))
 
@@ -1,7 +1,9 @@
 from thai_segmenter_webapp.app import create_app
+from thai_segmenter_webapp.prefork import memory_info
 
 
 def main():
+    rss_before = memory_info().get("rss", 0)
     app = create_app()
 
     app.logger.info("Routes: {}".format(app.url_map))
@@ -14,15 +16,27 @@ def main():
         app.run()
         raise SystemExit("TESTING END")
 
+    if app.config["WORKERS"] > 1:
+        # preload: model is built (once) here in the master, then shared by the workers
+        from thai_segmenter_webapp.prefork import freeze_model
+        from thai_segmenter_webapp.prefork import serve_preforked
+
+        freeze_model()
+        model_kb = memory_info().get("rss", 0) - rss_before
+        app.logger.info("Model loaded in master process: ~%s kB", model_kb)
+
+        serve_preforked(app, app.config["WORKERS"], model_kb=model_kb)
+        return
+
     try:
         # use gevent if it exists, else default run it stupid ...
         from gevent.pywsgi import WSGIServer
 
         http_server = WSGIServer((app.config["HOST"], app.config["PORT"]), app)
-        print(
-            "Run WSGIServer listening on < {}:{} > ... (Press Ctrl+C to quit.)".format(
-                app.config["HOST"], app.config["PORT"]
-            )
+        app.logger.info(
+            "Run WSGIServer listening on < %s:%s > ... (Press Ctrl+C to quit.)",
+            app.config["HOST"],
+            app.config["PORT"],
         )
         http_server.serve_forever()
     except ImportError:
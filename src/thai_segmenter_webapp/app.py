@@ -41,14 +41,21 @@ def create_app(config_object="thai_segmenter_webapp.config"):
 
     app.config.from_envvar("THAI_SEGMENTER_WEBAPP_CONFIG", silent=True)
 
+    if not app.debug:
+        app.logger.setLevel(app.config["LOG_LEVEL"])
+
     # register extensions
     sentseg.init_app(app)
 
     # register routes
     # https://stackoverflow.com/questions/25254022/flask-are-blueprints-necessary-for-app-factories
     from thai_segmenter_webapp.views import view_index
+    from thai_segmenter_webapp.views import view_segment
+    from thai_segmenter_webapp.views import view_stats
 
     app.add_url_rule("/", "view_index", view_index, methods=["GET", "POST"])
+    app.add_url_rule("/segment", "view_segment", view_segment, methods=["POST"])
+    app.add_url_rule("/stats", "view_stats", view_stats, methods=["GET"])
 
     return app
 
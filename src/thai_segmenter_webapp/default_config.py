@@ -8,3 +8,20 @@ HOST = ""  # gevent needs empty for all zones
 
 DEBUG = False
 TESTING = False
+
+# Level of the app logger (startup, worker memory, custom dictionary reloads),
+# always DEBUG if DEBUG is set.
+LOG_LEVEL = "INFO"
+
+# Number of (pre-forked) worker processes that share the model built once in
+# the master process. Requires gevent and a fork-capable OS.
+WORKERS = 1
+
+# Size (in bytes) of the per-line segmentation cache, 0 to disable.
+# Hit rate and usage are reported at ``/stats``.
+SEGMENTATION_CACHE_BYTES = 64 * 1024 * 1024
+
+# Custom dictionary file (one word per line, optional POS tag after a tab),
+# reloaded without restart if changed. Checked at most every N seconds.
+CUSTOM_DICT_FILE = None
+CUSTOM_DICT_CHECK_INTERVAL = 10
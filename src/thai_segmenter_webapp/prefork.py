@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Pre-fork serving: build the segmenter model once, then fork workers.
+
+The model (dictionary tries + ORCHID statistics) is built in the master
+process by ``create_app``, compacted with ``freeze_model`` and then the
+workers are forked. The workers share the model pages copy-on-write, so
+every additional worker only costs its private (request) memory.
+
+With gunicorn the same is achieved with ``--preload`` and the
+``thai_segmenter_webapp.wsgi:app`` module (see there).
+"""
+import gc
+import os
+import signal
+import time
+
+# ----------------------------------------------------------------------------
+
+
+def memory_info(pid="self"):
+    """Return memory stats (in kB) of a process, keys: rss, pss, shared, private.
+
+    Uses ``/proc/<pid>/smaps_rollup`` (Linux >= 4.14) with a fallback
+    to ``/proc/<pid>/status`` (rss only). Returns an empty dict if not available.
+    """
+    info = dict()
+    try:
+        with open("/proc/{}/smaps_rollup".format(pid), "r") as fp:
+            for line in fp:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    info[parts[0].rstrip(":")] = int(parts[1])
+        return {
+            "rss": info.get("Rss", 0),
+            "pss": info.get("Pss", 0),
+            "shared": info.get("Shared_Clean", 0) + info.get("Shared_Dirty", 0),
+            "private": info.get("Private_Clean", 0) + info.get("Private_Dirty", 0),
+        }
+    except (IOError, OSError, ValueError):
+        pass
+
+    try:
+        with open("/proc/{}/status".format(pid), "r") as fp:
+            for line in fp:
+                if line.startswith("VmRSS:"):
+                    return {"rss": int(line.split()[1])}
+    except (IOError, OSError, ValueError):
+        pass
+
+    return dict()
+
+
+def freeze_model():
+    """Compact the segmenter model and move all current objects into the
+    permanent GC generation so the collector does not dirty shared pages."""
+    from thai_segmenter_webapp.app import sentseg
+
+    sentseg.freeze()
+
+    gc.collect()
+    if hasattr(gc, "freeze"):  # Python 3.7+
+        gc.freeze()
+
+
+def report_worker_memory(logger, pids, model_kb=None):
+    """Log memory usage of the workers and how much each saves by sharing."""
+    for pid in pids:
+        info = memory_info(pid)
+        if not info:
+            continue
+        if "shared" not in info:
+            logger.info("Worker %s: rss=%s kB", pid, info["rss"])
+            continue
+        saved = min(info["shared"], model_kb) if model_kb else info["shared"]
+        logger.info(
+            "Worker %s: rss=%s kB, pss=%s kB, private=%s kB, shared=%s kB "
+            "(saved %s kB of model memory)",
+            pid,
+            info["rss"],
+            info["pss"],
+            info["private"],
+            info["shared"],
+            saved,
+        )
+
+
+# ----------------------------------------------------------------------------
+
+
+def serve_preforked(app, workers, model_kb=None):
+    """Bind the listening socket, fork ``workers`` gevent servers and wait.
+
+    ``app`` should already be created (model loaded) and frozen.
+    """
+    import gevent
+    from gevent.pywsgi import WSGIServer
+
+    http_server = WSGIServer((app.config["HOST"], app.config["PORT"]), app)
+    http_server.init_socket()  # bind in master, shared by all workers
+
+    pids = list()
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:  # worker
+            gevent.reinit()
+            try:
+                http_server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os._exit(0)  # pylint: disable=protected-access
+        pids.append(pid)
+
+    app.logger.info(
+        "Run %s WSGIServer workers listening on < %s:%s > ... (Press Ctrl+C to quit.)",
+        workers,
+        app.config["HOST"],
+        app.config["PORT"],
+    )
+
+    try:
+        # give workers a moment to start, then report how much memory is shared
+        time.sleep(app.config.get("PREFORK_REPORT_DELAY", 2))
+        report_worker_memory(app.logger, pids, model_kb=model_kb)
+
+        for pid in pids:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        for pid in pids:
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
@@ -1,7 +1,14 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import unicodedata
 from collections import namedtuple
-from functools import lru_cache
 from pprint import pformat
 
+from thai_segmenter.cache import SizedLRUCache
+
 # ----------------------------------------------------------------------------
 
 
@@ -12,6 +19,14 @@ class SentenceSegmenter(object):
         self.config = config
         self.app = app
         self._ss = None
+        self._cache = None
+        # custom dictionary: digest of the words in use (the version, see
+        # version), watched file
+        self._custom_dict_digest = None
+        self._custom_dict_file = None
+        self._custom_dict_mtime = None
+        self._custom_dict_next_check = 0
+        self._custom_dict_lock = threading.Lock()
         if app is not None:
             self.init_app(app, config)
 
@@ -27,115 +42,279 @@ class SentenceSegmenter(object):
         self.config = base_config
         self.app = app
 
+        cache_size = self.config.get("SEGMENTATION_CACHE_BYTES", 0)
+        self._cache = SizedLRUCache(max_bytes=cache_size) if cache_size else None
+
         self.init_segmenter()
 
+        self._custom_dict_file = self.config.get("CUSTOM_DICT_FILE")
+        if self._custom_dict_file:
+            self.check_custom_dict(force=True)
+
     def init_segmenter(self):
         self.app.logger.debug("Init sentence segmenter")
         import thai_segmenter.sentence_segmenter as _ss
 
         self._ss = _ss.sentence_segmenter()  # get segmenter class instance
-        self._ss.sentence = _ss.sentence  # add module as reference
-        self._ss.vtb = _ss.vtb  # add module as reference
         self.app.logger.debug("Sentence segmenter inited.")
 
+    def freeze(self):
+        """Compact the loaded model (see ``sentence_segmenter.freeze``),
+        e. g. before forking worker processes."""
+        if self._ss:
+            self._ss.freeze()
+
     def segment(self, line, *args, **kwargs):
         if not self._ss:
             return line
         else:
             return self._ss.sentence_segment(line, *args, **kwargs)
 
-    @lru_cache(maxsize=200)
+    @property
+    def version(self):
+        """Version of the custom dictionary, results of other versions differ.
+
+        A digest of the custom words in use (see ``custom_dict_digest``), so all
+        worker processes with the same words have the same version. The
+        segmenter swaps its dict on every change, the digest is kept per dict."""
+        custom_dict = self._ss.custom_dict if self._ss else dict()
+        digest = self._custom_dict_digest
+        if digest is None or digest[0] is not custom_dict:
+            digest = (custom_dict, custom_dict_digest(custom_dict))
+            self._custom_dict_digest = digest
+        return digest[1]
+
     def do_segmentation(self, paragraph, tri_gram=False):
-        words = self._ss.wp.word_segment_words(paragraph)
-        tmp_paragraph = self._ss.wp.clean_special_characters(words)
-        to_be_tagged, new_paragraph, replace_idx = self._ss.clean_unknown_word(
-            tmp_paragraph
+        """Segment a single line (paragraph), results are cached per normalized line.
+
+        Returns the immutable ``(paragraph, fragments, sentences)`` triple, with
+        ``SegmentedSentence`` objects whose ``pos`` are tuples of ``POSInfo``."""
+        self.check_custom_dict()
+
+        paragraph = normalize_line(paragraph)
+        if self._cache is None:
+            return self._do_segmentation(paragraph, tri_gram)
+
+        # results of previous custom dictionaries are not used anymore (and evicted over time)
+        key = (paragraph, bool(tri_gram), self.version)
+        return self._cache.get_or_compute(
+            key, lambda: self._do_segmentation(paragraph, tri_gram)
         )
-        initp, trans, emiss = self._ss.corpus.get_statistics_model(tri_gram)
-        if tri_gram:
-            path = self._ss.vtb.viterbi_trigram(
-                to_be_tagged, self._ss.corpus.pos_list_sentence, initp, trans, emiss
+
+    def update_segmentation(self, hashes, edits, version=None):
+        """Incremental segmentation of an edited text, only changed lines are segmented.
+
+        ``hashes`` are the line hashes of the previous result (see ``line_hash``,
+        ``None`` for blank lines), ``edits`` the changed lines as ``(start, end,
+        new_lines)`` that replace the previous lines ``start:end`` (sorted, not
+        overlapping) and ``version`` the custom dictionary version of the previous
+        result. A whole text is ``update_segmentation([], [(0, 0, lines)])``.
+
+        Returns ``(hashes, results, version)``: the line hashes of the edited
+        text, the results (see ``do_segmentation``) of the new lines by hash and
+        the custom dictionary version they were segmented with. Raises
+        ``OutdatedResultError`` if unchanged lines would have to be segmented
+        again (other custom dictionary) or if the custom dictionary changed while
+        segmenting, ``ValueError`` for invalid edits."""
+        self.check_custom_dict()
+        current = self.version
+
+        kept = list()  # unchanged lines before each edit, and after the last one
+        pos = 0
+        for start, end, _ in edits:
+            if not pos <= start <= end <= len(hashes):
+                raise ValueError(
+                    "Invalid edit of lines {}:{} ({} lines, previous edit ended at {}).".format(
+                        start, end, len(hashes), pos
+                    )
+                )
+            kept.append(hashes[pos:start])
+            pos = end
+        kept.append(hashes[pos:])
+
+        if version != current and any(key is not None for keys in kept for key in keys):
+            raise OutdatedResultError(
+                "Custom dictionary changed (version {}), segment the whole text again.".format(
+                    current
+                )
             )
-        else:
-            path = self._ss.vtb.viterbi(
-                to_be_tagged, self._ss.corpus.pos_list_sentence, initp, trans, emiss
+
+        new_hashes, results = list(), dict()
+        for keys, (_, _, new_lines) in zip(kept, edits):
+            new_hashes.extend(keys)
+            for line in new_lines:
+                line = normalize_line(line)
+                if not line:
+                    new_hashes.append(None)
+                    continue
+                key = line_hash(line)
+                if key not in results:
+                    results[key] = self.do_segmentation(line)
+                new_hashes.append(key)
+        new_hashes.extend(kept[-1])
+
+        if self.version != current:  # reloaded meanwhile, results may be mixed
+            raise OutdatedResultError(
+                "Custom dictionary changed (version {}), segment the whole text again.".format(
+                    self.version
+                )
+            )
+
+        return new_hashes, results, current
+
+    # ------------------------------------
+
+    def set_custom_dict(self, custom_dict):
+        """Replace the custom words on the live segmenter (see
+        ``sentence_segmenter.set_custom_dict``), cached results of other words
+        are not reused (see ``version``)."""
+        self._ss.set_custom_dict(custom_dict)
+
+    def add_custom_word(self, word, pos=None):
+        self._ss.add_custom_word(word, pos=pos)
+
+    def remove_custom_word(self, word):
+        return self._ss.remove_custom_word(word)
+
+    def check_custom_dict(self, force=False):
+        """Reload the ``CUSTOM_DICT_FILE`` if it changed. Checks the modification
+        time at most every ``CUSTOM_DICT_CHECK_INTERVAL`` seconds (per process)."""
+        if not self._custom_dict_file or not self._ss:
+            return False
+
+        now = time.time()
+        if not force and now < self._custom_dict_next_check:
+            return False
+        # only one thread checks/reloads, the others continue with the current words
+        if not self._custom_dict_lock.acquire(False):
+            return False
+        try:
+            self._custom_dict_next_check = now + self.config.get(
+                "CUSTOM_DICT_CHECK_INTERVAL", 10
+            )
+            try:
+                mtime = os.path.getmtime(self._custom_dict_file)
+            except OSError as ex:
+                self.app.logger.warning("Custom dictionary not found: %s", ex)
+                return False
+            if mtime == self._custom_dict_mtime:
+                return False
+
+            from thai_segmenter.sentence_segmenter import read_custom_dict
+
+            try:
+                custom_dict = read_custom_dict(self._custom_dict_file)
+                self.set_custom_dict(custom_dict)
+            except (IOError, OSError, ValueError) as ex:
+                # retried at the next check (e. g. if caught while being written)
+                self.app.logger.error("Loading custom dictionary failed: %s", ex)
+                return False
+            self._custom_dict_mtime = mtime
+
+            self.app.logger.info(
+                "Loaded custom dictionary %s (%s words)",
+                self._custom_dict_file,
+                len(custom_dict),
             )
-        pos = self._ss.invert_unknown_word(new_paragraph, path, replace_idx)
-        sentences, sen_with_pos = self._ss.cut_sentence(words, pos)
-        # sen_with_pos: List[List[Tuple[str, str]]] -> List1: sentences, List2: pos in sentence
+            return True
+        finally:
+            self._custom_dict_lock.release()
 
-        pos = list(
-            map(POSInfo._make, zip(words, pos, (None,) * len(pos), (None,) * len(pos)))
+    def custom_dict_stats(self):
+        """Return the number of custom words and the version as dict."""
+        if not self._ss:
+            return dict()
+        return {
+            "words": len(self._ss.custom_dict),
+            "version": self.version,
+            "file": self._custom_dict_file,
+        }
+
+    def cache_stats(self):
+        """Return cache counters (hits, misses, hit_rate, bytes, ...) as dict."""
+        if self._cache is None:
+            return dict()
+        return self._cache.stats()
+
+    def _do_segmentation(self, paragraph, tri_gram=False):
+        words, pos, fragment_spans, sentence_spans = self._ss.sentence_segment_spans(
+            paragraph, tri_gram=tri_gram
         )
-        paragraph = self._ss.sentence.sentence(paragraph, pos)
 
-        # update frag_nr in paragraph pos
+        # fragments (cut at each SBS) and frag_nr of their tokens
+        frag_nrs = [None] * len(pos)
         cut_sentences = list()
-        offset = 0
-        for fn, (sentence, sen_pos) in enumerate(zip(sentences, sen_with_pos)):
-            # for all sentences
-            cut_sentence = self._ss.sentence.sentence(sentence, sen_pos)
-            cut_sentences.append(cut_sentence)
-
-            # print('frag pos', sen_pos[0][0], [p[1] for p in sen_pos])
-            for r in range(len(pos) - offset):
-                # print('all pos ', pos[offset + r][0], [p[1] for p in pos[offset + r:offset + r + len(sen_pos)]])
-                # find matching offset in global pos sequence
-                check_sequence_ok = True
-                for c, csp in enumerate(sen_pos):
-                    # check whole fragment sequence if matches at current position
-                    check_cur_pos = pos[offset + r + c]
-                    if check_cur_pos[1] != csp[1] or check_cur_pos[0] != csp[0]:
-                        check_sequence_ok = False
-                        break
-                if check_sequence_ok:
-                    offset = offset + r
-                    break
-
-            for i in range(len(sen_pos)):
-                # for all pos in fragment - update frag_nr
-                pos[offset + i] = pos[offset + i]._replace(frag_nr=fn)
-            offset = offset + len(sen_pos)
-
-        merge_sen, merge_sen_with_pos = self._ss.merge_sentence(sentences, sen_with_pos)
-
-        # update sent_nr in paragraph pos
+        for fn, span in enumerate(fragment_spans):
+            start, end = span
+            frag_nrs[start:end] = [fn] * (end - start)
+            content, sen_pos = self._ss.span_to_sentence(words, pos, span)
+            cut_sentences.append(SegmentedSentence(content, tuple(sen_pos)))
+
+        # (merged) sentences and sent_nr of their tokens
+        sent_nrs = [None] * len(pos)
         segmented_sentences = list()
-        offset = 0
-        for sn in range(len(merge_sen)):
-            segmented_sentence = self._ss.sentence.sentence(
-                merge_sen[sn], merge_sen_with_pos[sn]
-            )
-            segmented_sentences.append(segmented_sentence)
-
-            # print('-' * 60)
-            # print('sent pos', sn, merge_sen_with_pos[sn][0][0], [p[1] for p in merge_sen_with_pos[sn]])
-            for r in range(len(pos) - offset):
-                # print('all pos ', sn, pos[offset + r][0], [p[1] for p in pos[offset + r:offset + r + len(merge_sen_with_pos[sn])]])
-                check_sequence_ok = True
-                for c, csp in enumerate(merge_sen_with_pos[sn]):
-                    # check whole sentence sequence if matches at current position
-                    check_cur_pos = pos[offset + r + c]
-                    if check_cur_pos[1] != csp[1] or check_cur_pos[0] != csp[0]:
-                        if check_cur_pos[1] == "SBS" and csp[1] == "NSBS":
-                            continue
-                        check_sequence_ok = False
-                        break
-                if check_sequence_ok:
-                    offset = offset + r
-                    break
-
-            for i in range(len(merge_sen_with_pos[sn])):
-                # for all pos in sentences - update sent_nr
-                pos[offset + i] = pos[offset + i]._replace(sent_nr=sn)
-            offset = offset + len(merge_sen_with_pos[sn])
-
-        return paragraph, cut_sentences, segmented_sentences
+        for sn, span in enumerate(sentence_spans):
+            start, end = span
+            sent_nrs[start:end] = [sn] * (end - start)
+            content, sen_pos = self._ss.span_to_sentence(words, pos, span)
+            segmented_sentences.append(SegmentedSentence(content, tuple(sen_pos)))
+
+        pos = tuple(map(POSInfo._make, zip(words, pos, frag_nrs, sent_nrs)))
+        paragraph = SegmentedSentence(paragraph, pos)
+
+        return paragraph, tuple(cut_sentences), tuple(segmented_sentences)
 
 
 POSInfo = namedtuple("POSInfo", "word pos frag_nr sent_nr".split())
 
 
+class SegmentedSentence(namedtuple("SegmentedSentence", "content pos")):
+    """Immutable (cacheable) version of ``thai_segmenter.sentence.sentence``."""
+
+    __slots__ = ()
+
+    def __str__(self):
+        return self.content
+
+
+class OutdatedResultError(ValueError):
+    """Previous result of ``SentenceSegmenter.update_segmentation`` can not be reused."""
+
+
+def normalize_line(line):
+    """Normalize a line for segmentation (and as cache key).
+    Inner whitespaces are kept as is since multiple spaces are a strong hint for sentence breaks."""
+    return unicodedata.normalize("NFC", line.strip())
+
+
+def custom_dict_digest(custom_dict):
+    """Digest of the custom words ``{word: {"pos": tag or None}}``, independent
+    of their order."""
+    items = sorted((word, info["pos"] or "") for word, info in custom_dict.items())
+    data = json.dumps(items, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+def line_hash(line):
+    """Content hash of a normalized line, identifies its result in incremental updates."""
+    return hashlib.sha1(line.encode("utf-8")).hexdigest()
+
+
+def segmentation_record(result):
+    """JSON serializable dict of a ``do_segmentation`` result (tokens with their
+    tags and fragment/sentence numbers, the sentences)."""
+    paragraph, fragments, sentences = result
+    return {
+        "text": paragraph.content,
+        "tokens": [info.word for info in paragraph.pos],
+        "tags": [info.pos for info in paragraph.pos],
+        "frag_nrs": [info.frag_nr for info in paragraph.pos],
+        "sent_nrs": [info.sent_nr for info in paragraph.pos],
+        "fragments": [fragment.content for fragment in fragments],
+        "sentences": [sentence.content for sentence in sentences],
+    }
+
+
 # ----------------------------------------------------------------------------
 
 
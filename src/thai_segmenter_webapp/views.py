@@ -1,14 +1,16 @@
 import logging
-from functools import lru_cache
 
 from flask import current_app as app
+from flask import jsonify
 from flask import render_template
 from flask import request
 
 from thai_segmenter_webapp.app import sentseg
+from thai_segmenter_webapp.segmenter import OutdatedResultError
 from thai_segmenter_webapp.segmenter import dump_tree_pos_info
 from thai_segmenter_webapp.segmenter import make_tree_for_output
 from thai_segmenter_webapp.segmenter import make_tree_pos_info
+from thai_segmenter_webapp.segmenter import segmentation_record
 
 # ----------------------------------------------------------------------------
 
@@ -17,7 +19,7 @@ from thai_segmenter_webapp.segmenter import make_tree_pos_info
 def view_index():
     if request.method == "POST":
         form = request.form
-        app.logger.info(form)
+        app.logger.debug(form)
         text = form.get("thaiText")
         add_pos = form.get("POSOutput")
         add_seg_tree = form.get("SegOutput")
@@ -34,8 +36,50 @@ def view_index():
         return render_template("index.html")
 
 
-@lru_cache(maxsize=100)
+def view_segment():
+    """JSON API for editors, after an edit only the changed lines are segmented.
+
+    Request either ``{"text": ...}`` or the previous response's ``lines`` and
+    ``version`` with the ``edits`` as ``[start, end, new_lines]`` (replacing the
+    previous lines ``start:end``). The response has the line hashes of the text
+    (``null`` for blank lines), the results of the new lines by hash (see
+    ``segmentation_record``) and the version, the client keeps the other results.
+    If the custom dictionary changed, status 409: send the whole text again."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(error="Expected a JSON object."), 400
+
+    hashes, edits, version = list(), list(), data.get("version")
+    try:
+        if "text" in data:
+            edits = [(0, 0, data["text"].split("\n"))]
+        else:
+            hashes = data.get("lines") or list()
+            edits = [
+                (int(start), int(end), lines) for start, end, lines in data["edits"]
+            ]
+        hashes, results, version = sentseg.update_segmentation(
+            hashes, edits, version=version
+        )
+    except OutdatedResultError as ex:
+        return jsonify(error=str(ex), version=sentseg.version), 409
+    except (AttributeError, KeyError, TypeError, ValueError) as ex:
+        return jsonify(error="Invalid request: {}".format(ex)), 400
+
+    app.logger.debug("Segmented %s of %s lines", len(results), len(hashes))
+    return jsonify(
+        version=version,
+        lines=hashes,
+        results={key: segmentation_record(result) for key, result in results.items()},
+    )
+
+
+def view_stats():
+    return jsonify(cache=sentseg.cache_stats(), custom_dict=sentseg.custom_dict_stats())
+
+
 def process_text(text):
+    # NOTE: caching is done per line in sentseg.do_segmentation
     lines = text.split("\n")
     lines = [line.strip() for line in lines]
     lines = [line for line in lines if line]
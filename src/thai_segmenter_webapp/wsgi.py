@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""WSGI entrypoint for external servers.
+
+Use with gunicorn in preload mode so that the model is built once in the
+master process and shared copy-on-write by all workers::
+
+    gunicorn --preload --workers 4 -k gevent thai_segmenter_webapp.wsgi:app
+"""
+from thai_segmenter_webapp.app import create_app
+from thai_segmenter_webapp.prefork import freeze_model
+
+app = create_app()
+freeze_model()
@@ -1,5 +1,986 @@
+import json
+
+import pytest
+
 from thai_segmenter.cli import main
 
+# small ORCHID corpus for the tagging tests, tests append paragraphs as needed
+ORCHID_TEST_CORPUS = (
+    "%TTitle: test\n#P1\n#1\nผมกิน ข้าว//\nผม/PPRS\nกิน/VACT\n<space>/NSBS\n"
+    "ข้าว/NCMN\n//\n#2\nกินข้าว//\nกิน/VACT\nข้าว/NCMN\n//\n"
+)
+
+
+def _orchid_file(tmp_path, extra=""):
+    """Write ``ORCHID_TEST_CORPUS`` and the ``extra`` paragraphs, returns the filename."""
+    corpus_file = tmp_path / "corpus.txt"
+    corpus_file.write_text(ORCHID_TEST_CORPUS + extra, encoding="utf-8")
+    return str(corpus_file)
+
+
+def _orchid_segmenter(corpus_file, smoothing=None):
+    from thai_segmenter.orchid_corpus import orchid_corpus
+    from thai_segmenter.sentence_segmenter import sentence_segmenter
+
+    return sentence_segmenter(corpus=orchid_corpus(corpus_file), smoothing=smoothing)
+
 
 def test_main():
     main([])
+
+
+def test_frozen_trie():
+    from thai_segmenter.longlexto import Trie
+
+    trie = Trie()
+    for word in ("ab", "abc", "b", "ก.พ."):
+        trie.add(word)
+    frozen = trie.freeze()
+
+    for string in ("", "a", "ab", "abc", "abcd", "b", "c", "ก", "ก.พ", "ก.พ."):
+        assert frozen.contains(string) == trie.contains(string)
+    assert frozen.size() == trie.size() == 4
+
+
+def test_sized_lru_cache():
+    from thai_segmenter.cache import SizedLRUCache
+
+    cache = SizedLRUCache(max_bytes=2000, max_entry_bytes=1000, sizeof=len)
+    assert cache.get_or_compute("a", lambda: "x" * 500) == "x" * 500
+    assert cache.get_or_compute("a", lambda: "not computed") == "x" * 500
+    cache.put("b", "y" * 900)
+    cache.put("c", "z" * 900)  # evicts "a" (least recently used)
+    assert "a" not in cache and "b" in cache and "c" in cache
+    assert not cache.put("d", "too large" * 200)
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 1, 1)
+    assert stats["bytes"] <= stats["max_bytes"]
+
+
+def test_sentence_spans_match_cut_and_merge():
+    from thai_segmenter.sentence_segmenter import sentence_segmenter as ss
+
+    words = ["a", "b", " ", "c", " ", "d", "e", " ", "f", " ", "g", "h", "i"]
+    pos = ["NCMN", "VACT", "SBS", "JCRG", "SBS", "JSBR", "NCMN"]
+    pos += ["NSBS", "VSTA", "SBS", "JSBR", "NSBS", "NCMN"]
+
+    sentences, sen_with_pos = ss.cut_sentence(None, words, pos)
+    merge_sen, merge_sen_with_pos = ss.merge_sentence(None, sentences, sen_with_pos)
+
+    fragment_spans = ss.cut_sentence_spans(None, pos)
+    sentence_spans = ss.merge_sentence_spans(None, pos, fragment_spans)
+    assert fragment_spans == [(0, 2), (3, 4), (5, 9), (10, 13)]
+    assert [
+        ss.span_to_sentence(None, words, pos, span) for span in sentence_spans
+    ] == list(zip(merge_sen, merge_sen_with_pos))
+
+
+def test_longlexto_spans(tmp_path):
+    from thai_segmenter.longlexto import LongLexTo
+
+    dict_file = tmp_path / "dict.txt"
+    dict_file.write_text("\n".join(["ผม", "ชอบ", "กิน", "ข้าว"]), encoding="utf-8")
+    tokenizer = LongLexTo(str(dict_file), raise_errors=True)
+
+    text = "ผมชอบกินข้าว hello 123"
+    spans = tokenizer.get_spans(text)
+    assert list(spans.words()) == list(tokenizer.get_words(text))
+    assert [typ for _, _, typ in spans] == [1, 1, 1, 1, 4, 3, 4, 3]
+    assert spans[-1] == (len(text) - 3, len(text), 3)
+
+
+def test_longlexto_character_runs(tmp_path):
+    from thai_segmenter.longlexto import LongLexTo
+
+    dict_file = tmp_path / "dict.txt"
+    dict_file.write_text("\n".join(["ผม", "ชอบ", "ก.พ."]), encoding="utf-8")
+    tokenizer = LongLexTo(str(dict_file), raise_errors=True)
+
+    # runs at the end of the text do not swallow the following character
+    assert list(tokenizer.get_words("ผมชอบ Hello!")) == ["ผม", "ชอบ", " ", "Hello", "!"]
+    assert list(tokenizer.get_words("1,234.5%")) == ["1,234.5", "%"]
+    assert list(tokenizer.get_words("“ok”...")) == ["“", "ok", "”", ".", ".", "."]
+    # dictionary words may span non-Thai characters
+    assert list(tokenizer.get_words("ผมก.พ.ok")) == ["ผม", "ก.พ.", "ok"]
+
+
+def test_trie_backends_identical(tmp_path):
+    import os
+    import random
+
+    import thai_segmenter
+    from thai_segmenter.longlexto import TRIE_BACKENDS
+    from thai_segmenter.longlexto import LongLexTo
+    from thai_segmenter.longlexto import compact_trie
+    from thai_segmenter.longlexto import marisa_trie
+
+    words = [
+        "ผม",
+        "ชอบ",
+        "กิน",
+        "ข้าว",
+        "ข้า",
+        "กินข้าว",
+        "ก.พ.",
+        "ชอบกิน",
+        "ไป",
+        "ไปไหน",
+    ]
+    dict_file = tmp_path / "dict.txt"
+    dict_file.write_text("\n".join(words), encoding="utf-8")
+
+    rnd = random.Random(42)
+    pieces = words + ["ก", "เ", "่", "ๆ", " ", "abc", "12", "!", "."]
+    texts = [
+        "".join(rnd.choice(pieces) for _ in range(rnd.randint(1, 25)))
+        for _ in range(300)
+    ]
+
+    def tokenize_all(tokenizer):
+        results = list()
+        for text in texts:
+            tokenizer.word_instance(text)
+            results.append((list(tokenizer.index_list), list(tokenizer.type_list)))
+        return results
+
+    expected = tokenize_all(LongLexTo(str(dict_file), raise_errors=True))
+    for backend in TRIE_BACKENDS:
+        if backend == "marisa" and marisa_trie is None:
+            continue
+        tokenizer = LongLexTo(str(dict_file), raise_errors=True)
+        tokenizer.freeze(backend=backend)
+        assert tokenize_all(tokenizer) == expected, backend
+        # ascending end positions, as the tokenizers expect
+        assert tokenizer.dict_.prefix_ends("ชอบกินข้าว") == [3, 6], backend
+
+    # the shipped dictionary: long words and overlapping prefixes, mixed scripts
+    lexitron = os.path.join(
+        os.path.dirname(thai_segmenter.__file__), "tools", "lexitron_original.txt"
+    )
+    reference = LongLexTo(lexitron, raise_errors=True)
+    with open(lexitron, encoding="utf-8") as fp:
+        dict_words = sorted(set(line.strip() for line in fp if line.strip()))
+    pieces = rnd.sample(dict_words, 500) + sorted(dict_words, key=len)[-100:]
+    pieces += ["Hello", "abc", "12", "3.5", " ", "!", "-", "ๆ", "😀", "𝐀", "é"]
+    texts = [
+        "".join(rnd.choice(pieces) for _ in range(rnd.randint(1, 12)))
+        for _ in range(300)
+    ]
+
+    def prefix_ends_all(trie):
+        return [
+            [list(trie.prefix_ends(text, begin)) for begin in range(len(text))]
+            for text in texts
+        ]
+
+    expected_ends = prefix_ends_all(reference.dict_)
+    assert all(ends == sorted(ends) for per_text in expected_ends for ends in per_text)
+    expected = [reference.word_offsets(text) for text in texts]
+    for backend in TRIE_BACKENDS:
+        if backend == "marisa" and marisa_trie is None:
+            continue
+        trie = compact_trie(reference.dict_, backend=backend)
+        assert prefix_ends_all(trie) == expected_ends, backend
+        tokenizer = LongLexTo.from_trie(trie)
+        assert [tokenizer.word_offsets(text) for text in texts] == expected, backend
+
+
+def test_maxmatch_fewest_words(tmp_path):
+    from thai_segmenter.longlexto import LongLexTo
+    from thai_segmenter.longlexto import MaxMatch
+
+    dict_file = tmp_path / "dict.txt"
+    dict_file.write_text(
+        "\n".join(["ตา", "ตาก", "กลม", "ลม", "ก.พ."]), encoding="utf-8"
+    )
+
+    # longest matching takes "ตาก" first, maximal matching finds "ตา|กลม"
+    # ("ตาก|ลม" has as many words, so the last word is marked as ambiguous)
+    assert list(LongLexTo(str(dict_file)).get_words("ตากลม")) == ["ตาก", "ลม"]
+    tokenizer = MaxMatch(str(dict_file), raise_errors=True)
+    assert list(tokenizer.get_words("ตากลม")) == ["ตา", "กลม"]
+    assert tokenizer.word_offsets("ตากลม") == ([2, 5], [1, 2])
+
+    # unknown characters are combined, words may span non-Thai characters
+    assert list(tokenizer.get_words("ตาขขลม ก.พ.!")) == [
+        "ตา",
+        "ขข",
+        "ลม",
+        " ",
+        "ก.พ.",
+        "!",
+    ]
+    assert list(tokenizer.get_spans("ตาขขลม ก.พ.!").types) == [1, 0, 1, 4, 1, 4]
+
+
+def test_vocabulary_index_split():
+    from thai_segmenter.longlexto import VocabularyIndex
+
+    index = VocabularyIndex(["ด้าน", "หน้า", "หน", "มาตรฐาน", "ตา", "ตาก", "ลม"])
+    assert index.split("ด้านหน้า") == (["ด้าน", "หน้า"], 4)
+    # longest subwords first, but only if the rest can be split, too
+    assert index.split("ตากลม") == (["ตาก", "ลม"], 3)
+    assert index.split("ตาลม") == (["ตา", "ลม"], 2)
+    # not decomposable: longest known prefix only
+    assert index.split("มาตรฐานสากล") == (None, 7)
+    assert index.split("สากล") == (None, 0)
+
+
+def test_longlexto_custom_words(tmp_path):
+    from thai_segmenter.longlexto import LongLexTo
+
+    dict_file = tmp_path / "dict.txt"
+    dict_file.write_text("\n".join(["ผม", "ชอบ"]), encoding="utf-8")
+    tokenizer = LongLexTo(str(dict_file), raise_errors=True)
+    tokenizer.freeze()
+
+    text = "ผมชอบไอโฟน"
+    words = list(tokenizer.get_words(text))
+    tokenizer.set_custom_words(["ไอโฟน", "ไอ"])
+    assert list(tokenizer.get_words(text)) == ["ผม", "ชอบ", "ไอโฟน"]
+    assert list(tokenizer.get_spans(text).types) == [1, 1, 1]
+
+    tokenizer.set_custom_words([])
+    assert list(tokenizer.get_words(text)) == words
+
+
+def test_viterbi_ids_identical():
+    import random
+    from array import array
+
+    from thai_segmenter import viterbi as vtb
+
+    rnd = random.Random(5)
+    tags = ["NCMN", "NSBS", "PUNC", "SBS", "VACT"]
+    probs = [0, 0, 0.5, 0.25, 1e-30]  # with ties and underflows
+    initp = {tag: rnd.choice(probs) for tag in tags}
+    trans_bi = {t1: {t2: rnd.choice(probs) for t2 in tags} for t1 in tags}
+    trans_tri = {t1: dict((t2, dict(trans_bi[t2])) for t2 in tags) for t1 in tags}
+    emiss = {"_" + tag: {t: int(t == tag) for t in tags} for tag in tags}
+    emiss.update(
+        ("w{}".format(i), {t: rnd.choice(probs) for t in tags}) for i in range(4)
+    )
+
+    tag_ids = {tag: i for i, tag in enumerate(tags)}
+    initp_ids = array("d", (initp[tag] for tag in tags))
+    trans_bi_ids = [array("d", (trans_bi[t1][t2] for t1 in tags)) for t2 in tags]
+    trans_tri_ids = [
+        [array("d", (trans_tri[t1][t2][t3] for t1 in tags)) for t3 in tags]
+        for t2 in tags
+    ]
+    emiss_ids = {
+        word: (
+            array("B", (tag_ids[t] for t in tags if row[t])),
+            array("d", (row[t] for t in tags if row[t])),
+        )
+        for word, row in emiss.items()
+    }
+
+    for _ in range(50):
+        obs = [rnd.choice(list(emiss)) for _ in range(rnd.randint(1, 8))]
+        path = vtb.viterbi_ids(obs, initp_ids, trans_bi_ids, emiss_ids)
+        assert [tags[i] for i in path] == vtb.viterbi(
+            obs, set(tags), initp, trans_bi, emiss
+        )
+        path = vtb.viterbi_trigram_ids(obs, initp_ids, trans_tri_ids, emiss_ids)
+        assert [tags[i] for i in path] == vtb.viterbi_trigram(
+            obs, set(tags), initp, trans_tri, emiss
+        )
+
+
+def test_viterbi_log_best_path():
+    import itertools
+    import math
+    import random
+    from array import array
+
+    from thai_segmenter import viterbi as vtb
+
+    rnd = random.Random(7)
+    num = 4
+
+    def log_row():
+        return array("d", (math.log(rnd.uniform(1e-3, 1)) for _ in range(num)))
+
+    initp = log_row()
+    trans_bi = [log_row() for _ in range(num)]
+    trans_tri = [[log_row() for _ in range(num)] for _ in range(num)]
+    emiss = {
+        "_B": (array("B", [1]), array("d", [0.0])),
+        "w": (array("B", [0, 2, 3]), array("d", [-1.0, -0.5, -2.0])),
+        "x": (array("B", range(num)), log_row()),
+    }
+
+    def score(obs, path, tri_gram):
+        total = initp[path[0]]
+        for t, (word, state) in enumerate(zip(obs, path)):
+            (ids, probs) = emiss[word]
+            if state not in ids:
+                return float("-inf")
+            total += probs[list(ids).index(state)]
+            if t == 1 or (t and not tri_gram):
+                total += trans_bi[state][path[t - 1]]
+            elif t > 1:
+                total += trans_tri[path[t - 1]][state][path[t - 2]]
+        return total
+
+    for _ in range(20):
+        obs = [rnd.choice(list(emiss)) for _ in range(rnd.randint(1, 6))]
+        paths = list(itertools.product(range(num), repeat=len(obs)))
+        for tri_gram in (False, True):
+            if tri_gram:
+                path = vtb.viterbi_trigram_log(obs, initp, (trans_bi, trans_tri), emiss)
+            else:
+                path = vtb.viterbi_log(obs, initp, trans_bi, emiss)
+            best = max(score(obs, other, tri_gram) for other in paths)
+            assert math.isclose(score(obs, path, tri_gram), best)
+
+
+def test_viterbi_split():
+    import math
+    import random
+    from array import array
+
+    from thai_segmenter import viterbi as vtb
+
+    rnd = random.Random(11)
+    num = 4
+
+    def row():
+        return array("d", (rnd.uniform(1e-3, 1) for _ in range(num)))
+
+    initp = row()
+    trans = [row() for _ in range(num)]
+    emiss = {
+        "_A": (array("B", [0]), array("d", [1.0])),
+        "_B": (array("B", [1]), array("d", [1.0])),
+        "w": (array("B", [0, 2, 3]), array("d", [0.3, 0.5, 0.2])),
+        "x": (array("B", range(num)), row()),
+    }
+
+    def log(table):
+        return array("d", (math.log(prob) for prob in table))
+
+    log_initp = log(initp)
+    log_trans = [log(probs) for probs in trans]
+    log_emiss = {word: (ids, log(probs)) for word, (ids, probs) in emiss.items()}
+
+    def score(obs, path):
+        total = log_initp[path[0]]
+        for t, (word, state) in enumerate(zip(obs, path)):
+            (ids, probs) = log_emiss[word]
+            total += probs[list(ids).index(state)]
+            if t:
+                total += log_trans[state][path[t - 1]]
+        return total
+
+    from thai_segmenter.cache import SizedLRUCache
+
+    cache = SizedLRUCache()
+    log_cache = SizedLRUCache(max_bytes=4096)  # evicts
+    for _ in range(30):
+        obs = [rnd.choice(list(emiss)) for _ in range(rnd.randint(1, 12))]
+        best = score(obs, vtb.viterbi_ids(obs, initp, trans, emiss))
+        path = vtb.viterbi_split(obs, initp, trans, emiss, cache=cache)
+        assert math.isclose(score(obs, path), best)
+        assert vtb.viterbi_split(obs, initp, trans, emiss, cache=cache) == path
+        path = vtb.viterbi_split(
+            obs, log_initp, log_trans, log_emiss, log=True, cache=log_cache
+        )
+        assert math.isclose(score(obs, path), best)
+    assert len(cache) and cache.stats()["hits"]
+    assert len(log_cache) and log_cache.stats()["evictions"]
+
+
+def test_model_builder_counts(tmp_path):
+    from thai_segmenter.model_builder import build_counts
+    from thai_segmenter.orchid_corpus import orchid_corpus
+
+    paragraphs = [
+        "#P1\n#1\nผมกิน//\nผม/PPRS\nกิน/VACT\n//\n#2\nกิน ข้าว//\n"
+        "กิน/VACT\n<space>/PUNC\nข้าว/NCMN\n//\n",
+        "#P2\n#1\nข้าว//\nข้าว/NCMN\n//\n",
+    ]
+    corpus_file = tmp_path / "corpus.txt"
+    corpus_file.write_text("%TTitle: test\n" + "".join(paragraphs), encoding="utf-8")
+    part_files = [tmp_path / "part1.txt", tmp_path / "part2.txt"]
+    for part_file, paragraph in zip(part_files, paragraphs):
+        part_file.write_text(paragraph, encoding="utf-8")
+
+    corpus = orchid_corpus(str(corpus_file))
+    assert corpus.counts.paragraphs == 2  # incl. the last paragraph
+    assert corpus.counts.emissions["<space>", "SBS"] == 1
+    # raw corpus not kept, but can be read again
+    assert not corpus.corpus and len(corpus.get_corpus_pos()) == 3
+    kept = orchid_corpus(str(corpus_file), keep_corpus=True)
+    assert kept.corpus_sentence == corpus.get_corpus_sentence()
+
+    counts = build_counts([str(f) for f in part_files], workers=1, chunk_size=10)
+    assert vars(counts) == vars(corpus.counts)
+
+    model_file = str(tmp_path / "model.json.gz")
+    counts.save(model_file)
+    loaded = orchid_corpus(model_file=model_file)
+    assert loaded.initp == corpus.initp and loaded.emiss == corpus.emiss
+    assert loaded.trans_tri == corpus.trans_tri and loaded.pos_list == corpus.pos_list
+
+
+def test_sentence_serialization():
+    from thai_segmenter.sentence import sentence
+
+    pos = [("ผม", "PPRS"), (" ", "NSBS"), ("ok", "CUSTOM_TAG")]
+    sent = sentence("ผม ok", pos)
+    assert sent.pos == pos and str(sent) == "ผม ok" and len(sent) == 3
+
+    for copy in (
+        sentence(from_str=repr(sent)),
+        sentence.from_json(sent.to_json()),
+        sentence.from_bytes(sent.to_bytes()),
+    ):
+        assert copy.pos == pos and copy.content == sent.content
+
+    other = sentence("differing content", pos)
+    assert sentence.from_bytes(other.to_bytes()).content == "differing content"
+
+
+def test_line_column_mapper():
+    from thai_segmenter.cli import parse_column
+    from thai_segmenter.tasks import line_column_mapper
+
+    def upper(text):
+        return text.upper()
+
+    lines = ["a\tb\tc\n", "a\n", "\n", " x \n"]
+    summary = dict()
+    assert list(line_column_mapper(lines, upper, 1, summary=summary)) == [
+        "a\tB\tc",
+        "a",  # missing column, passed through
+        " x ",
+    ]
+    assert summary == {"lines": 4, "headers": 0, "skipped": 2}
+    assert list(line_column_mapper(lines[:1], upper, [2, 0])) == ["A\tb\tC"]
+    assert list(line_column_mapper(lines, upper)) == ["A\tB\tC", "A", "X"]
+    assert list(line_column_mapper(["a b\tc\n"], str.split, 0)) == ["a\tc", "b\tc"]
+
+    csv_lines = ["id,text\n", '1,"a, b"\n']
+    assert list(line_column_mapper(csv_lines, upper, "text", "csv")) == [
+        "id,text",
+        '1,"A, B"',
+    ]
+    jsonl = ['{"id": 1, "text": "a"}\n', '{"id": 2, "text": \n', '{"id": 3}\n']
+    summary = dict()
+    assert list(line_column_mapper(jsonl, upper, "text", "jsonl", summary=summary)) == [
+        '{"id": 1, "text": "A"}',
+        '{"id": 2, "text":',  # malformed, passed through
+        '{"id": 3}',
+    ]
+    assert summary["skipped"] == 2
+
+    assert parse_column("2") == 1 and parse_column("1,3") == [0, 2]
+    assert parse_column("text", "csv") == "text"
+    with pytest.raises(ValueError):
+        parse_column("text")
+
+
+def test_line_deduplicator(tmp_path):
+    from thai_segmenter.cache import SizedLRUCache
+    from thai_segmenter.dedup import Deduplicator
+    from thai_segmenter.tasks import get_deduplicator
+    from thai_segmenter.tasks import line_column_mapper
+    from thai_segmenter.tasks import line_deduplicator
+
+    lines = [
+        "a b c d e f g h\n",
+        "x y\n",
+        "a b c d e f g h\n",
+        "\n",
+        "a b c d e f g h i\n",
+    ]
+    summary = dict()
+    assert list(line_deduplicator(lines, summary=summary)) == [
+        "a b c d e f g h\n",
+        "x y\n",
+        "\n",
+        "a b c d e f g h i\n",
+    ]
+    assert summary == {"unique": 3, "duplicates": 1, "near_duplicates": 0}
+
+    near = Deduplicator(tokenize_fun=str.split)
+    assert list(line_deduplicator(lines, near, summary=summary)) == lines[:2] + ["\n"]
+    assert summary["near_duplicates"] == 1
+    # the tokenizer of the task, else only the dictionary (no tagging model)
+    near = get_deduplicator(near_duplicates=True, tokenize_fun=str.split)
+    assert list(line_deduplicator(lines, near)) == lines[:2] + ["\n"]
+    near = get_deduplicator(near_duplicates=True, engine="maxmatch")
+    assert list(
+        line_deduplicator(["ผมกินข้าว กินข้าว", "ผมกินข้าว กินข้าว!"], near)
+    ) == ["ผมกินข้าว กินข้าว"]
+
+    # filter in file, kept for later runs
+    filename = str(tmp_path / "dedup.bloom")
+    for expected in (lines[:2], []):
+        deduplicator = Deduplicator(filename=filename)
+        assert list(line_deduplicator(lines[:3], deduplicator)) == expected
+        deduplicator.close()
+
+    summary = dict()
+    cache = SizedLRUCache()
+    output = line_column_mapper(lines, str.upper, cache=cache, summary=summary)
+    assert list(output) == [line.strip().upper() for line in lines if line.strip()]
+    assert summary["reused"] == 1
+
+
+def test_output_formats():
+    import io
+
+    from thai_segmenter.formats import format_conllu
+    from thai_segmenter.formats import write_binary_records
+    from thai_segmenter.formats import write_text_records
+    from thai_segmenter.sentence import sentence
+    from thai_segmenter.tasks import sentence_record
+
+    pos = [("ผม", "PPRS"), ("กิน", "VACT"), (" ", "NSBS"), ("a|b", "NCMN")]
+    sent = sentence("ผมกิน a|b", pos)
+    record = sentence_record(sent)
+    assert record["starts"] == [0, 2, 5, 6] and record["ends"] == [2, 5, 6, 9]
+
+    out = io.StringIO()
+    write_text_records([record], out, "jsonl")
+    assert json.loads(out.getvalue()) == record
+
+    conllu = format_conllu(record, sent_id=1).split("\n")
+    assert conllu[1] == "# text = ผมกิน a|b" and len(conllu) == 5
+    assert conllu[2].split("\t")[:5] == ["1", "ผม", "_", "_", "PPRS"]
+    assert conllu[2].endswith("\tTokenRange=0:2|SpaceAfter=No")
+    assert conllu[4].split("\t")[1::4] == ["a|b", "_", "TokenRange=6:9"]
+
+    pyarrow = pytest.importorskip("pyarrow")
+    out = io.BytesIO()
+    write_binary_records([record] * 3, out, "arrow", rows_per_batch=2)
+    table = pyarrow.ipc.open_stream(out.getvalue()).read_all()
+    assert table.to_pylist() == [record] * 3
+
+
+def test_longlexto_concurrent(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from thai_segmenter.longlexto import LongLexTo
+    from thai_segmenter.longlexto import MaxMatch
+    from thai_segmenter.sentence import TAGS
+    from thai_segmenter.sentence import tag_to_id
+
+    dict_file = tmp_path / "dict.txt"
+    dict_file.write_text("\n".join(["ตา", "ตาก", "กลม", "ลม", "ผม"]), encoding="utf-8")
+    texts = ["ตากลม ผม", "ผมตาก", "ลมตากลม abc", "ตาขขลม!"] * 50
+
+    for engine in (LongLexTo, MaxMatch):
+        tokenizer = engine(str(dict_file), raise_errors=True)
+        tokenizer.freeze()
+        expected = [list(tokenizer.get_words(text)) for text in texts]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(
+                executor.map(lambda text: list(tokenizer.get_words(text)), texts)
+            )
+        assert results == expected
+
+    # new tags (custom dictionary, boundary model) interned by many threads
+    tags = ["_CONCURRENT{}".format(i) for i in range(16)] * 8
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        tag_ids = list(executor.map(tag_to_id, tags))
+    assert [TAGS[tid] for tid in tag_ids] == tags
+    assert len(set(tag_ids)) == 16 and len(TAGS) == len(set(TAGS))
+
+
+def test_shared_model(tmp_path):
+    from thai_segmenter.shared_model import attach_segmenter
+    from thai_segmenter.shared_model import is_model_image
+    from thai_segmenter.shared_model import share_model
+    from thai_segmenter.shared_model import write_model_image
+
+    corpus_file = _orchid_file(tmp_path)
+    texts = ["ผมกินข้าว ไอโฟน abc", "ข้าวผมกินกิน 12 ข้าว"]
+
+    for smoothing in (None, 0.1):
+        segmenter = _orchid_segmenter(corpus_file, smoothing=smoothing)
+        segmenter.add_custom_word("ไอโฟน", pos="NCMN")
+        expected = [segmenter.tag_paragraph(text, tri_gram=True) for text in texts]
+
+        image_file = str(tmp_path / "model.tsm")
+        write_model_image(segmenter, image_file)
+        assert is_model_image(image_file) and not is_model_image(corpus_file)
+        attached = [attach_segmenter(filename=image_file)]
+        with share_model(segmenter) as shared:
+            attached.append(attach_segmenter(name=shared.name))
+            for other in attached:
+                assert other.custom_dict == segmenter.custom_dict
+                assert other.corpus.exists("กิน") and not other.corpus.exists("_NCMN")
+                assert [
+                    other.tag_paragraph(text, tri_gram=True) for text in texts
+                ] == expected
+
+
+def test_pos_tag_batch(tmp_path):
+    import random
+
+    pytest.importorskip("numpy")
+    from thai_segmenter.cache import SizedLRUCache
+    from thai_segmenter.tasks import line_column_mapper
+    from thai_segmenter.tasks import line_tokenize_and_tagger
+    from thai_segmenter.tasks import sentence_segment_batch
+    from thai_segmenter.tasks import tokenize_and_postag
+    from thai_segmenter.tasks import tokenize_and_postag_batch
+
+    corpus_file = _orchid_file(tmp_path, "#3\nข้าว//\nข้าว/VACT\n//\n")
+    rnd = random.Random(3)
+    for smoothing in (None, 0.1):
+        segmenter = _orchid_segmenter(corpus_file, smoothing=smoothing)
+        words = sorted(segmenter.corpus.emiss_ids)
+        batch = [
+            [rnd.choice(words) for _ in range(rnd.randint(1, 9))] for _ in range(40)
+        ]
+        expected = [segmenter.pos_tag(to_be_tagged) for to_be_tagged in batch]
+        assert segmenter.pos_tag_batch(batch) == expected
+
+        texts = ["ผมกินข้าว abc", "ข้าว", "กิน 12 ข้าวผม"]
+        assert [
+            sentence.pos for sentence in tokenize_and_postag_batch(texts, segmenter)
+        ] == [tokenize_and_postag(text, segmenter).pos for text in texts]
+
+        texts.append("ผมกิน ข้าว กินข้าว")
+        for boundary_only, breaks in (
+            (False, "viterbi"),
+            (True, "viterbi"),
+            (False, "spaces"),
+        ):
+            expected = [
+                [
+                    (str(sentence), sentence.pos)
+                    for sentence in segmenter.sentence_segment(
+                        text, boundary_only=boundary_only, breaks=breaks
+                    )
+                ]
+                for text in texts
+            ]
+            assert [
+                [(str(sentence), sentence.pos) for sentence in sentences]
+                for sentences in sentence_segment_batch(
+                    texts, segmenter, boundary_only=boundary_only, breaks=breaks
+                )
+            ] == expected
+
+    # batches of texts, results in order, repeated texts from the cache
+    calls, summary = list(), dict()
+    lines = ["a\tx", "b\ty", "a\tz", "c\tx"]
+    assert list(
+        line_column_mapper(
+            lines,
+            lambda texts: calls.append(texts) or [text.upper() for text in texts],
+            column=[0, 1],
+            summary=summary,
+            cache=SizedLRUCache(),
+            batch_size=3,
+        )
+    ) == ["A\tX", "B\tY", "A\tZ", "C\tX"]
+    assert calls == [["a", "x", "b"], ["y", "z"], ["c"]]
+    assert summary["reused"] == 2 and summary["lines"] == 4
+
+    # lines reused from the cache are counted as output
+    lines = ["ผมกิน ข้าว", "กินข้าว", "ผมกิน ข้าว", "ข้าว"]
+    summaries = list()
+    for cache, batch_size in (
+        (None, None),
+        (SizedLRUCache(), None),
+        (SizedLRUCache(), 2),
+    ):
+        summary = dict()
+        output = list(
+            line_tokenize_and_tagger(
+                lines,
+                summary=summary,
+                cache=cache,
+                batch_size=batch_size,
+                segmenter=segmenter,
+            )
+        )
+        assert output[0] == output[2] and len(output) == 4
+        summaries.append((summary.pop("reused", 0), summary))
+    assert [reused for reused, _ in summaries] == [0, 1, 1]
+    assert summaries[0][1] == summaries[1][1] == summaries[2][1]
+    assert summaries[0][1]["sentences"] == 4
+
+
+def test_boundary_model(tmp_path):
+    from thai_segmenter.evaluation import compare_boundaries
+    from thai_segmenter.orchid_corpus import BOUNDARY_OTHER
+    from thai_segmenter.orchid_corpus import orchid_corpus
+    from thai_segmenter.sentence_segmenter import sentence_segmenter
+
+    corpus_file = _orchid_file(
+        tmp_path,
+        "#3\nและกินข้าว//\nและ/JCRG\nกิน/VACT\nข้าว/NCMN\n//\n"
+        "#P2\n#1\nข้าว//\nข้าว/VACT\n//\n#2\nกว่ากิน//\nกว่า/JCMP\nกิน/VACT\n//\n",
+    )
+    corpus = orchid_corpus(corpus_file)
+    counts = corpus.counts.map_tags(lambda pos: pos[0])
+    assert counts.bigrams["N", "S"] == corpus.counts.bigrams["NCMN", "SBS"]
+    assert counts.emissions["ข้าว", "N"] == 3
+    assert counts.emissions["ข้าว", "V"] == 1
+
+    texts = ["ผมกินข้าว และกินข้าว ไอโฟน", "กินข้าว กว่ากิน abc"]
+    for smoothing in (None, 0.1):
+        segmenter = sentence_segmenter(corpus=corpus, smoothing=smoothing)
+        segmenter.add_custom_word("ไอโฟน", pos="NCMN")
+        boundary_corpus = corpus.get_boundary_corpus(smoothing=smoothing)
+        assert boundary_corpus is corpus.get_boundary_corpus(smoothing=smoothing)
+        assert boundary_corpus.tags == ["JCRG", "NSBS", "SBS", BOUNDARY_OTHER]
+
+        for text in texts:
+            sentences = segmenter.sentence_segment(text, boundary_only=True)
+            assert "".join(sentence.content for sentence in sentences).replace(
+                " ", ""
+            ) == text.replace(" ", "")
+            assert set(tag for sentence in sentences for tag in sentence.tags()) <= set(
+                boundary_corpus.tags
+            )
+
+        result = compare_boundaries([corpus_file], segmenter)
+        assert (result["paragraphs"], result["breaks"]) == (2, 3)
+        assert 0.0 <= result["boundary"]["f1"] <= 1.0
+        assert 0.0 <= result["boundary"]["same"] <= 1.0
+
+
+def test_space_classifier(tmp_path):
+    segmenter = _orchid_segmenter(_orchid_file(tmp_path))
+    corpus = segmenter.corpus
+    word_tags, sbs = corpus.get_space_model()
+    assert corpus.get_space_model() is corpus.get_space_model()
+    assert word_tags["ข้าว"] == "NCMN" and word_tags["กิน"] == "VACT"
+    assert ("NCMN", "VACT") in sbs and ("VACT", "NCMN") not in sbs
+
+    words = ["<space>", "กิน", "<space>", "ข้าว", "<space>", "<space>", "กิน", "xyz"]
+    assert segmenter.tag_spaces(words) == [
+        "NSBS",
+        "VACT",
+        "NSBS",
+        "NCMN",
+        "SBS",
+        "NSBS",
+        "VACT",
+        "NCMN",
+    ]
+
+    sentences = segmenter.sentence_segment("กิน ข้าว กินข้าว", breaks="spaces")
+    assert [sentence.content for sentence in sentences] == ["กิน ข้าว", "กินข้าว"]
+    with pytest.raises(ValueError):
+        segmenter.sentence_segment("กิน ข้าว", breaks="foo")
+
+
+def test_batch_chars():
+    from thai_segmenter.tasks import line_column_mapper
+
+    read = list()
+
+    def lines():
+        for text in ["ab", "cd", "efghijk", "l", "m", "n", "o", "pq"]:
+            read.append(text)
+            yield text
+
+    calls, output = list(), list()
+    for line in line_column_mapper(
+        lines(),
+        lambda texts: calls.append(texts) or [text.upper() for text in texts],
+        batch_size=3,
+        batch_chars=5,
+    ):
+        output.append((line, len(read)))
+    assert [line for line, _ in output] == list("AB CD EFGHIJK L M N O PQ".split())
+    assert calls == [["ab", "cd"], ["efghijk"], ["l", "m", "n"], ["o", "pq"]]
+    # streaming, only read ahead for the current batch (and the next text)
+    assert [num_read for _, num_read in output][:3] == [3, 3, 4]
+
+    # records are parsed once, passed through lines keep their position
+    inputs = {
+        "tsv": (["h\tx", "ab\tcd", "skip", "e\tfgh", "", "ij\tk"], 1),
+        "csv": (["h,x", "ab,cd", "skip", "e,fgh", "", "ij,k"], "x"),
+        "jsonl": (['{"x": "ab"}', "[1]", '{"x": "fgh", "y": 1}', '{"x": "k"}'], "x"),
+    }
+    for input_format, (lines, column) in inputs.items():
+        expected = list(
+            line_column_mapper(
+                lines, str.upper, column=column, input_format=input_format
+            )
+        )
+        for batch_size, batch_chars in ((None, 1), (2, None), (None, 5), (1, 100)):
+            summary = dict()
+            assert (
+                list(
+                    line_column_mapper(
+                        lines,
+                        lambda texts: [text.upper() for text in texts],
+                        column=column,
+                        input_format=input_format,
+                        summary=summary,
+                        batch_size=batch_size,
+                        batch_chars=batch_chars,
+                    )
+                )
+                == expected
+            ), (input_format, batch_size, batch_chars)
+            assert summary["skipped"] == 1
+
+    with pytest.raises(ValueError):
+        list(line_column_mapper(["a"], lambda texts: texts, batch_chars=0))
+
+
+# ----------------------------------------------------------------------------
+# webapp (optional: Flask)
+
+
+def _webapp_corpus(tmp_path, monkeypatch):
+    """Use a small corpus as default corpus for the webapp segmenter."""
+    from thai_segmenter import orchid_corpus
+
+    corpus_file = _orchid_file(
+        tmp_path, "#3\nและกินข้าว//\nและ/JCRG\nกิน/VACT\nข้าว/NCMN\n//\n"
+    )
+    monkeypatch.setattr(orchid_corpus.orchid_corpus, "filename_orchid", corpus_file)
+
+
+def test_webapp_custom_dict_reload(tmp_path, monkeypatch):
+    import os
+
+    flask = pytest.importorskip("flask")
+    from thai_segmenter_webapp.segmenter import SentenceSegmenter
+
+    _webapp_corpus(tmp_path, monkeypatch)
+    dict_file = tmp_path / "custom.txt"
+    dict_file.write_bytes(b"\xe0\xb9\n")  # caught while being written
+    os.utime(str(dict_file), (1000000000, 1000000000))
+
+    app = flask.Flask("test")
+    app.config.update(CUSTOM_DICT_FILE=str(dict_file), SEGMENTATION_CACHE_BYTES=0)
+    sentseg = SentenceSegmenter(app)
+    assert sentseg.custom_dict_stats()["words"] == 0
+
+    # same modification time, but complete now
+    dict_file.write_text("ไอโฟน\tNCMN\n", encoding="utf-8")
+    os.utime(str(dict_file), (1000000000, 1000000000))
+    assert sentseg.check_custom_dict(force=True)
+    assert sentseg.custom_dict_stats()["words"] == 1
+    assert not sentseg.check_custom_dict(force=True)
+
+    dict_file.write_text("ไอโฟน\tNCMN\nไอแพด\n", encoding="utf-8")
+    os.utime(str(dict_file), (1000000100, 1000000100))
+    assert sentseg.check_custom_dict(force=True)
+    assert sentseg.custom_dict_stats()["words"] == 2
+
+
+def test_webapp_prefork_memory(tmp_path, monkeypatch, caplog):
+    import gc
+    import io
+    import logging
+
+    pytest.importorskip("flask")
+    from thai_segmenter_webapp import prefork
+
+    files = {
+        "/proc/42/smaps_rollup": "00400000-7ffd [rollup]\nRss:  1000 kB\n"
+        "Pss:  400 kB\nShared_Clean:  500 kB\nShared_Dirty:  100 kB\n"
+        "Private_Clean:  50 kB\nPrivate_Dirty:  350 kB\n",
+        "/proc/43/status": "Name:\tpython\nVmRSS:\t  2000 kB\n",
+    }
+
+    def fake_open(filename, mode="r"):
+        if filename not in files:
+            raise IOError(filename)
+        return io.StringIO(files[filename])
+
+    monkeypatch.setattr(prefork, "open", fake_open, raising=False)
+    assert prefork.memory_info(42) == {
+        "rss": 1000,
+        "pss": 400,
+        "shared": 600,
+        "private": 400,
+    }
+    assert prefork.memory_info(43) == {"rss": 2000}  # no smaps_rollup
+    assert prefork.memory_info(44) == dict()
+
+    logger = logging.getLogger("test_prefork")
+    with caplog.at_level(logging.INFO, logger="test_prefork"):
+        prefork.report_worker_memory(logger, [42, 43, 44], model_kb=200)
+    assert [record.getMessage() for record in caplog.records] == [
+        "Worker 42: rss=1000 kB, pss=400 kB, private=400 kB, shared=600 kB "
+        "(saved 200 kB of model memory)",
+        "Worker 43: rss=2000 kB",
+    ]
+    monkeypatch.undo()
+
+    # the model stays usable after freezing (before forking the workers)
+    _webapp_corpus(tmp_path, monkeypatch)
+    from thai_segmenter_webapp.app import create_app
+    from thai_segmenter_webapp.app import sentseg
+
+    create_app()
+    try:
+        prefork.freeze_model()
+    finally:
+        if hasattr(gc, "unfreeze"):
+            gc.unfreeze()
+    paragraph, _, _ = sentseg.do_segmentation("ผมกิน ข้าว")
+    assert [info.word for info in paragraph.pos][:2] == ["ผม", "กิน"]
+
+
+def test_webapp_incremental_segmentation(tmp_path, monkeypatch):
+    pytest.importorskip("flask")
+    _webapp_corpus(tmp_path, monkeypatch)
+    from thai_segmenter_webapp.app import create_app
+    from thai_segmenter_webapp.app import sentseg
+    from thai_segmenter_webapp.segmenter import SentenceSegmenter
+    from thai_segmenter_webapp.segmenter import line_hash
+    from thai_segmenter_webapp.segmenter import segmentation_record
+
+    app = create_app()
+    client = app.test_client()
+
+    lines = ["ผมกิน ข้าว", "", "และกินข้าว", "  ", "ผมกิน ข้าว"]
+    response = client.post("/segment", json={"text": "\n".join(lines)})
+    assert response.status_code == 200
+    data = response.get_json()
+    first, second = line_hash("ผมกิน ข้าว"), line_hash("และกินข้าว")
+    assert data["lines"] == [first, None, second, None, first]
+    assert sorted(data["results"]) == sorted([first, second])
+    record = data["results"][first]
+    assert record == segmentation_record(sentseg.do_segmentation("ผมกิน ข้าว"))
+    assert "".join(record["tokens"]) == record["text"] == "ผมกิน ข้าว"
+
+    # only the new lines are segmented, the kept hashes are passed through
+    state = {"lines": data["lines"], "version": data["version"]}
+    edits = [[1, 2, ["ข้าว"]], [3, 5, []], [5, 5, ["", "กิน"]]]
+    data = client.post("/segment", json=dict(state, edits=edits)).get_json()
+    assert data["lines"] == [
+        first,
+        line_hash("ข้าว"),
+        second,
+        None,
+        line_hash("กิน"),
+    ]
+    assert sorted(data["results"]) == sorted([line_hash("ข้าว"), line_hash("กิน")])
+    assert data["version"] == state["version"]
+
+    for edits in ([[2, 1, []]], [[0, 2, []], [1, 3, []]], [[0, 6, []]], "x", [[0]]):
+        response = client.post("/segment", json=dict(state, edits=edits))
+        assert response.status_code == 400, edits
+    assert client.post("/segment", data="no json").status_code == 400
+
+    # the version depends on the custom words only (same in every worker)
+    other = SentenceSegmenter(app)
+    assert other.version == sentseg.version
+    sentseg.add_custom_word("ไอโฟน")
+    response = client.post("/segment", json=dict(state, edits=[[0, 1, ["กิน"]]]))
+    assert response.status_code == 409
+    assert response.get_json()["version"] == sentseg.version != state["version"]
+    other.add_custom_word("ไอโฟน")
+    assert other.version == sentseg.version
+    sentseg.remove_custom_word("ไอโฟน")
+    assert sentseg.version == state["version"]